@@ -0,0 +1,562 @@
+"""
+bot_app.py - FIXED VERSION
+===========================
+البوت الرئيسي مع الترتيب الصحيح للمعالجة (يُشغَّل عبر main.py)
+
+التحديثات:
+✅ ترتيب on_message محسّن
+✅ الردود التلقائية لها الأولوية
+✅ Error handling محسّن
+✅ Logging مفصل
+✅ حماية تمنع البوت من البقاء في سيرفرات غير مسموح بها
+"""
+
+import os
+import discord
+from discord.ext import commands
+from dotenv import load_dotenv
+import asyncio
+import signal
+import sys
+import json
+import hashlib
+
+# تحميل المتغيرات
+load_dotenv()
+TOKEN = os.getenv('DISCORD_TOKEN')
+GUILD_ID = os.getenv('GUILD_ID')
+
+# التحقق من التوكن
+if not TOKEN:
+    print('❌ خطأ: ضع DISCORD_TOKEN في ملف .env')
+    sys.exit(1)
+
+# الـ Intents
+intents = discord.Intents.default()
+intents.members = True
+intents.message_content = True
+intents.presences = False
+
+# البوت
+bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
+
+# ==================== الاستيرادات ====================
+
+from logger import bot_logger
+
+from database import db
+from config_manager import config
+
+from system_tickets import ticket_system, TicketControlView, TicketPanelView
+from system_autoresponse import autoresponse_system
+from system_leveling import leveling_system
+from system_warnings import warning_system
+from system_protection import protection_system
+
+from system_polls import poll_system
+from system_invites import invite_tracker
+from system_analytics import analytics_system
+from system_warmup import warm_up
+from system_voice_activity import voice_activity
+from system_charts import chart_renderer
+from system_census import member_census
+from system_log_archive import log_archiver
+from system_backup import backup_manager
+from expiring_map import start_sweeper
+
+from event_welcome import handle_member_join, handle_member_remove
+from event_logs import log_message_delete, log_message_edit, log_member_join, log_member_remove
+from event_messages import process_message
+from event_voice import handle_voice_state_update
+from cmd_aliases import process_aliases, setup_alias_commands
+from cmd_debug import setup_debug_commands
+
+from cmd_moderation import setup_moderation_commands
+from cmd_config import setup_config_commands
+from cmd_utility import setup_utility_commands
+from cmd_fun import setup_fun_commands
+from cmd_info import setup_info_commands
+
+from cmd_autoresponse import setup_autoresponse_commands
+from cmd_polls import setup_poll_commands
+from cmd_invites import setup_invite_commands
+from cmd_analytics import setup_analytics_commands
+
+# ==================== Normalize GUILD_ID و إعدادات الأمان ====================
+# حول GUILD_ID إلى int لو موجود، وإلا خليه None
+if GUILD_ID:
+    try:
+        GUILD_ID = int(GUILD_ID)
+        bot_logger.info(f'🔐 GUILD_ID مفعل: {GUILD_ID}')
+    except Exception as e:
+        # لو bot_logger غير جاهز لأي سبب، نطبع تحذير بسيط
+        try:
+            bot_logger.warning(f'⚠️ قيمة GUILD_ID غير صالحة، تم تجاهلها: {GUILD_ID} ({e})')
+        except Exception:
+            print(f'⚠️ قيمة GUILD_ID غير صالحة، تم تجاهلها: {GUILD_ID} ({e})')
+        GUILD_ID = None
+else:
+    bot_logger.info('⚠️ GUILD_ID غير معرّف — البوت لن يقيّد الأوامر تلقائياً')
+
+# فحص عام يمنع تنفيذ أوامر البريفكس خارج الـ GUILD المسموح (لحماية إضافية)
+@bot.check
+async def global_guild_check(ctx):
+    # حظر الأوامر في الخاص
+    if ctx.guild is None:
+        return False
+    # لو محدد GUILD_ID => اسمح فقط به
+    if GUILD_ID and ctx.guild.id != GUILD_ID:
+        return False
+    return True
+
+# ==================== Global State ====================
+
+commands_registered = False
+shutdown_initiated = False
+
+# ==================== مزامنة الأوامر ====================
+
+# --force-sync (أو FORCE_SYNC=1) يتجاوز فحص البصمة ويفرض أول مزامنة فقط
+FORCE_SYNC = '--force-sync' in sys.argv or os.getenv('FORCE_SYNC') == '1'
+TREE_HASH_FILE = os.getenv('TREE_HASH_FILE', '.command_tree_hash.json')
+
+
+def command_tree_fingerprint(guild=None) -> str:
+    """بصمة ثابتة لشجرة الأوامر (الأسماء، الخيارات، الأوصاف، الصلاحيات)"""
+    payload = []
+    for command in bot.tree.get_commands(guild=guild):
+        try:
+            data = command.to_dict(bot.tree)
+        except TypeError:
+            # إصدارات discord.py الأقدم لا تأخذ tree
+            data = command.to_dict()
+        payload.append(data)
+    payload.sort(key=lambda d: (d.get('type', 1), d.get('name', '')))
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _load_tree_hashes() -> dict:
+    try:
+        with open(TREE_HASH_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_tree_hash(scope: str, fingerprint: str):
+    hashes = _load_tree_hashes()
+    hashes[scope] = fingerprint
+    try:
+        with open(TREE_HASH_FILE, 'w', encoding='utf-8') as f:
+            json.dump(hashes, f)
+    except OSError as e:
+        bot_logger.warning(f'⚠️ تعذر حفظ بصمة الأوامر: {e}')
+
+
+async def sync_command_tree():
+    """مزامنة الأوامر فقط إذا تغيرت البصمة منذ آخر مزامنة ناجحة"""
+    global FORCE_SYNC
+
+    if GUILD_ID:
+        guild = discord.Object(id=int(GUILD_ID))
+        bot.tree.copy_global_to(guild=guild)
+        scope = f'guild:{GUILD_ID}'
+    else:
+        guild = None
+        scope = 'global'
+
+    fingerprint = command_tree_fingerprint(guild)
+    if not FORCE_SYNC and _load_tree_hashes().get(scope) == fingerprint:
+        bot_logger.info(f'⏭️ شجرة الأوامر لم تتغير ({scope}) — تخطي المزامنة')
+        return
+
+    synced = await bot.tree.sync(guild=guild)
+    _save_tree_hash(scope, fingerprint)
+    # الفرض لمرة واحدة: إعادة الاتصال (on_ready مجدداً) تعود لفحص البصمة
+    FORCE_SYNC = False
+    if guild:
+        bot_logger.success(f'✅ تم مزامنة {len(synced)} أمر على Guild: {GUILD_ID}')
+    else:
+        bot_logger.success(f'✅ تم مزامنة {len(synced)} أمر عالمياً')
+
+# ==================== الأحداث الأساسية ====================
+
+@bot.event
+async def on_ready():
+    global commands_registered
+
+    try:
+        bot_logger.info('='*50)
+        bot_logger.info(f'البوت متصل: {bot.user.name} (ID: {bot.user.id})')
+        bot_logger.info(f'Discord.py Version: {discord.__version__}')
+        bot_logger.info(f'Python Version: {sys.version}')
+        bot_logger.info('='*50)
+
+        # الاتصال بقاعدة البيانات
+        await db.connect()
+
+        # === حماية: اخرج من أي Guild غير مسموح به فورًا ===
+        if GUILD_ID:
+            for g in list(bot.guilds):
+                if g.id != GUILD_ID:
+                    try:
+                        await g.leave()
+                        bot_logger.warning(f'غادرت {g.name} ({g.id}) لأنه غير مصرح به (GUILD_ID مُفعل)')
+                    except Exception as e:
+                        bot_logger.exception(f'فشل الخروج من {g.name}: {e}')
+
+        # تسجيل الأوامر
+        if not commands_registered:
+            bot_logger.info('بدء تسجيل الأوامر...')
+
+            setup_moderation_commands(bot)
+            bot_logger.success('✅ تم تسجيل أوامر الإدارة')
+            
+            setup_config_commands(bot)
+            bot_logger.success('✅ تم تسجيل أوامر الإعدادات')
+            
+            setup_utility_commands(bot)
+            bot_logger.success('✅ تم تسجيل أوامر المنفعة')
+            
+            setup_fun_commands(bot)
+            bot_logger.success('✅ تم تسجيل أوامر المرح')
+            
+            setup_info_commands(bot)
+            bot_logger.success('✅ تم تسجيل أوامر المعلومات')
+            
+            setup_autoresponse_commands(bot)
+            bot_logger.success('✅ تم تسجيل أوامر الردود التلقائية')
+            
+            setup_poll_commands(bot)
+            bot_logger.success('✅ تم تسجيل أوامر الاستطلاعات')
+            
+            setup_invite_commands(bot)
+            bot_logger.success('✅ تم تسجيل أوامر الدعوات')
+            
+            setup_analytics_commands(bot)
+            bot_logger.success('✅ تم تسجيل أوامر الإحصائيات')
+
+            setup_alias_commands(bot)
+            bot_logger.success('✅ تم تسجيل أوامر الاختصارات')
+
+            setup_debug_commands(bot)
+            bot_logger.success('✅ تم تسجيل أوامر التشخيص')
+
+            commands_registered = True
+
+        # بدء الأنظمة
+        poll_system.start(bot)
+        bot_logger.success('✅ نظام الاستطلاعات جاهز')
+
+        leveling_system.start_voice_accrual(bot)
+        voice_activity.start(bot)
+        bot_logger.success('✅ احتساب الصوت الدوري جاهز')
+
+        await analytics_system.init()
+        bot_logger.success('✅ نظام التحليلات جاهز')
+
+        log_archiver.start()
+        backup_manager.start()
+
+        # تنظيف الكاشات المنتهية دورياً
+        start_sweeper()
+
+        # تهيئة الكاش (تحميل مجمّع من DB + تخزين الدعوات بالتوازي)
+        timings = await warm_up(bot)
+        bot_logger.success(
+            '✅ تمت التهيئة: ' + ' | '.join(f'{name} {ms:.0f}ms' for name, ms in timings.items())
+        )
+
+        # Views الدائمة
+        bot.add_view(TicketControlView())
+        bot.add_view(TicketPanelView())
+        bot_logger.success('✅ تم إضافة Views الدائمة')
+
+        # Sync الأوامر (فقط عند تغير الشجرة)
+        await sync_command_tree()
+
+        # تحديث الحالة
+        await bot.change_presence(
+            activity=discord.Activity(
+                type=discord.ActivityType.watching,
+                name=f'{len(bot.guilds)} سيرفر | /help'
+            )
+        )
+
+        # رسالة النجاح
+        bot_logger.info('='*50)
+        bot_logger.success(f'✅ البوت جاهز: {bot.user.name}')
+        bot_logger.success(f'✅ السيرفرات: {len(bot.guilds)}')
+        bot_logger.success(f'✅ الأعضاء: {sum(g.member_count for g in bot.guilds)}')
+        bot_logger.info('='*50)
+        bot_logger.success('🚀 البوت يعمل الآن!')
+        bot_logger.info('='*50)
+
+    except Exception as e:
+        bot_logger.exception('💥 خطأ حرج في on_ready', e)
+        raise
+
+# ==================== حماية عند الانضمام لسيرفر جديد ====================
+
+@bot.event
+async def on_guild_join(guild):
+    """
+    إذا أضيف البوت لأي Guild غير مسموح به → اخرج فورًا.
+    هذا يضمن أنه حتى لو حصل رابط دعوة أو صار Bug في Dev Portal،
+    البوت ما يظل في سيرفرات ثالثة.
+    """
+    if GUILD_ID and guild.id != GUILD_ID:
+        bot_logger.warning(f'محاولة إضافة البوت إلى {guild.name} ({guild.id}) — سأخرج الآن')
+        try:
+            await guild.leave()
+        except Exception as e:
+            bot_logger.exception(f'فشل الخروج من {guild.name}: {e}')
+        return
+
+    member_census.build(guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    """عند خروج البوت من سيرفر"""
+    member_census.remove_guild(guild.id)
+
+# ==================== أحداث الأعضاء ====================
+
+@bot.event
+async def on_member_join(member):
+    """عند انضمام عضو"""
+    try:
+        member_census.handle_member_join(member)
+        await handle_member_join(member)
+    except Exception as e:
+        bot_logger.exception(f'خطأ في on_member_join: {member.name}', e)
+
+@bot.event
+async def on_member_remove(member):
+    """عند مغادرة عضو"""
+    try:
+        member_census.handle_member_remove(member)
+        await handle_member_remove(member)
+    except Exception as e:
+        bot_logger.exception(f'خطأ في on_member_remove: {member.name}', e)
+
+# ==================== معالجة الرسائل (الأهم!) ====================
+
+@bot.event
+async def on_message(message):
+    """
+    معالجة الرسائل - الترتيب مهم جداً!
+    
+    الترتيب الجديد:
+    1. ✅ معالجة الرسالة (تشمل الردود التلقائية)
+    2. الاختصارات العربية
+    3. أوامر البوت
+    """
+    try:
+        # تجاهل الرسائل الخاصة
+        if not message.guild:
+            return
+        
+        # ✅ 1. معالجة الرسالة (الردود التلقائية + الحماية + المستويات)
+        await process_message(message)
+        
+        # ✅ 2. الاختصارات العربية
+        await process_aliases(bot, message)
+        
+        # ✅ 3. أوامر البوت العادية
+        await bot.process_commands(message)
+    
+    except Exception as e:
+        bot_logger.exception(
+            f'خطأ في on_message: {message.author.name if message else "Unknown"}',
+            e
+        )
+
+# ==================== أحداث السجلات ====================
+
+@bot.event
+async def on_message_delete(message):
+    """عند حذف رسالة"""
+    try:
+        await log_message_delete(message)
+    except Exception as e:
+        bot_logger.error(f'خطأ في on_message_delete: {e}')
+
+@bot.event
+async def on_message_edit(before, after):
+    """عند تعديل رسالة"""
+    try:
+        await log_message_edit(before, after)
+    except Exception as e:
+        bot_logger.error(f'خطأ في on_message_edit: {e}')
+
+@bot.event
+async def on_voice_state_update(member, before, after):
+    """عند تحديث حالة صوتية"""
+    try:
+        await handle_voice_state_update(member, before, after)
+    except Exception as e:
+        bot_logger.error(f'خطأ في on_voice_state_update: {e}')
+
+@bot.event
+async def on_member_update(before, after):
+    """عند تحديث عضو - تحديث كاش الأدوار لمضاعفات XP وإحصاء الأعضاء"""
+    try:
+        leveling_system.handle_member_update(before, after)
+        member_census.handle_member_update(before, after)
+    except Exception as e:
+        bot_logger.error(f'خطأ في on_member_update: {e}')
+
+@bot.event
+async def on_presence_update(before, after):
+    """عند تغيّر حالة عضو (يتطلب intents.presences)"""
+    try:
+        member_census.handle_presence_update(before, after)
+    except Exception as e:
+        bot_logger.error(f'خطأ في on_presence_update: {e}')
+
+@bot.event
+async def on_guild_role_delete(role):
+    """عند حذف دور"""
+    member_census.handle_role_delete(role)
+
+@bot.event
+async def on_guild_channel_create(channel):
+    """عند إنشاء قناة"""
+    member_census.handle_channel_change(channel)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    """عند حذف قناة"""
+    member_census.handle_channel_change(channel)
+
+@bot.event
+async def on_app_command_completion(interaction, command):
+    """تسجيل استخدام الأوامر في التحليلات (إضافة للطابور فقط)"""
+    analytics_system.record_event_nowait(
+        str(interaction.guild_id) if interaction.guild_id else None,
+        str(interaction.user.id),
+        f'command:{command.qualified_name}'
+    )
+
+# ==================== أحداث الدعوات ====================
+
+@bot.event
+async def on_invite_create(invite):
+    """عند إنشاء دعوة - تحديث الكاش بدون طلب API"""
+    try:
+        invite_tracker.handle_invite_create(invite)
+    except Exception as e:
+        bot_logger.error(f'خطأ في on_invite_create: {e}')
+
+@bot.event
+async def on_invite_delete(invite):
+    """عند حذف دعوة - تحديث الكاش بدون طلب API"""
+    try:
+        invite_tracker.handle_invite_delete(invite)
+    except Exception as e:
+        bot_logger.error(f'خطأ في on_invite_delete: {e}')
+
+# ==================== معالجة الأخطاء ====================
+
+@bot.event
+async def on_command_error(ctx, error):
+    """معالجة أخطاء الأوامر"""
+    if isinstance(error, commands.CommandNotFound):
+        return  # تجاهل الأوامر غير الموجودة
+    
+    bot_logger.error(f'خطأ في أمر {ctx.command}: {error}')
+
+@bot.event
+async def on_error(event, *args, **kwargs):
+    """معالجة الأخطاء العامة"""
+    bot_logger.exception(f'خطأ في حدث {event}', sys.exc_info()[1])
+
+# ==================== Shutdown ====================
+
+async def shutdown(bot):
+    """إيقاف آمن للبوت"""
+    global shutdown_initiated
+    if shutdown_initiated:
+        return
+    shutdown_initiated = True
+    
+    bot_logger.info('⏸️ بدء إيقاف البوت...')
+    
+    try:
+        # احتساب وقت الصوت المستحق قبل إغلاق DB
+        await leveling_system.flush_voice()
+        await voice_activity.rollup(partial=True)
+    except Exception as e:
+        bot_logger.error(f'خطأ في احتساب الصوت عند الإيقاف: {e}')
+    
+    chart_renderer.shutdown()
+    
+    try:
+        # كتابة أحداث التحليلات المعلقة
+        await analytics_system.close()
+    except Exception as e:
+        bot_logger.error(f'خطأ في إغلاق التحليلات: {e}')
+    
+    try:
+        await db.close()
+        bot_logger.success('✅ تم إغلاق قاعدة البيانات')
+    except:
+        pass
+    
+    try:
+        await bot.close()
+        bot_logger.success('✅ تم إغلاق اتصال البوت')
+    except:
+        pass
+    
+    bot_logger.info('👋 تم إيقاف البوت بنجاح')
+
+def handle_signal(sig):
+    """معالجة إشارات الإيقاف"""
+    asyncio.create_task(shutdown(bot))
+
+# ==================== التشغيل ====================
+
+async def main():
+    """الدالة الرئيسية"""
+    try:
+        # إضافة معالجات الإشارات (Linux/Mac فقط)
+        if sys.platform != 'win32':
+            loop = asyncio.get_event_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, lambda s=sig: handle_signal(s))
+        
+        async with bot:
+            await bot.start(TOKEN)
+    
+    except Exception as e:
+        bot_logger.exception('💥 خطأ حرج في main', e)
+        await shutdown(bot)
+        raise
+
+def run():
+    """تشغيل البوت (من main.py)"""
+    try:
+        bot_logger.info('='*50)
+        bot_logger.info('🚀 بدء تشغيل البوت...')
+        bot_logger.info('='*50)
+        
+        # Keep-alive (Replit فقط)
+        try:
+            from keep_alive import keep_alive
+            keep_alive()
+            bot_logger.info('✅ Keep-alive مفعل')
+        except ImportError:
+            bot_logger.debug('Keep-alive غير متوفر (طبيعي)')
+        
+        # تشغيل البوت
+        asyncio.run(main())
+    
+    except KeyboardInterrupt:
+        bot_logger.info('⌨️ تم إيقاف البوت بـ Ctrl+C')
+    
+    except Exception:
+        bot_logger.critical('💥 فشل تشغيل البوت', exc_info=True)
+        sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""
+charts.py - رسم المخططات (PNG)
+===============================
+دوال رسم تعمل داخل عمليات ProcessPoolExecutor (system_charts)
+
+✅ matplotlib يُستورد عند أول رسم داخل العملية فقط (التشغيل لا يدفع ثمنه)
+✅ بدون استيراد discord أو قاعدة البيانات (العملية العاملة خفيفة)
+✅ النصوص داخل الصور بالإنجليزية (matplotlib لا يشكّل الحروف العربية)
+"""
+
+import io
+from typing import Dict, List
+
+_pyplot = None
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def _plt():
+    """استيراد matplotlib (مرة واحدة لكل عملية) بواجهة Agg بدون شاشة"""
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        _pyplot = plt
+    return _pyplot
+
+
+def render_analytics(stats: List[Dict], heatmap: List[List[float]]) -> bytes:
+    """
+    لوحة /analytics: الرسائل، الانضمامات/المغادرات، الدقائق الصوتية، وخريطة حرارية للساعات
+
+    Args:
+        stats: صفوف stats اليومية (date, messages, joins, leaves, voice_minutes) بالترتيب
+        heatmap: 7 × 24 (يوم الأسبوع × ساعة) ساعات تواجد صوتي
+
+    Returns:
+        bytes: صورة PNG
+    """
+    plt = _plt()
+
+    dates = [s.get('date', '')[-5:] for s in stats]
+    x = list(range(len(dates)))
+    step = max(1, len(dates) // 10)
+
+    fig, axes = plt.subplots(2, 2, figsize=(12, 7), dpi=100)
+    try:
+        ax = axes[0][0]
+        ax.bar(x, [s.get('messages', 0) for s in stats], color='#5865F2')
+        ax.set_title('Messages / day')
+
+        ax = axes[0][1]
+        ax.bar(x, [s.get('joins', 0) for s in stats], color='#57F287', label='Joins')
+        ax.bar(x, [-s.get('leaves', 0) for s in stats], color='#ED4245', label='Leaves')
+        ax.axhline(0, color='#99AAB5', linewidth=0.8)
+        ax.set_title('Joins / leaves')
+        ax.legend(loc='upper left', fontsize=8)
+
+        ax = axes[1][0]
+        voice = [s.get('voice_minutes', 0) for s in stats]
+        ax.plot(x, voice, color='#FEE75C', marker='o', markersize=3)
+        ax.fill_between(x, voice, color='#FEE75C', alpha=0.3)
+        ax.set_title('Voice minutes / day')
+
+        for ax in (axes[0][0], axes[0][1], axes[1][0]):
+            ax.set_xticks(x[::step])
+            ax.set_xticklabels(dates[::step], rotation=45, fontsize=8)
+            ax.grid(axis='y', alpha=0.3)
+
+        ax = axes[1][1]
+        image = ax.imshow(heatmap, aspect='auto', cmap='viridis')
+        ax.set_title('Voice occupant-hours by hour of day')
+        ax.set_yticks(range(7))
+        ax.set_yticklabels(WEEKDAYS, fontsize=8)
+        ax.set_xticks(range(0, 24, 3))
+        ax.set_xticklabels([f'{h:02d}' for h in range(0, 24, 3)], fontsize=8)
+        fig.colorbar(image, ax=ax)
+
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png')
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
@@ -1,9 +1,20 @@
-"""نظام الاختصارات العربي الكامل"""
+"""
+نظام الاختصارات العربي الكامل
+
+الاختصارات المدمجة + اختصارات مخصصة لكل سيرفر (SQLite) تُجمع في جدول توجيه
+مُجمّع: الكلمة الأولى ← (أمر بسيط, أنماط مُجمّعة تبدأ بهذه الكلمة).
+أغلب الرسائل ليست أوامر، فرفضها يكلف بحث dict واحد.
+"""
 import discord
+from discord import app_commands
 from discord.ext import commands
 import re
 from typing import Optional, Dict, List, Tuple
 
+from database import db
+import permissions, embeds
+from logger import bot_logger
+
 # قاموس الاختصارات العربية
 ALIASES = {
     # أوامر الإدارة
@@ -106,44 +117,97 @@ PATTERNS = [
     (r'^(نرد|رمي)(?:\s+(\d+))?$', 'roll'),
 ]
 
+# أقصى طول لاختصار مخصص وأقصى عدد لكل سيرفر
+MAX_ALIAS_LENGTH = 32
+MAX_CUSTOM_ALIASES = 100
+
+# مُدخل جدول التوجيه: (أمر الاختصار البسيط أو None, ((نمط مُجمّع, أمر), ...))
+DispatchEntry = Tuple[Optional[str], Tuple[Tuple[re.Pattern, str], ...]]
+
+_TRIGGERS_RE = re.compile(r'^\^\(([^()]+)\)')
+
+
+def _pattern_triggers(pattern: str) -> List[str]:
+    """الكلمات التي يبدأ بها النمط (مجموعة البداية ^(a|b|c))"""
+    match = _TRIGGERS_RE.match(pattern)
+    if not match:
+        raise ValueError(f'النمط لا يبدأ بمجموعة كلمات: {pattern}')
+    return [word.lower() for word in match.group(1).split('|')]
+
+
+def build_dispatch_table(custom: Optional[Dict[str, str]] = None) -> Dict[str, DispatchEntry]:
+    """
+    بناء جدول التوجيه من ALIASES و PATTERNS (+ اختصارات السيرفر)
+
+    الاختصار المخصص يتجاوز المدمج لنفس الكلمة (بما في ذلك أنماطه).
+    """
+    table: Dict[str, DispatchEntry] = {word.lower(): (command, ()) for word, command in ALIASES.items()}
+
+    for pattern, command in PATTERNS:
+        compiled = re.compile(pattern, re.IGNORECASE)
+        for trigger in _pattern_triggers(pattern):
+            simple, patterns = table.get(trigger, (None, ()))
+            table[trigger] = (simple, patterns + ((compiled, command),))
+
+    for alias, command in (custom or {}).items():
+        table[alias] = (command, ())
+
+    return table
+
+
 class AliasProcessor:
     """معالج الاختصارات"""
 
     def __init__(self):
-        self.cache = {}  # تخزين مؤقت للمطابقات
+        self.base_table = build_dispatch_table()
+        self.cache: Dict[str, Dict[str, DispatchEntry]] = {}  # {guild_id: جدول التوجيه}
+        self.custom: Dict[str, Dict[str, str]] = {}  # {guild_id: {alias: command}}
+
+    def set_custom_aliases(self, guild_id: str, aliases: Dict[str, str]):
+        """تعيين اختصارات السيرفر وإعادة بناء جدوله (السيرفرات بدونها تتشارك الجدول المدمج)"""
+        self.custom[guild_id] = aliases
+        self.cache[guild_id] = build_dispatch_table(aliases) if aliases else self.base_table
+
+    async def load_guild(self, guild_id: str) -> Dict[str, DispatchEntry]:
+        """تحميل اختصارات السيرفر من قاعدة البيانات"""
+        rows = await db.get_custom_aliases(guild_id)
+        self.set_custom_aliases(guild_id, {row['alias']: row['command'] for row in rows})
+        return self.cache[guild_id]
 
     def parse_mention(self, text: str) -> Optional[str]:
         """استخراج معرف المستخدم من المنشن"""
         match = re.match(r'<@!?(\d+)>', text)
         return match.group(1) if match else None
 
-    def find_command(self, message_content: str) -> Optional[Tuple[str, List[str]]]:
+    def find_command(self, message_content: str, guild_id: Optional[str] = None) -> Optional[Tuple[str, List[str]]]:
         """
         البحث عن الأمر المطابق
 
         Returns:
             tuple: (اسم الأمر, المعاملات) أو None
         """
-        content = message_content.strip()
-
-        # محاولة المطابقة بالأنماط المتقدمة أولاً
-        for pattern, command in PATTERNS:
-            match = re.match(pattern, content, re.IGNORECASE)
-            if match:
-                groups = match.groups()
-                return command, list(groups[1:])  # تجاهل المجموعة الأولى (الأمر نفسه)
+        table = self.cache.get(guild_id, self.base_table) if guild_id else self.base_table
 
-        # محاولة المطابقة البسيطة
-        words = content.split()
+        words = message_content.split()
         if not words:
             return None
 
-        first_word = words[0].lower()
+        entry = table.get(words[0].lower())
+        if entry is None:
+            return None
 
-        if first_word in ALIASES:
-            command = ALIASES[first_word]
-            args = words[1:]
-            return command, args
+        simple, patterns = entry
+        content = message_content.strip()
+
+        # الأنماط المتقدمة التي تبدأ بهذه الكلمة فقط
+        for pattern, command in patterns:
+            match = pattern.match(content)
+            if match:
+                return command, list(match.groups()[1:])  # تجاهل المجموعة الأولى (الأمر نفسه)
+
+        # المطابقة البسيطة
+        if simple:
+            return simple, words[1:]
 
         return None
 
@@ -311,7 +375,7 @@ async def process_aliases(bot: commands.Bot, message: discord.Message):
     """
     معالجة الاختصارات في الرسائل
 
-    هذه الدالة يتم استدعاؤها من main.py في on_message
+    هذه الدالة يتم استدعاؤها من bot_app.py في on_message
     """
     # تجاهل البوتات
     if message.author.bot:
@@ -325,8 +389,12 @@ async def process_aliases(bot: commands.Bot, message: discord.Message):
     if message.content.startswith('/'):
         return
 
+    guild_id = str(message.guild.id)
+    if guild_id not in alias_processor.cache:
+        await alias_processor.load_guild(guild_id)
+
     # البحث عن أمر مطابق
-    result = alias_processor.find_command(message.content)
+    result = alias_processor.find_command(message.content, guild_id)
 
     if not result:
         return
@@ -336,14 +404,50 @@ async def process_aliases(bot: commands.Bot, message: discord.Message):
     # تنفيذ الأمر
     await alias_processor.execute_alias(bot, message, command, args)
 
-async def add_custom_alias(guild_id: str, arabic: str, english: str):
-    """إضافة اختصار مخصص (للمستقبل)"""
-    # يمكن حفظها في قاعدة البيانات لاحقاً
-    ALIASES[arabic.lower()] = english.lower()
+def validate_alias(alias: str, command: str, bot: Optional[commands.Bot] = None) -> Optional[str]:
+    """
+    التحقق من اختصار مخصص
 
-def get_all_aliases() -> Dict[str, str]:
-    """الحصول على جميع الاختصارات"""
-    return ALIASES.copy()
+    Returns:
+        رسالة الخطأ أو None إن كان صالحاً
+    """
+    if not alias or len(alias) > MAX_ALIAS_LENGTH or any(c.isspace() for c in alias):
+        return f'الاختصار يجب أن يكون كلمة واحدة بطول {MAX_ALIAS_LENGTH} حرف كحد أقصى'
+    if alias.startswith('/'):
+        return 'الاختصار لا يمكن أن يبدأ بـ /'
+
+    known = set(ALIASES.values())
+    if bot is not None:
+        known.update(cmd.name for cmd in bot.tree.get_commands())
+    if command not in known:
+        return f'الأمر `/{command}` غير موجود'
+    return None
+
+async def add_custom_alias(guild_id: str, arabic: str, english: str, created_by: Optional[str] = None) -> bool:
+    """إضافة اختصار مخصص للسيرفر (يُعاد بناء جدول التوجيه)"""
+    alias, command = arabic.lower(), english.lower().lstrip('/')
+    try:
+        if not await db.add_custom_alias(guild_id, alias, command, created_by):
+            return False
+        await alias_processor.load_guild(guild_id)
+        return True
+    except Exception as e:
+        bot_logger.error(f'خطأ في add_custom_alias: {e}')
+        return False
+
+async def remove_custom_alias(guild_id: str, arabic: str) -> bool:
+    """حذف اختصار مخصص (يُعاد بناء جدول التوجيه)"""
+    removed = await db.remove_custom_alias(guild_id, arabic.lower())
+    if removed:
+        await alias_processor.load_guild(guild_id)
+    return removed
+
+def get_all_aliases(guild_id: Optional[str] = None) -> Dict[str, str]:
+    """الحصول على جميع الاختصارات (المدمجة + اختصارات السيرفر)"""
+    aliases = ALIASES.copy()
+    if guild_id:
+        aliases.update(alias_processor.custom.get(guild_id, {}))
+    return aliases
 
 def format_aliases_help() -> str:
     """تنسيق مساعدة الاختصارات"""
@@ -367,4 +471,77 @@ def format_aliases_help() -> str:
     lines.append('• `رتبتي`')
     lines.append('• `نرد`')
 
-    return '\n'.join(lines)
\ No newline at end of file
+    return '\n'.join(lines)
+
+def setup_alias_commands(bot: commands.Bot):
+    """تسجيل أوامر الاختصارات المخصصة"""
+
+    alias_group = app_commands.Group(
+        name='alias',
+        description='إدارة الاختصارات المخصصة للسيرفر'
+    )
+
+    @alias_group.command(name='add', description='إضافة اختصار مخصص لأمر')
+    @app_commands.describe(
+        alias='الكلمة المختصرة (مثال: ط)',
+        command='اسم الأمر (مثال: kick)'
+    )
+    @permissions.is_admin()
+    async def alias_add(interaction: discord.Interaction, alias: str, command: str):
+        """إضافة اختصار"""
+        guild_id = str(interaction.guild.id)
+        alias, command = alias.strip().lower(), command.strip().lower().lstrip('/')
+
+        error = validate_alias(alias, command, bot)
+        if error:
+            await interaction.response.send_message(embed=embeds.error_embed('اختصار غير صالح', error), ephemeral=True)
+            return
+
+        if guild_id not in alias_processor.custom:
+            await alias_processor.load_guild(guild_id)
+        custom = alias_processor.custom[guild_id]
+        if alias not in custom and len(custom) >= MAX_CUSTOM_ALIASES:
+            await interaction.response.send_message(
+                embed=embeds.error_embed('الحد الأقصى', f'لا يمكن إضافة أكثر من {MAX_CUSTOM_ALIASES} اختصار'),
+                ephemeral=True
+            )
+            return
+
+        if await add_custom_alias(guild_id, alias, command, str(interaction.user.id)):
+            await interaction.response.send_message(
+                embed=embeds.success_embed('تمت الإضافة', f'`{alias}` → `/{command}`')
+            )
+        else:
+            await interaction.response.send_message(embed=embeds.error_embed('خطأ', 'فشل حفظ الاختصار'), ephemeral=True)
+
+    @alias_group.command(name='remove', description='حذف اختصار مخصص')
+    @app_commands.describe(alias='الكلمة المختصرة')
+    @permissions.is_admin()
+    async def alias_remove(interaction: discord.Interaction, alias: str):
+        """حذف اختصار"""
+        if await remove_custom_alias(str(interaction.guild.id), alias.strip()):
+            await interaction.response.send_message(embed=embeds.success_embed('تم الحذف', f'تم حذف `{alias}`'))
+        else:
+            await interaction.response.send_message(
+                embed=embeds.error_embed('غير موجود', f'لا يوجد اختصار مخصص باسم `{alias}`'),
+                ephemeral=True
+            )
+
+    @alias_group.command(name='list', description='عرض الاختصارات المخصصة')
+    async def alias_list(interaction: discord.Interaction):
+        """عرض الاختصارات"""
+        guild_id = str(interaction.guild.id)
+        if guild_id not in alias_processor.custom:
+            await alias_processor.load_guild(guild_id)
+        custom = alias_processor.custom[guild_id]
+
+        if not custom:
+            description = 'لا توجد اختصارات مخصصة. استخدم `/alias add` للإضافة.'
+        else:
+            description = '\n'.join(f'• `{a}` → `/{c}`' for a, c in sorted(custom.items()))
+        await interaction.response.send_message(
+            embed=embeds.info_embed(f'📝 الاختصارات المخصصة ({len(custom)})', description[:4000]),
+            ephemeral=True
+        )
+
+    bot.tree.add_command(alias_group)
@@ -4,14 +4,22 @@ cmd_analytics.py - Simple Analytics
 إحصائيات بسيطة للسيرفر
 """
 
+import io
+import os
 import discord
 from discord import app_commands
 from discord.ext import commands
 from database import db
 from system_leveling import leveling_system
-import permissions, embeds
+from system_tickets import ticket_system
+from system_voice_activity import voice_activity
+from system_charts import chart_renderer
+from system_census import member_census
+from system_export import export_table
+import permissions, embeds, helpers
 from logger import bot_logger
 from datetime import datetime, timedelta
+from typing import Optional
 
 
 def setup_analytics_commands(bot: commands.Bot):
@@ -63,10 +71,11 @@ def setup_analytics_commands(bot: commands.Bot):
             )
             
             # الأعضاء
+            census = member_census.get(guild)
             total_members = guild.member_count
-            humans = sum(1 for m in guild.members if not m.bot)
-            bots = sum(1 for m in guild.members if m.bot)
-            online = sum(1 for m in guild.members if m.status != discord.Status.offline)
+            humans = census.humans
+            bots = census.bots
+            online = census.online
             
             embed.add_field(
                 name='👥 الأعضاء',
@@ -80,8 +89,8 @@ def setup_analytics_commands(bot: commands.Bot):
             )
             
             # القنوات
-            text_channels = len(guild.text_channels)
-            voice_channels = len(guild.voice_channels)
+            text_channels = census.text_channels
+            voice_channels = census.voice_channels
             
             embed.add_field(
                 name='📁 القنوات',
@@ -148,8 +157,11 @@ def setup_analytics_commands(bot: commands.Bot):
                     inline=True
                 )
             
-            # الرسم البياني (بسيط)
-            if len(stats) >= 3:
+            # الرسم البياني: صورة PNG (في عمليات منفصلة) أو نصي إن لم يتوفر matplotlib
+            chart = await chart_renderer.analytics_chart(guild_id, days, stats) if len(stats) >= 2 else None
+            if chart:
+                embed.set_image(url='attachment://analytics.png')
+            elif len(stats) >= 3:
                 # آخر 7 أيام
                 recent_stats = stats[-7:] if len(stats) >= 7 else stats
                 
@@ -182,7 +194,10 @@ def setup_analytics_commands(bot: commands.Bot):
             if guild.icon:
                 embed.set_thumbnail(url=guild.icon.url)
             
-            await interaction.followup.send(embed=embed)
+            if chart:
+                await interaction.followup.send(embed=embed, file=discord.File(io.BytesIO(chart), filename='analytics.png'))
+            else:
+                await interaction.followup.send(embed=embed)
         
         except Exception as e:
             bot_logger.exception('خطأ في analytics', e)
@@ -248,4 +263,200 @@ def setup_analytics_commands(bot: commands.Bot):
                 ephemeral=True
             )
     
+    @bot.tree.command(name='ticketstats', description='إحصائيات SLA للتكتات')
+    @app_commands.describe(staff='عضو الطاقم (اختياري)', days='عدد الأيام للاتجاه (افتراضي: 7)')
+    @permissions.is_moderator()
+    async def ticket_stats(interaction: discord.Interaction, staff: Optional[discord.Member] = None, days: int = 7):
+        """لوحة SLA للتكتات (من المجاميع المحدّثة تدريجياً)"""
+        try:
+            days = max(1, min(days, 90))
+            guild_id = str(interaction.guild.id)
+
+            dashboard = await ticket_system.get_sla_dashboard(
+                guild_id,
+                staff_id=str(staff.id) if staff else None,
+                days=days
+            )
+            summary = dashboard['summary']
+
+            embed = discord.Embed(
+                title='🎫 إحصائيات التكتات' + (f' - {staff.display_name}' if staff else ''),
+                color=discord.Color.blue(),
+                timestamp=datetime.now()
+            )
+
+            embed.add_field(
+                name='📋 التكتات',
+                value=(
+                    f'**الإجمالي:** {summary["total"]}\n'
+                    f'🟢 **مفتوحة:** {summary["open"]}\n'
+                    f'🔒 **مغلقة:** {summary["closed"]}'
+                ),
+                inline=True
+            )
+
+            names = {'first_response': '💬 أول رد', 'claim': '✋ الاستلام', 'close': '🔒 الإغلاق'}
+            lines = []
+            for metric, label in names.items():
+                data = dashboard['metrics'][metric]
+                if data['count']:
+                    lines.append(f'{label}: **{helpers.format_time(int(data["avg_seconds"]))}** ({data["count"]})')
+                else:
+                    lines.append(f'{label}: —')
+
+            embed.add_field(name='⏱️ متوسط الأوقات', value='\n'.join(lines), inline=True)
+
+            ratings = dashboard['ratings']
+            total_ratings = sum(ratings.values())
+            if total_ratings:
+                rating_lines = []
+                for stars in range(5, 0, -1):
+                    count = ratings[stars]
+                    filled = int((count / total_ratings) * 10)
+                    rating_lines.append(f'`{stars}⭐` {"█" * filled}{"░" * (10 - filled)} {count}')
+                embed.add_field(
+                    name=f'⭐ التقييمات (متوسط {dashboard["avg_rating"]})',
+                    value='\n'.join(rating_lines),
+                    inline=False
+                )
+
+            trend = [
+                f'`{point["date"][-5:]}`' + (f' ({point["days"]} أيام)' if point['days'] > 1 else '')
+                + f' {point["opened"]} تكت'
+                + (f' • رد {helpers.format_time(int(point["first_response"]))}' if point['first_response'] else '')
+                for point in dashboard['trend']
+            ]
+            if trend:
+                embed.add_field(
+                    name=f'📈 آخر {days} أيام' + (' (السيرفر)' if staff else ''),
+                    value='\n'.join(trend),
+                    inline=False
+                )
+
+            if not staff and dashboard['top_staff']:
+                top = [
+                    f'<@{row["staff_id"]}> • {row["count"]} رد • {helpers.format_time(int(row["total"] / row["count"]))}'
+                    for row in dashboard['top_staff'][:5]
+                ]
+                embed.add_field(name='🏆 الطاقم الأكثر رداً', value='\n'.join(top), inline=False)
+
+            await interaction.response.send_message(embed=embed)
+
+        except Exception as e:
+            bot_logger.exception('خطأ في ticket_stats', e)
+            await interaction.response.send_message(
+                embed=embeds.error_embed('خطأ', str(e)),
+                ephemeral=True
+            )
+
+    @bot.tree.command(name='voicestats', description='ساعات الذروة وإشغال القنوات الصوتية')
+    @app_commands.describe(days='عدد الأيام (افتراضي: 7)')
+    @permissions.is_moderator()
+    async def voice_stats(interaction: discord.Interaction, days: int = 7):
+        """ساعات الذروة الصوتية وإشغال القنوات (من التجميع الساعي)"""
+        try:
+            days = max(1, min(days, 90))
+            guild_id = str(interaction.guild.id)
+
+            peak_hours = await voice_activity.get_peak_hours(guild_id, days)
+            channels = await voice_activity.get_channel_utilisation(guild_id, days)
+
+            if not channels:
+                await interaction.response.send_message(
+                    embed=embeds.warning_embed('لا توجد بيانات', 'لا يوجد نشاط صوتي مسجل بعد'),
+                    ephemeral=True
+                )
+                return
+
+            embed = discord.Embed(
+                title='🔊 النشاط الصوتي',
+                description=f'آخر {days} أيام',
+                color=discord.Color.blue(),
+                timestamp=datetime.now()
+            )
+
+            # ساعات الذروة (أعلى 5)
+            top_hours = sorted(peak_hours, key=lambda h: h['avg_occupants'], reverse=True)[:5]
+            max_avg = top_hours[0]['avg_occupants'] or 1
+            hour_lines = []
+            for h in top_hours:
+                filled = int((h['avg_occupants'] / max_avg) * 10)
+                hour_lines.append(f'`{h["hour"]:02d}:00` {"█" * filled}{"░" * (10 - filled)} {h["avg_occupants"]:.1f}')
+            embed.add_field(name='⏰ ساعات الذروة (متوسط المتواجدين)', value='\n'.join(hour_lines), inline=False)
+
+            # إشغال القنوات
+            channel_lines = []
+            for data in channels[:8]:
+                channel = interaction.guild.get_channel(int(data['channel_id']))
+                name = channel.mention if channel else f'`{data["channel_id"]}`'
+                channel_lines.append(
+                    f'{name} • **{data["utilisation"] * 100:.1f}%** • ذروة {data["peak"]} • {data["joins"]} انضمام'
+                )
+            embed.add_field(name='📊 إشغال القنوات', value='\n'.join(channel_lines), inline=False)
+
+            await interaction.response.send_message(embed=embed)
+
+        except Exception as e:
+            bot_logger.exception('خطأ في voice_stats', e)
+            await interaction.response.send_message(
+                embed=embeds.error_embed('خطأ', str(e)),
+                ephemeral=True
+            )
+
+    @bot.tree.command(name='export', description='تصدير بيانات السيرفر (CSV / Parquet)')
+    @app_commands.describe(table='الجدول', format='الصيغة', days='آخر عدد أيام (0 = الكل)')
+    @app_commands.choices(
+        table=[
+            app_commands.Choice(name='الإحصائيات اليومية', value='stats'),
+            app_commands.Choice(name='السجلات', value='logs'),
+            app_commands.Choice(name='المستويات', value='levels'),
+            app_commands.Choice(name='أحداث التحليلات', value='analytics_events'),
+        ],
+        format=[
+            app_commands.Choice(name='CSV', value='csv'),
+            app_commands.Choice(name='CSV (gzip)', value='csv.gz'),
+            app_commands.Choice(name='Parquet', value='parquet'),
+        ]
+    )
+    @permissions.is_admin()
+    async def export(interaction: discord.Interaction, table: str, format: str = 'csv.gz', days: int = 30):
+        """تصدير جدول للسيرفر الحالي (على دفعات)"""
+        await interaction.response.defer(ephemeral=True)
+        try:
+            since = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d') if days > 0 else None
+            result = await export_table(table, str(interaction.guild.id), format, since=since)
+
+            if not result['path']:
+                await interaction.followup.send(
+                    embed=embeds.warning_embed('لا توجد بيانات', 'لا توجد صفوف في هذه المدة'),
+                    ephemeral=True
+                )
+                return
+
+            try:
+                size = os.path.getsize(result['path'])
+                if size > interaction.guild.filesize_limit:
+                    await interaction.followup.send(
+                        embed=embeds.warning_embed(
+                            'الملف كبير',
+                            f'{result["rows"]:,} صف ({size / 1024 / 1024:.1f}MB) - استخدم مدة أقصر أو صيغة مضغوطة'
+                        ),
+                        ephemeral=True
+                    )
+                    return
+
+                await interaction.followup.send(
+                    f'📤 {result["rows"]:,} صف',
+                    file=discord.File(result['path']),
+                    ephemeral=True
+                )
+            finally:
+                os.remove(result['path'])
+
+        except ValueError as e:
+            await interaction.followup.send(embed=embeds.error_embed('خطأ', str(e)), ephemeral=True)
+        except Exception as e:
+            bot_logger.exception('خطأ في export', e)
+            await interaction.followup.send(embed=embeds.error_embed('خطأ', str(e)), ephemeral=True)
+
     bot_logger.success('✅ تم تسجيل أوامر الإحصائيات')
\ No newline at end of file
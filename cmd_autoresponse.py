@@ -319,7 +319,7 @@ def setup_autoresponse_commands(bot: commands.Bot):
     async def remove_response(interaction: discord.Interaction, id: int):
         """حذف رد"""
         try:
-            success = await autoresponse_system.remove_response(id)
+            success = await autoresponse_system.remove_response(id, str(interaction.guild.id))
             
             if success:
                 await interaction.response.send_message(
@@ -353,7 +353,7 @@ def setup_autoresponse_commands(bot: commands.Bot):
     async def toggle_response(interaction: discord.Interaction, id: int):
         """تبديل حالة الرد"""
         try:
-            success = await autoresponse_system.toggle_response(id)
+            success = await autoresponse_system.toggle_response(id, str(interaction.guild.id))
             
             if success:
                 await interaction.response.send_message(
@@ -423,7 +423,8 @@ def setup_autoresponse_commands(bot: commands.Bot):
                 trigger=trigger,
                 response=response,
                 chance=chance,
-                cooldown=cooldown
+                cooldown=cooldown,
+                guild_id=str(interaction.guild.id)
             )
             
             embed = discord.Embed(
@@ -675,7 +676,7 @@ class ConfirmClearView(discord.ui.View):
             
             # حذف جميع الردود
             for resp in responses:
-                await autoresponse_system.remove_response(resp['id'])
+                await autoresponse_system.remove_response(resp['id'], self.guild_id)
             
             embed = embeds.success_embed(
                 'تم الحذف',
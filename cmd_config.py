@@ -3,8 +3,13 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from config_manager import config
+from datetime import datetime
+from database import db
+from system_log_archive import log_archiver
 import permissions, embeds
 
+LOGS_ARCHIVE_LIMIT = 25
+
 def setup_config_commands(bot: commands.Bot):
     """تسجيل أوامر الإعدادات"""
     
@@ -101,8 +106,54 @@ def setup_config_commands(bot: commands.Bot):
         await config.setup_leveling(str(interaction.guild.id), enabled)
         await interaction.response.send_message(embeds.success_embed('تم', f'نظام المستويات: {"مفعل" if enabled else "معطل"}'))
     
+    @setup_group.command(name='logretention', description='مدة الاحتفاظ بالسجلات قبل أرشفتها')
+    @app_commands.describe(days='عدد الأيام (0 = بدون أرشفة)')
+    @permissions.is_admin()
+    async def setup_log_retention(interaction: discord.Interaction, days: app_commands.Range[int, 0, 3650]):
+        await db.set_log_retention(str(interaction.guild.id), days)
+        text = f'السجلات الأقدم من {days} يوم تُؤرشف تلقائياً' if days else 'لن تُؤرشف السجلات'
+        await interaction.response.send_message(embeds.success_embed('تم', text))
+    
     bot.tree.add_command(setup_group)
     
+    logs_group = app_commands.Group(name='logs', description='السجلات المؤرشفة')
+    
+    @logs_group.command(name='archive', description='البحث في السجلات المؤرشفة')
+    @app_commands.describe(
+        since='من تاريخ (YYYY-MM-DD)',
+        until='إلى تاريخ (YYYY-MM-DD، غير شامل)',
+        action='نوع الإجراء (اختياري)'
+    )
+    @permissions.is_admin()
+    async def logs_archive(interaction: discord.Interaction, since: str, until: str, action: str = None):
+        try:
+            datetime.strptime(since, '%Y-%m-%d')
+            datetime.strptime(until, '%Y-%m-%d')
+        except ValueError:
+            await interaction.response.send_message(
+                embed=embeds.error_embed('تاريخ غير صالح', 'الصيغة: YYYY-MM-DD'), ephemeral=True
+            )
+            return
+        
+        await interaction.response.defer(ephemeral=True)
+        rows = await log_archiver.query_archive(str(interaction.guild.id), since, until, action, limit=LOGS_ARCHIVE_LIMIT)
+        if not rows:
+            await interaction.followup.send(
+                embed=embeds.info_embed('لا توجد نتائج', f'لا سجلات مؤرشفة بين {since} و {until}'), ephemeral=True
+            )
+            return
+        
+        lines = []
+        for row in rows:
+            who = f' <@{row["user_id"]}>' if row.get('user_id') else ''
+            by = f' ← <@{row["moderator_id"]}>' if row.get('moderator_id') else ''
+            reason = f' • {row["reason"][:60]}' if row.get('reason') else ''
+            lines.append(f'`{(row.get("created_at") or "")[:16]}` **{row["action_type"]}**{who}{by}{reason}')
+        embed = embeds.info_embed(f'🗄️ السجلات المؤرشفة ({len(rows)})', '\n'.join(lines)[:4000])
+        await interaction.followup.send(embed=embed, ephemeral=True)
+    
+    bot.tree.add_command(logs_group)
+    
     @bot.tree.command(name='config', description='عرض الإعدادات الحالية')
     async def view_config(interaction: discord.Interaction):
         settings = await config.get_settings(str(interaction.guild.id))
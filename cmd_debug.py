@@ -0,0 +1,99 @@
+"""
+cmd_debug.py - أوامر التشخيص
+=============================
+أوامر لصاحب البوت فقط: أداء قاعدة البيانات
+"""
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+from system_db_profiler import query_profiler
+import permissions, embeds
+from logger import bot_logger
+from datetime import datetime
+
+
+def setup_debug_commands(bot: commands.Bot):
+    """تسجيل أوامر التشخيص"""
+
+    debug_group = app_commands.Group(name='debug', description='أدوات التشخيص (لصاحب البوت)')
+
+    @debug_group.command(name='db', description='أثقل استعلامات قاعدة البيانات')
+    @app_commands.describe(limit='عدد الجمل (افتراضي: 10)', order='الترتيب حسب', reset='تصفير العدادات بعد العرض')
+    @app_commands.choices(
+        order=[
+            app_commands.Choice(name='الزمن الكلي', value='total_ms'),
+            app_commands.Choice(name='عدد المرات', value='count'),
+            app_commands.Choice(name='p95', value='p95_ms'),
+            app_commands.Choice(name='أقصى زمن', value='max_ms'),
+            app_commands.Choice(name='انتظار القفل', value='lock_wait_ms'),
+            app_commands.Choice(name='الصفوف المُعادة', value='rows'),
+        ]
+    )
+    @permissions.is_owner()
+    async def debug_db(interaction: discord.Interaction, limit: int = 10, order: str = 'total_ms', reset: bool = False):
+        """عرض أعلى الجمل حسب القالب + آخر الاستعلامات البطيئة"""
+        try:
+            if not query_profiler.enabled:
+                await interaction.response.send_message(
+                    embed=embeds.warning_embed('القياس معطل', 'شغّل البوت بدون `DB_PROFILE=0`'),
+                    ephemeral=True
+                )
+                return
+
+            totals = query_profiler.totals()
+            top = query_profiler.top(max(1, min(limit, 25)), order)
+
+            lines = []
+            for i, row in enumerate(top, 1):
+                entry = (
+                    f'**{i}.** `{row["count"]:,}×` كلي `{row["total_ms"]:.0f}ms` · '
+                    f'p50 `{row["p50_ms"]:.1f}` · p95 `{row["p95_ms"]:.1f}` · p99 `{row["p99_ms"]:.1f}` · '
+                    f'أقصى `{row["max_ms"]:.1f}` · قفل `{row["lock_wait_ms"]:.0f}ms` · صفوف `{row["rows"]:,}`\n'
+                    f'```sql\n{row["sql"][:200]}\n```'
+                )
+                if sum(len(line) for line in lines) + len(entry) > 3800:
+                    break
+                lines.append(entry)
+
+            embed = discord.Embed(
+                title='🗄️ استعلامات قاعدة البيانات',
+                description='\n'.join(lines) or 'لا توجد استعلامات مسجلة بعد',
+                color=discord.Color.blue(),
+                timestamp=datetime.now()
+            )
+            embed.add_field(
+                name='📊 المجموع',
+                value=(
+                    f'**الجمل:** `{totals["statements"]}`\n'
+                    f'**التنفيذات:** `{totals["count"]:,}`\n'
+                    f'**الزمن:** `{totals["total_ms"] / 1000:.1f}s`\n'
+                    f'**انتظار القفل:** `{totals["lock_wait_ms"] / 1000:.1f}s`\n'
+                    f'**منذ:** <t:{int(totals["since"].timestamp())}:R>'
+                ),
+                inline=True
+            )
+
+            slow = query_profiler.slow_queries(5)
+            if slow:
+                embed.add_field(
+                    name=f'🐢 البطيئة (≥ {query_profiler.slow_ms:.0f}ms)',
+                    value='\n'.join(
+                        f'`{q["ms"]:.0f}ms` {q["phase"]} `{q["sql"][:60]}`'
+                        + (f' ({q["params"][:40]})' if q['params'] else '')
+                        for q in slow
+                    )[:1024],
+                    inline=False
+                )
+
+            if reset:
+                query_profiler.reset()
+                embed.set_footer(text='تم تصفير العدادات')
+
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+
+        except Exception as e:
+            bot_logger.exception('خطأ في debug db', e)
+            await interaction.response.send_message(embed=embeds.error_embed('خطأ', str(e)), ephemeral=True)
+
+    bot.tree.add_command(debug_group)
@@ -11,7 +11,7 @@ cmd_fun.py - ULTIMATE FIXED VERSION
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 ✨ Persistent Views للـ Mystery
 ✨ Defer صحيح قبل كل followup
-✨ تسجيل Views في main.py
+✨ تسجيل Views في bot_app.py
 ✨ معالجة أخطاء شاملة
 ✨ Logging مفصّل
 """
@@ -26,6 +26,7 @@ import os
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List, Tuple
 from logger import bot_logger
+from expiring_map import ExpiringMap
 
 # ==================== Configuration ====================
 
@@ -34,11 +35,15 @@ FUN_BANNER_URL = "https://cdn.phototourl.com/uploads/2025-12-21-862960d6-ee99-48
 
 # ==================== Session Storage ====================
 
-_sessions: Dict[int, Dict[str, Any]] = {}
-_mystery_sessions: Dict[int, Dict[str, Any]] = {}
-_risk_sessions: Dict[int, Dict[str, Any]] = {}
-_iq_sessions: Dict[int, Dict[str, Any]] = {}
-_codebreak_sessions: Dict[int, Dict[str, Any]] = {}
+# الجلسات المهجورة تُحذف بعد 30 دقيقة من بدئها
+SESSION_TTL = 1800
+SESSION_MAX = 10_000
+
+_sessions = ExpiringMap(ttl=SESSION_TTL, max_size=SESSION_MAX, name='fun.sessions')
+_mystery_sessions = ExpiringMap(ttl=SESSION_TTL, max_size=SESSION_MAX, name='fun.mystery')
+_risk_sessions = ExpiringMap(ttl=SESSION_TTL, max_size=SESSION_MAX, name='fun.risk')
+_iq_sessions = ExpiringMap(ttl=SESSION_TTL, max_size=SESSION_MAX, name='fun.iq')
+_codebreak_sessions = ExpiringMap(ttl=SESSION_TTL, max_size=SESSION_MAX, name='fun.codebreak')
 
 # Mystery data
 _mystery_data: Dict[str, Any] = {}
@@ -117,7 +122,7 @@ async def load_mystery_data():
 
 def get_session(user_id: int) -> Dict[str, Any]:
     """الحصول على جلسة مستخدم"""
-    if user_id not in _sessions:
+    if not _sessions.touch(user_id):
         _sessions[user_id] = {"created_at": datetime.utcnow(), "data": {}}
     return _sessions[user_id]["data"]
 
@@ -217,6 +222,7 @@ async def show_scene(interaction: discord.Interaction, user_id: int):
             return
         
         session = _mystery_sessions[user_id]
+        _mystery_sessions.touch(user_id)  # الجلسة تُعدَّل في مكانها: تمديد الصلاحية مع كل حركة
         story_id = session["story_id"]
         current_scene_id = session["current"]
         
@@ -311,6 +317,7 @@ async def process_choice(interaction: discord.Interaction, user_id: int, story_i
         
         # تحديث الجلسة
         session = _mystery_sessions[user_id]
+        _mystery_sessions.touch(user_id)
         session["path"].append({"scene": scene_id, "choice": choice_key})
         session["current"] = next_scene
         
@@ -689,6 +696,7 @@ def setup_fun_commands(bot: commands.Bot):
             return
         
         session = _iq_sessions[user_id]
+        _iq_sessions.touch(user_id)
         current = session["current"]
         questions = session["questions"]
         
@@ -784,6 +792,7 @@ def setup_fun_commands(bot: commands.Bot):
             return
         
         s = _risk_sessions[user_id]
+        _risk_sessions.touch(user_id)
         s["bank"] += s["current"]
         s["current"] = 0
         
@@ -804,6 +813,7 @@ def setup_fun_commands(bot: commands.Bot):
             return
         
         s = _risk_sessions[user_id]
+        _risk_sessions.touch(user_id)
         
         # احتمالية النجاح تقل مع كل جولة
         chance = max(0.6 - 0.05 * s["rounds"], 0.2)
@@ -894,6 +904,7 @@ def setup_fun_commands(bot: commands.Bot):
             return
         
         cb = _codebreak_sessions[user_id]
+        _codebreak_sessions.touch(user_id)
         secret = cb["secret"]
         cb["attempts"] += 1
         
@@ -964,7 +975,7 @@ def setup_fun_commands(bot: commands.Bot):
 
 def register_persistent_views(bot: commands.Bot):
     """تسجيل الـ Views المستمرة"""
-    # هذه الدالة يجب استدعاؤها من main.py
+    # هذه الدالة يجب استدعاؤها من bot_app.py
     bot.add_view(MysteryStartView(story_id=""))
     bot.add_view(MysteryChoiceView(story_id="", scene_id="", choice_keys=[]))
     
@@ -18,6 +18,7 @@ from discord import app_commands
 from discord.ext import commands
 import embeds
 from system_leveling import leveling_system
+from system_census import member_census
 from logger import bot_logger
 from datetime import datetime
 from typing import Optional
@@ -208,10 +209,11 @@ def setup_info_commands(bot: commands.Bot):
             )
 
             # الأعضاء
+            census = member_census.get(guild)
             total = guild.member_count
-            humans = sum(1 for m in guild.members if not m.bot)
-            bots = sum(1 for m in guild.members if m.bot)
-            online = sum(1 for m in guild.members if m.status != discord.Status.offline)
+            humans = census.humans
+            bots = census.bots
+            online = census.online
 
             embed.add_field(
                 name='👥 الأعضاء',
@@ -239,10 +241,15 @@ def setup_info_commands(bot: commands.Bot):
                 inline=True
             )
 
-            # الأدوار
+            # الأدوار (الأكثر أعضاءً من الإحصاء)
+            top_roles = []
+            for role_id, count in census.top_roles(3):
+                role = guild.get_role(role_id)
+                if role:
+                    top_roles.append(f'{role.mention} • {count:,}')
             embed.add_field(
                 name='🎭 الأدوار',
-                value=f'**{len(guild.roles)}** دور',
+                value='\n'.join([f'**{len(guild.roles)}** دور', *top_roles]),
                 inline=True
             )
 
@@ -254,7 +261,8 @@ def setup_info_commands(bot: commands.Bot):
                 name='💎 Nitro Boost',
                 value=(
                     f'**المستوى:** {boost_level}\n'
-                    f'**العدد:** {boost_count}'
+                    f'**العدد:** {boost_count}\n'
+                    f'**المعززون:** {census.boosters}'
                 ),
                 inline=True
             )
@@ -355,10 +363,13 @@ def setup_info_commands(bot: commands.Bot):
                 return
 
             # الحصول على الترتيب
-            rank_pos = await leveling_system.get_user_rank(str(interaction.guild.id), str(user.id))
+            rank_pos = await leveling_system.get_user_rank(
+                str(interaction.guild.id), str(user.id), xp=data.get('xp')
+            )
 
             # إنشاء Embed
-            embed = embeds.rank_embed(user, data, rank_pos)
+            curve = await leveling_system.get_level_curve(str(interaction.guild.id))
+            embed = embeds.rank_embed(user, data, rank_pos, curve)
 
             await interaction.response.send_message(embed=embed)
 
@@ -386,22 +397,30 @@ def setup_info_commands(bot: commands.Bot):
             if page < 1:
                 page = 1
 
-            # جلب البيانات
-            offset = (page - 1) * 10
-            lb = await leveling_system.get_leaderboard(str(interaction.guild.id), limit=10, offset=offset)
+            guild_id = str(interaction.guild.id)
+            lb_cache = leveling_system.leaderboard_cache
 
-            if not lb:
-                await interaction.response.send_message(
-                    embed=embeds.warning_embed(
-                        'لا توجد بيانات',
-                        'لا توجد بيانات في لوحة الصدارة بعد!'
-                    ),
-                    ephemeral=True
-                )
-                return
+            # Embed الصفحة المخزن (صالح حتى تتغير بياناتها)
+            embed = lb_cache.get_embed(guild_id, page)
 
-            # إنشاء Embed
-            embed = embeds.leaderboard_embed(interaction.guild, lb, page)
+            if embed is None:
+                # جلب البيانات
+                offset = (page - 1) * 10
+                lb = await leveling_system.get_leaderboard(guild_id, limit=10, offset=offset)
+
+                if not lb:
+                    await interaction.response.send_message(
+                        embed=embeds.warning_embed(
+                            'لا توجد بيانات',
+                            'لا توجد بيانات في لوحة الصدارة بعد!'
+                        ),
+                        ephemeral=True
+                    )
+                    return
+
+                # إنشاء Embed
+                embed = embeds.leaderboard_embed(interaction.guild, lb, page)
+                lb_cache.store_embed(guild_id, page, embed)
 
             await interaction.response.send_message(embed=embed)
 
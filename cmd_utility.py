@@ -16,6 +16,8 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 import embeds
+from system_census import member_census
+from system_backup import backup_manager
 from logger import bot_logger
 from datetime import datetime
 import platform
@@ -25,7 +27,7 @@ from typing import Optional
 
 # ==================== Variables ====================
 
-# وقت بدء التشغيل (سيتم تعيينه من main.py)
+# وقت بدء التشغيل (سيتم تعيينه من bot_app.py)
 bot_start_time = datetime.now()
 
 def set_start_time(start_time: datetime):
@@ -79,10 +81,11 @@ def get_system_info() -> dict:
 
 def get_bot_stats(bot: commands.Bot) -> dict:
     """إحصائيات البوت"""
-    total_members = sum(g.member_count for g in bot.guilds)
-    total_channels = sum(len(g.channels) for g in bot.guilds)
-    total_text_channels = sum(len(g.text_channels) for g in bot.guilds)
-    total_voice_channels = sum(len(g.voice_channels) for g in bot.guilds)
+    totals = member_census.totals()
+    total_members = totals.get('members', 0)
+    total_channels = totals.get('channels', 0)
+    total_text_channels = totals.get('text_channels', 0)
+    total_voice_channels = totals.get('voice_channels', 0)
 
     # عدد الأوامر
     commands_count = len(bot.tree.get_commands())
@@ -94,7 +97,8 @@ def get_bot_stats(bot: commands.Bot) -> dict:
         'text_channels': total_text_channels,
         'voice_channels': total_voice_channels,
         'commands': commands_count,
-        'latency': round(bot.latency * 1000, 2)
+        'latency': round(bot.latency * 1000, 2),
+        'backup': backup_manager.stats()
     }
 
 
@@ -331,6 +335,21 @@ def setup_utility_commands(bot: commands.Bot):
                     inline=False
                 )
 
+            # النسخ الاحتياطي
+            backup = bot_stats['backup']
+            if backup['last_backup_at']:
+                backup_value = (
+                    f'**آخر نسخة:** <t:{int(backup["last_backup_at"].timestamp())}:R>\n'
+                    f'**المدة:** `{backup["last_duration_ms"] / 1000:.1f}s`\n'
+                    f'**الحجم:** `{backup["last_size"] / 1024 / 1024:.2f} MB`\n'
+                    f'**المحفوظة:** `{backup["kept"]}`'
+                )
+            else:
+                backup_value = '`لم تُؤخذ نسخة بعد`'
+            if backup['last_error']:
+                backup_value += f'\n⚠️ `{backup["last_error"][:100]}`'
+            embed.add_field(name='💾 النسخ الاحتياطي', value=backup_value, inline=True)
+
             # Shards (إذا كان البوت مُجزّأ)
             if bot.shard_count and bot.shard_count > 1:
                 embed.add_field(
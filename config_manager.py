@@ -250,11 +250,10 @@ class ConfigManager:
         try:
             from database import db
 
-            cursor = await db.conn.execute(
+            row = await db.fetchone(
                 'SELECT * FROM leveling_config WHERE guild_id = ?',
                 (guild_id,)
             )
-            row = await cursor.fetchone()
 
             if row:
                 row_dict = dict(row)
@@ -366,8 +365,7 @@ class ConfigManager:
     async def reset_settings(self, guild_id: str):
         """إعادة تعيين الإعدادات إلى الافتراضية"""
         # حذف الإعدادات الحالية
-        await db.conn.execute('DELETE FROM settings WHERE guild_id = ?', (guild_id,))
-        await db.conn.commit()
+        await db.execute('DELETE FROM settings WHERE guild_id = ?', (guild_id,))
 
         # إنشاء إعدادات جديدة
         await db.init_guild(guild_id)
@@ -388,7 +386,7 @@ class ConfigManager:
     async def export_settings(self, guild_id: str) -> Dict:
         """تصدير الإعدادات إلى dict"""
         settings = await self.get_settings(guild_id)
-        return settings.copy() if settings else {}
+        return dict(settings) if settings else {}
 
     async def import_settings(self, guild_id: str, settings: Dict):
         """استيراد الإعدادات من dict"""
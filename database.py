@@ -14,18 +14,255 @@ database.py - ULTIMATE FIXED VERSION
 import aiosqlite
 import asyncio
 import json
-from typing import Optional, Any, Dict, List, Tuple
-from datetime import datetime
+import os
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, Any, AsyncIterator, Dict, List, Tuple
+from datetime import datetime, timedelta
 from logger import bot_logger
+from records import Record, record_class
+from system_db_profiler import query_profiler
 
 DB_PATH = 'database.db'
 
+# جداول بيانات السيرفرات: تبقى في database.db، أو تُنقل لملفات الأقسام عند التجزئة
+GUILD_TABLES = ('levels', 'stats', 'logs', 'warnings', 'autoresponses', 'tickets')
+
+GUILD_SCHEMA = [
+    # Warnings
+    '''
+    CREATE TABLE IF NOT EXISTS warnings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        moderator_id TEXT NOT NULL,
+        reason TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # Tickets (legacy)
+    '''
+    CREATE TABLE IF NOT EXISTS tickets (
+        channel_id TEXT PRIMARY KEY,
+        guild_id TEXT NOT NULL,
+        opener_id TEXT NOT NULL,
+        reason TEXT,
+        status TEXT DEFAULT 'open',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        closed_at TIMESTAMP,
+        closed_by TEXT
+    )
+    ''',
+    # Leveling
+    '''
+    CREATE TABLE IF NOT EXISTS levels (
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        xp INTEGER DEFAULT 0,
+        level INTEGER DEFAULT 0,
+        messages INTEGER DEFAULT 0,
+        last_xp_time TIMESTAMP,
+        PRIMARY KEY (guild_id, user_id)
+    )
+    ''',
+    # فهرس الترتيب: COUNT(*) و ORDER BY xp يمسحان الفهرس بدل الجدول
+    '''
+    CREATE INDEX IF NOT EXISTS idx_levels_rank
+    ON levels (guild_id, xp DESC, user_id)
+    ''',
+    # Autoresponses
+    '''
+    CREATE TABLE IF NOT EXISTS autoresponses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id TEXT NOT NULL,
+        trigger TEXT NOT NULL,
+        response TEXT NOT NULL,
+        trigger_type TEXT DEFAULT 'contains',
+        enabled INTEGER DEFAULT 1,
+        chance INTEGER DEFAULT 100,
+        cooldown INTEGER DEFAULT 0,
+        last_used TIMESTAMP,
+        channels TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # Logs
+    '''
+    CREATE TABLE IF NOT EXISTS logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id TEXT NOT NULL,
+        action_type TEXT NOT NULL,
+        user_id TEXT,
+        moderator_id TEXT,
+        target_id TEXT,
+        reason TEXT,
+        details TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # فهرس الأرشفة: السجلات المنتهية لكل سيرفر
+    '''
+    CREATE INDEX IF NOT EXISTS idx_logs_guild_created
+    ON logs (guild_id, created_at)
+    ''',
+    # Stats
+    '''
+    CREATE TABLE IF NOT EXISTS stats (
+        guild_id TEXT NOT NULL,
+        date TEXT NOT NULL,
+        messages INTEGER DEFAULT 0,
+        joins INTEGER DEFAULT 0,
+        leaves INTEGER DEFAULT 0,
+        voice_minutes INTEGER DEFAULT 0,
+        PRIMARY KEY (guild_id, date)
+    )
+    ''',
+]
+
+# التجزئة (اختيارية): off = كل شيء في database.db | guild = ملف لكل سيرفر
+# bucket = DB_SHARD_BUCKETS ملف يُوزع عليها السيرفرات بالـ hash
+SHARD_MODE = os.getenv('DB_SHARD_MODE', 'off')
+SHARD_BUCKETS = int(os.getenv('DB_SHARD_BUCKETS', '16'))
+SHARD_DIR = os.getenv('DB_SHARD_DIR', 'shards')
+SHARD_MAX_OPEN = int(os.getenv('DB_SHARD_MAX_OPEN', '32'))  # أقصى عدد ملفات مفتوحة (LRU)
+
+
+def shard_key(guild_id: str, mode: Optional[str] = None, buckets: Optional[int] = None) -> str:
+    """اسم قسم السيرفر (crc32 ثابت بين التشغيلات بعكس hash())"""
+    if (mode or SHARD_MODE) == 'guild':
+        return f'guild-{guild_id}'
+    return f'bucket-{zlib.crc32(str(guild_id).encode()) % (buckets or SHARD_BUCKETS):03d}'
+
+
+def shard_path(key: str) -> str:
+    return os.path.join(SHARD_DIR, f'{key}.db')
+
+
+class _Store:
+    """اتصال SQLite + قفل الكتابة + دوال SQL الخام (القاعدة الرئيسية وملفات الأقسام)"""
+
+    conn: Optional[aiosqlite.Connection]
+    _lock: asyncio.Lock
 
-class Database:
+    # ==================== Raw Helpers ====================
+
+    @asynccontextmanager
+    async def _locked(self, sql: str):
+        """قفل الكتابة مع قياس زمن انتظاره (منفصلاً عن زمن التنفيذ)"""
+        start = time.perf_counter()
+        async with self._lock:
+            query_profiler.record_lock_wait(sql, (time.perf_counter() - start) * 1000)
+            # الفحص بعد القفل: قد يُغلق الاتصال أثناء الانتظار
+            if not self.conn:
+                raise RuntimeError('DB not connected')
+            yield
+
+    @asynccontextmanager
+    async def transaction(self, label: str) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        عدة جمل في معاملة واحدة تحت قفل الكتابة
+
+        commit عند نهاية الكتلة، و rollback عند أي خطأ. label يظهر في قياس انتظار القفل.
+        """
+        async with self._locked(label):
+            try:
+                yield self.conn
+                await self.conn.commit()
+            except Exception:
+                await self.conn.rollback()
+                raise
+
+    async def execute(self, sql: str, params: tuple = ()):
+        """تنفيذ SQL"""
+        async with self._locked(sql):
+            try:
+                cur = await self.conn.execute(sql, params)
+                await self.conn.commit()
+                return cur
+            except Exception as e:
+                bot_logger.database_error('execute', str(e))
+                raise
+
+    async def fetchone(self, sql: str, params: tuple = ()):
+        """جلب صف واحد"""
+        async with self._locked(sql):
+            cur = await self.conn.execute(sql, params)
+            row = await cur.fetchone()
+            return dict(row) if row else None
+
+    async def fetchall(self, sql: str, params: tuple = ()):
+        """جلب جميع الصفوف"""
+        async with self._locked(sql):
+            cur = await self.conn.execute(sql, params)
+            rows = await cur.fetchall()
+            return [dict(r) for r in rows]
+
+    # ==================== Records ====================
+
+    async def fetch_records(self, table: str, sql: str, params: tuple = ()) -> List[Record]:
+        """جلب جميع الصفوف كسجلات __slots__ (صنف واحد لكل أعمدة الاستعلام)"""
+        async with self._locked(sql):
+            cur = await self.conn.execute(sql, params)
+            rows = await cur.fetchall()
+            if not rows:
+                return []
+            cls = record_class(table, [col[0] for col in cur.description])
+            return [cls(*row) for row in rows]
+
+    async def fetch_record(self, table: str, sql: str, params: tuple = ()) -> Optional[Record]:
+        """جلب صف واحد كسجل __slots__"""
+        async with self._locked(sql):
+            cur = await self.conn.execute(sql, params)
+            row = await cur.fetchone()
+            if row is None:
+                return None
+            return record_class(table, [col[0] for col in cur.description])(*row)
+
+
+class GuildShard(_Store):
+    """ملف قسم: جداول السيرفرات (GUILD_TABLES) فقط، باتصال وقفل مستقلين"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.db_path = shard_path(key)
+        self.conn: Optional[aiosqlite.Connection] = None
+        self._lock = asyncio.Lock()
+        self.users = 0  # كتل for_guild الجارية؛ القسم لا يُغلق بالإخلاء ما دامت > 0
+
+    async def connect(self):
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        self.conn = query_profiler.wrap(await aiosqlite.connect(self.db_path))
+        self.conn.row_factory = aiosqlite.Row
+        async with self._lock:
+            # ملف جديد: VACUUM تدريجي لأرشفة السجلات (لا أثر على ملف موجود)
+            await self.conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            await self.conn.execute('PRAGMA journal_mode = WAL')
+            for sql in GUILD_SCHEMA:
+                await self.conn.execute(sql)
+            await self.conn.commit()
+
+    async def close(self):
+        # انتظار أي عملية جارية عبر execute/fetch* قبل الإغلاق
+        async with self._lock:
+            if self.conn:
+                await self.conn.close()
+                self.conn = None
+
+
+class Database(_Store):
     def __init__(self, db_path: str = DB_PATH):
         self.db_path = db_path
         self.conn: Optional[aiosqlite.Connection] = None
         self._lock = asyncio.Lock()
+        # الأقسام المفتوحة بترتيب آخر استخدام
+        self.sharded = SHARD_MODE in ('guild', 'bucket')
+        self.shards: 'OrderedDict[str, GuildShard]' = OrderedDict()
+        self._shards_lock = asyncio.Lock()
+        # رقم إصدار بيانات الإحصائيات لكل سيرفر (يزيد مع كل كتابة؛ يُستخدم لإبطال الكاشات)
+        self.stats_versions: Dict[str, int] = {}
+        self.stats_days: Dict[str, str] = {}  # آخر يوم كُتبت فيه عدادات لكل سيرفر
 
     # ==================== Connection ====================
 
@@ -34,9 +271,13 @@ class Database:
         if self.conn:
             return
         try:
-            self.conn = await aiosqlite.connect(self.db_path)
+            self.conn = query_profiler.wrap(await aiosqlite.connect(self.db_path))
             self.conn.row_factory = aiosqlite.Row
             await self.conn.execute('PRAGMA foreign_keys = ON;')
+            # ملف جديد: VACUUM تدريجي لأرشفة السجلات (الملف القديم يُحوَّل يدوياً، system_log_archive.py)
+            await self.conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            # WAL: القراءة (النسخ الاحتياطي، الأرشفة، التصدير) لا تحجب الكتابة والعكس
+            await self.conn.execute('PRAGMA journal_mode = WAL')
             await self.create_tables()
             await self.conn.commit()
             bot_logger.success('✅ Database connected')
@@ -49,12 +290,163 @@ class Database:
         if not self.conn:
             return
         try:
+            while self.shards:
+                _, shard = self.shards.popitem()
+                await shard.close()
             await self.conn.close()
             self.conn = None
             bot_logger.info('Database closed')
         except Exception as e:
             bot_logger.error(f'Error closing DB: {e}')
 
+    # ==================== Shards ====================
+
+    @asynccontextmanager
+    async def for_guild(self, guild_id: str) -> AsyncIterator[_Store]:
+        """
+        مخزن جداول السيرفر (GUILD_TABLES) طوال كتلة async with
+
+        بدون تجزئة: القاعدة نفسها. مع التجزئة: ملف القسم، يُفتح عند أول طلب
+        ويبقى محجوزاً داخل الكتلة فلا يغلقه إخلاء LRU (SHARD_MAX_OPEN).
+        """
+        if not self.sharded:
+            yield self
+            return
+        if not guild_id:
+            # بدون معرف كانت القراءة/الكتابة تذهب للقاعدة الرئيسية بصمت
+            raise ValueError('for_guild: guild_id مطلوب مع التجزئة')
+        shard = await self._acquire_shard(shard_key(str(guild_id)))
+        try:
+            yield shard
+        finally:
+            shard.users -= 1
+
+    async def _acquire_shard(self, key: str) -> GuildShard:
+        """فتح القسم (إن لزم) وحجزه - يُحرر بإنقاص users"""
+        shard = self.shards.get(key)
+        if shard is None:
+            async with self._shards_lock:
+                shard = self.shards.get(key)
+                if shard is None:
+                    shard = GuildShard(key)
+                    await shard.connect()
+                    self.shards[key] = shard
+                shard.users += 1
+                self.shards.move_to_end(key)
+                await self._evict_idle()
+            return shard
+        # بدون await بين القراءة والحجز: لا يمكن إخلاؤه بينهما
+        shard.users += 1
+        self.shards.move_to_end(key)
+        return shard
+
+    async def _evict_idle(self):
+        """إغلاق أقدم الأقسام غير المحجوزة حتى SHARD_MAX_OPEN (المحجوزة تبقى ولو زاد العدد)"""
+        excess = len(self.shards) - SHARD_MAX_OPEN
+        if excess <= 0:
+            return
+        idle = [key for key, shard in self.shards.items() if not shard.users][:excess]
+        # الحذف من القاموس قبل أي await حتى لا يُحجز قسم في طريقه للإغلاق
+        evicted = [self.shards.pop(key) for key in idle]
+        for shard in evicted:
+            await shard.close()
+
+    def shard_keys(self) -> List[str]:
+        """الأقسام الموجودة على القرص"""
+        if not self.sharded or not os.path.isdir(SHARD_DIR):
+            return []
+        return sorted(name[:-3] for name in os.listdir(SHARD_DIR) if name.endswith('.db'))
+
+    async def iter_guild_stores(self) -> AsyncIterator[_Store]:
+        """كل مخازن جداول السيرفرات: القاعدة نفسها، أو الأقسام الموجودة واحداً تلو الآخر"""
+        if not self.sharded:
+            yield self
+            return
+        for key in self.shard_keys():
+            shard = await self._acquire_shard(key)
+            try:
+                yield shard
+            finally:
+                shard.users -= 1
+
+    async def fetchall_guilds(self, sql: str, params: tuple = ()) -> List[Dict]:
+        """استعلام على جداول السيرفرات لكل السيرفرات (يمر على كل الأقسام)"""
+        rows: List[Dict] = []
+        async for store in self.iter_guild_stores():
+            rows.extend(await store.fetchall(sql, params))
+        return rows
+
+    async def fetch_records_guilds(self, table: str, sql: str, params: tuple = ()) -> List[Record]:
+        """مثل fetchall_guilds لكن الصفوف سجلات __slots__"""
+        rows: List[Record] = []
+        async for store in self.iter_guild_stores():
+            rows.extend(await store.fetch_records(table, sql, params))
+        return rows
+
+    async def migrate_to_shards(
+        self,
+        mode: Optional[str] = None,
+        buckets: Optional[int] = None,
+        purge: bool = False
+    ) -> Dict[str, int]:
+        """
+        نسخ جداول السيرفرات من database.db إلى ملفات الأقسام (والبوت متوقف)
+
+        آمنة للتكرار (INSERT OR IGNORE). purge=True يحذف الصفوف المنقولة من database.db.
+
+        Returns:
+            Dict: {key: عدد الصفوف المنسوخة}
+        """
+        mode = mode or SHARD_MODE
+        if mode not in ('guild', 'bucket'):
+            raise ValueError(f'وضع تجزئة غير مدعوم: {mode}')
+
+        guilds_by_key: Dict[str, List[str]] = {}
+        for table in GUILD_TABLES:
+            for row in await self.fetchall(f'SELECT DISTINCT guild_id FROM {table}'):
+                key = shard_key(row['guild_id'], mode, buckets)
+                guilds = guilds_by_key.setdefault(key, [])
+                if row['guild_id'] not in guilds:
+                    guilds.append(row['guild_id'])
+
+        columns = {
+            table: ', '.join(c['name'] for c in await self.fetchall(f'PRAGMA table_info({table})'))
+            for table in GUILD_TABLES
+        }
+
+        copied: Dict[str, int] = {}
+        for key, guild_ids in guilds_by_key.items():
+            shard = GuildShard(key)
+            await shard.connect()  # إنشاء الملف والجداول
+            await shard.close()
+
+            placeholders = ','.join('?' * len(guild_ids))
+            async with self._locked('migrate_to_shards'):
+                await self.conn.execute('ATTACH DATABASE ? AS shard', (shard.db_path,))
+                try:
+                    total = 0
+                    for table in GUILD_TABLES:
+                        cursor = await self.conn.execute(
+                            f'INSERT OR IGNORE INTO shard.{table} ({columns[table]}) '
+                            f'SELECT {columns[table]} FROM main.{table} WHERE guild_id IN ({placeholders})',
+                            guild_ids
+                        )
+                        total += cursor.rowcount
+                        if purge:
+                            await self.conn.execute(
+                                f'DELETE FROM main.{table} WHERE guild_id IN ({placeholders})', guild_ids
+                            )
+                    await self.conn.commit()
+                except Exception:
+                    await self.conn.rollback()
+                    raise
+                finally:
+                    await self.conn.execute('DETACH DATABASE shard')
+            copied[key] = total
+            bot_logger.info(f'🧩 {key}: {total} صف ({len(guild_ids)} سيرفر)')
+
+        return copied
+
     # ==================== Schema Creation ====================
 
     async def create_tables(self):
@@ -64,6 +456,9 @@ class Database:
 
         async with self._lock:
             try:
+                for sql in GUILD_SCHEMA:
+                    await self.conn.execute(sql)
+
                 # Settings
                 await self.conn.execute('''
                     CREATE TABLE IF NOT EXISTS settings (
@@ -89,18 +484,6 @@ class Database:
                     )
                 ''')
 
-                # Warnings
-                await self.conn.execute('''
-                    CREATE TABLE IF NOT EXISTS warnings (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        guild_id TEXT NOT NULL,
-                        user_id TEXT NOT NULL,
-                        moderator_id TEXT NOT NULL,
-                        reason TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
                 # Notes
                 await self.conn.execute('''
                     CREATE TABLE IF NOT EXISTS notes (
@@ -113,20 +496,6 @@ class Database:
                     )
                 ''')
 
-                # Tickets (legacy)
-                await self.conn.execute('''
-                    CREATE TABLE IF NOT EXISTS tickets (
-                        channel_id TEXT PRIMARY KEY,
-                        guild_id TEXT NOT NULL,
-                        opener_id TEXT NOT NULL,
-                        reason TEXT,
-                        status TEXT DEFAULT 'open',
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        closed_at TIMESTAMP,
-                        closed_by TEXT
-                    )
-                ''')
-
                 # ✅ Tickets V2 (Advanced) - FIXED
                 await self.conn.execute('''
                     CREATE TABLE IF NOT EXISTS tickets_v2 (
@@ -149,6 +518,57 @@ class Database:
                         close_reason TEXT
                     )
                 ''')
+                await self.conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_tickets_v2_guild_status
+                    ON tickets_v2 (guild_id, status)
+                ''')
+
+                # ✅ Ticket Events (append-only: notes, claims, priority, ratings, closes)
+                await self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS ticket_events (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        ticket_id INTEGER NOT NULL,
+                        channel_id TEXT,
+                        guild_id TEXT,
+                        event_type TEXT NOT NULL,
+                        actor_id TEXT,
+                        value TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                await self.conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_ticket_events_ticket
+                    ON ticket_events (ticket_id, id)
+                ''')
+                await self.conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_ticket_events_guild
+                    ON ticket_events (guild_id, event_type, created_at)
+                ''')
+
+                # ✅ Ticket SLA (running aggregates per guild / category / staff)
+                await self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS ticket_sla_stats (
+                        guild_id TEXT NOT NULL,
+                        scope TEXT NOT NULL,
+                        scope_id TEXT NOT NULL,
+                        metric TEXT NOT NULL,
+                        bucket INTEGER NOT NULL,
+                        count INTEGER DEFAULT 0,
+                        total REAL DEFAULT 0,
+                        PRIMARY KEY (guild_id, scope, scope_id, metric, bucket)
+                    )
+                ''')
+
+                await self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS ticket_sla_daily (
+                        guild_id TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        metric TEXT NOT NULL,
+                        count INTEGER DEFAULT 0,
+                        total REAL DEFAULT 0,
+                        PRIMARY KEY (guild_id, date, metric)
+                    )
+                ''')
 
                 # ✅ Ticket Categories
                 await self.conn.execute('''
@@ -181,19 +601,6 @@ class Database:
                     )
                 ''')
 
-                # Leveling
-                await self.conn.execute('''
-                    CREATE TABLE IF NOT EXISTS levels (
-                        guild_id TEXT NOT NULL,
-                        user_id TEXT NOT NULL,
-                        xp INTEGER DEFAULT 0,
-                        level INTEGER DEFAULT 0,
-                        messages INTEGER DEFAULT 0,
-                        last_xp_time TIMESTAMP,
-                        PRIMARY KEY (guild_id, user_id)
-                    )
-                ''')
-
                 await self.conn.execute('''
                     CREATE TABLE IF NOT EXISTS leveling_config (
                         guild_id TEXT PRIMARY KEY,
@@ -217,23 +624,6 @@ class Database:
                     )
                 ''')
 
-                # Autoresponses
-                await self.conn.execute('''
-                    CREATE TABLE IF NOT EXISTS autoresponses (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        guild_id TEXT NOT NULL,
-                        trigger TEXT NOT NULL,
-                        response TEXT NOT NULL,
-                        trigger_type TEXT DEFAULT 'contains',
-                        enabled INTEGER DEFAULT 1,
-                        chance INTEGER DEFAULT 100,
-                        cooldown INTEGER DEFAULT 0,
-                        last_used TIMESTAMP,
-                        channels TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
                 await self.conn.execute('''
                     CREATE TABLE IF NOT EXISTS blacklist_words (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -245,21 +635,6 @@ class Database:
                     )
                 ''')
 
-                # Logs
-                await self.conn.execute('''
-                    CREATE TABLE IF NOT EXISTS logs (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        guild_id TEXT NOT NULL,
-                        action_type TEXT NOT NULL,
-                        user_id TEXT,
-                        moderator_id TEXT,
-                        target_id TEXT,
-                        reason TEXT,
-                        details TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
                 await self.conn.execute('''
                     CREATE TABLE IF NOT EXISTS lists (
                         guild_id TEXT NOT NULL,
@@ -312,6 +687,29 @@ class Database:
                     )
                 ''')
 
+                # عدادات الدعوات المُجمّعة (تُحدّث مع كل record_invite)
+                await self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS invite_counts (
+                        guild_id TEXT NOT NULL,
+                        inviter_id TEXT NOT NULL,
+                        count INTEGER DEFAULT 0,
+                        PRIMARY KEY (guild_id, inviter_id)
+                    )
+                ''')
+                await self.conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_invite_counts_rank
+                    ON invite_counts (guild_id, count DESC)
+                ''')
+                # تعبئة أولية من جدول invites (مرة واحدة فقط)
+                cur = await self.conn.execute('SELECT 1 FROM invite_counts LIMIT 1')
+                if not await cur.fetchone():
+                    await self.conn.execute('''
+                        INSERT INTO invite_counts (guild_id, inviter_id, count)
+                        SELECT guild_id, inviter_id, COUNT(*) FROM invites
+                        WHERE inviter_id IS NOT NULL
+                        GROUP BY guild_id, inviter_id
+                    ''')
+
                 await self.conn.execute('''
                     CREATE TABLE IF NOT EXISTS invite_rewards (
                         guild_id TEXT NOT NULL,
@@ -322,16 +720,58 @@ class Database:
                     )
                 ''')
 
-                # Stats
+                # نشاط القنوات الصوتية (تجميع ساعي)
+                # h0..h6: دقائق الساعة حسب عدد المتواجدين 0 | 1 | 2 | 3-4 | 5-9 | 10-24 | 25+
                 await self.conn.execute('''
-                    CREATE TABLE IF NOT EXISTS stats (
+                    CREATE TABLE IF NOT EXISTS voice_channel_hourly (
                         guild_id TEXT NOT NULL,
-                        date TEXT NOT NULL,
-                        messages INTEGER DEFAULT 0,
+                        channel_id TEXT NOT NULL,
+                        hour TEXT NOT NULL,
+                        peak INTEGER DEFAULT 0,
+                        occupant_minutes INTEGER DEFAULT 0,
+                        active_minutes INTEGER DEFAULT 0,
                         joins INTEGER DEFAULT 0,
                         leaves INTEGER DEFAULT 0,
-                        voice_minutes INTEGER DEFAULT 0,
-                        PRIMARY KEY (guild_id, date)
+                        h0 INTEGER DEFAULT 0, h1 INTEGER DEFAULT 0, h2 INTEGER DEFAULT 0,
+                        h3 INTEGER DEFAULT 0, h4 INTEGER DEFAULT 0, h5 INTEGER DEFAULT 0,
+                        h6 INTEGER DEFAULT 0,
+                        PRIMARY KEY (guild_id, channel_id, hour)
+                    )
+                ''')
+                await self.conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_voice_hourly_guild
+                    ON voice_channel_hourly (guild_id, hour)
+                ''')
+
+                # الاختصارات المخصصة لكل سيرفر
+                await self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS custom_aliases (
+                        guild_id TEXT NOT NULL,
+                        alias TEXT NOT NULL,
+                        command TEXT NOT NULL,
+                        created_by TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (guild_id, alias)
+                    )
+                ''')
+
+                # مدة الاحتفاظ بالسجلات لكل سيرفر (بالأيام، 0 = بدون حذف)
+                await self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS log_retention (
+                        guild_id TEXT PRIMARY KEY,
+                        days INTEGER NOT NULL
+                    )
+                ''')
+
+                # علامات التصدير التراكمي (آخر rowid أو تاريخ صُدّر لكل مهمة)
+                await self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS export_watermarks (
+                        job TEXT NOT NULL,
+                        table_name TEXT NOT NULL,
+                        guild_id TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (job, table_name, guild_id)
                     )
                 ''')
 
@@ -355,44 +795,11 @@ class Database:
                 bot_logger.exception('❌ Failed creating tables', e)
                 raise
 
-    # ==================== Raw Helpers ====================
-
-    async def execute(self, sql: str, params: tuple = ()):
-        """تنفيذ SQL"""
-        if not self.conn:
-            raise RuntimeError('DB not connected')
-        async with self._lock:
-            try:
-                cur = await self.conn.execute(sql, params)
-                await self.conn.commit()
-                return cur
-            except Exception as e:
-                bot_logger.database_error('execute', str(e))
-                raise
-
-    async def fetchone(self, sql: str, params: tuple = ()):
-        """جلب صف واحد"""
-        if not self.conn:
-            raise RuntimeError('DB not connected')
-        async with self._lock:
-            cur = await self.conn.execute(sql, params)
-            row = await cur.fetchone()
-            return dict(row) if row else None
-
-    async def fetchall(self, sql: str, params: tuple = ()):
-        """جلب جميع الصفوف"""
-        if not self.conn:
-            raise RuntimeError('DB not connected')
-        async with self._lock:
-            cur = await self.conn.execute(sql, params)
-            rows = await cur.fetchall()
-            return [dict(r) for r in rows]
-
     # ==================== Settings ====================
 
-    async def get_settings(self, guild_id: str) -> Optional[Dict]:
+    async def get_settings(self, guild_id: str) -> Optional[Record]:
         try:
-            return await self.fetchone('SELECT * FROM settings WHERE guild_id = ?', (guild_id,))
+            return await self.fetch_record('settings', 'SELECT * FROM settings WHERE guild_id = ?', (guild_id,))
         except Exception as e:
             bot_logger.database_error('get_settings', str(e))
             return None
@@ -458,35 +865,207 @@ class Database:
         except Exception as e:
             bot_logger.database_error('update_ticket_v2', str(e))
 
-    async def get_ticket_v2(self, channel_id: str) -> Optional[Dict]:
+    async def get_ticket_v2(self, channel_id: str) -> Optional[Record]:
         """جلب تكت V2"""
         try:
-            return await self.fetchone('SELECT * FROM tickets_v2 WHERE channel_id = ?', (channel_id,))
+            return await self.fetch_record('tickets_v2', 'SELECT * FROM tickets_v2 WHERE channel_id = ?', (channel_id,))
         except Exception:
             return None
 
-    async def get_ticket_by_id_v2(self, ticket_id: int) -> Optional[Dict]:
+    async def get_ticket_by_id_v2(self, ticket_id: int) -> Optional[Record]:
         """جلب تكت بالـ ID"""
         try:
-            return await self.fetchone('SELECT * FROM tickets_v2 WHERE ticket_id = ?', (ticket_id,))
+            return await self.fetch_record('tickets_v2', 'SELECT * FROM tickets_v2 WHERE ticket_id = ?', (ticket_id,))
         except Exception:
             return None
 
-    async def list_tickets_v2(self, guild_id: str, status: Optional[str] = None) -> List[Dict]:
+    async def list_tickets_v2(self, guild_id: str, status: Optional[str] = None) -> List[Record]:
         """قائمة التكتات"""
         try:
             if status:
-                return await self.fetchall(
+                return await self.fetch_records(
+                    'tickets_v2',
                     'SELECT * FROM tickets_v2 WHERE guild_id = ? AND status = ? ORDER BY created_at DESC',
                     (guild_id, status)
                 )
-            return await self.fetchall(
+            return await self.fetch_records(
+                'tickets_v2',
                 'SELECT * FROM tickets_v2 WHERE guild_id = ? ORDER BY created_at DESC',
                 (guild_id,)
             )
         except Exception:
             return []
 
+    # ==================== ✅ TICKET EVENTS ====================
+
+    async def add_ticket_event(
+        self,
+        ticket_id: int,
+        event_type: str,
+        actor_id: Optional[str] = None,
+        value: Any = None,
+        channel_id: Optional[str] = None,
+        guild_id: Optional[str] = None
+    ) -> int:
+        """إضافة حدث للتكت (append-only، بدون read-modify-write)"""
+        try:
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False)
+            elif value is not None:
+                value = str(value)
+            cur = await self.execute(
+                'INSERT INTO ticket_events (ticket_id, channel_id, guild_id, event_type, actor_id, value, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (ticket_id, channel_id, guild_id, event_type, actor_id, value, datetime.now().isoformat())
+            )
+            return getattr(cur, 'lastrowid', 0) or 0
+        except Exception as e:
+            bot_logger.database_error('add_ticket_event', str(e))
+            return 0
+
+    async def get_ticket_timeline(self, ticket_id: int, event_type: Optional[str] = None) -> List[Dict]:
+        """الخط الزمني لأحداث التكت (مرتب حسب الإضافة)"""
+        try:
+            if event_type:
+                return await self.fetchall(
+                    'SELECT * FROM ticket_events WHERE ticket_id = ? AND event_type = ? ORDER BY id ASC',
+                    (ticket_id, event_type)
+                )
+            return await self.fetchall(
+                'SELECT * FROM ticket_events WHERE ticket_id = ? ORDER BY id ASC',
+                (ticket_id,)
+            )
+        except Exception as e:
+            bot_logger.database_error('get_ticket_timeline', str(e))
+            return []
+
+    async def get_ticket_notes(self, ticket_id: int) -> List[Dict]:
+        """ملاحظات التكت (من جدول الأحداث + الملاحظات القديمة المخزنة كـ JSON)"""
+        notes = []
+        try:
+            legacy = await self.fetchone('SELECT notes FROM tickets_v2 WHERE ticket_id = ?', (ticket_id,))
+            if legacy and legacy.get('notes'):
+                try:
+                    notes.extend(json.loads(legacy['notes']))
+                except Exception:
+                    pass
+        except Exception:
+            pass
+        for ev in await self.get_ticket_timeline(ticket_id, 'note'):
+            notes.append({'author_id': ev['actor_id'], 'content': ev['value'], 'timestamp': ev['created_at']})
+        return notes
+
+    async def get_ticket_activity(self, ticket_ids: List[int]) -> Dict[int, Dict]:
+        """
+        آخر نشاط وأول رد لكل تكت من جدول الأحداث (لاستعادة التكتات بعد إعادة التشغيل)
+
+        Returns:
+            {ticket_id: {'last_event_at': str, 'first_response_at': str | None}}
+        """
+        activity: Dict[int, Dict] = {}
+        try:
+            for i in range(0, len(ticket_ids), 500):
+                chunk = ticket_ids[i:i + 500]
+                rows = await self.fetchall(
+                    'SELECT ticket_id, MAX(created_at) AS last_event_at, '
+                    "MIN(CASE WHEN event_type = 'first_response' THEN created_at END) AS first_response_at "
+                    f'FROM ticket_events WHERE ticket_id IN ({",".join("?" * len(chunk))}) GROUP BY ticket_id',
+                    tuple(chunk)
+                )
+                activity.update({row['ticket_id']: row for row in rows})
+        except Exception as e:
+            bot_logger.database_error('get_ticket_activity', str(e))
+        return activity
+
+    # ==================== ✅ TICKET SLA ====================
+
+    async def record_ticket_sla(
+        self,
+        guild_id: str,
+        metric: str,
+        value: float,
+        bucket: int,
+        category_id: Optional[str] = None,
+        staff_id: Optional[str] = None
+    ):
+        """تحديث مجاميع SLA (guild/category/staff + اليومي) في transaction واحدة"""
+        scopes = [('guild', guild_id)]
+        if category_id:
+            scopes.append(('category', category_id))
+        if staff_id:
+            scopes.append(('staff', staff_id))
+        today = datetime.now().strftime('%Y-%m-%d')
+        try:
+            async with self.transaction('record_ticket_sla') as conn:
+                await conn.executemany('''
+                    INSERT INTO ticket_sla_stats (guild_id, scope, scope_id, metric, bucket, count, total)
+                    VALUES (?, ?, ?, ?, ?, 1, ?)
+                    ON CONFLICT(guild_id, scope, scope_id, metric, bucket) DO UPDATE SET
+                        count = count + 1,
+                        total = total + excluded.total
+                ''', [(guild_id, scope, scope_id, metric, bucket, value) for scope, scope_id in scopes])
+                await conn.execute('''
+                    INSERT INTO ticket_sla_daily (guild_id, date, metric, count, total)
+                    VALUES (?, ?, ?, 1, ?)
+                    ON CONFLICT(guild_id, date, metric) DO UPDATE SET
+                        count = count + 1,
+                        total = total + excluded.total
+                ''', (guild_id, today, metric, value))
+        except Exception as e:
+            bot_logger.database_error('record_ticket_sla', str(e))
+
+    async def get_ticket_sla(self, guild_id: str, scope: str = 'guild', scope_id: Optional[str] = None) -> Dict[str, Dict]:
+        """
+        قراءة مجاميع SLA
+
+        Returns:
+            {metric: {'count', 'total', 'avg', 'histogram': {bucket: count}}}
+        """
+        try:
+            rows = await self.fetchall(
+                'SELECT metric, bucket, count, total FROM ticket_sla_stats WHERE guild_id = ? AND scope = ? AND scope_id = ?',
+                (guild_id, scope, scope_id or guild_id)
+            )
+        except Exception as e:
+            bot_logger.database_error('get_ticket_sla', str(e))
+            return {}
+        out: Dict[str, Dict] = {}
+        for r in rows:
+            m = out.setdefault(r['metric'], {'count': 0, 'total': 0.0, 'avg': 0.0, 'histogram': {}})
+            m['count'] += r['count']
+            m['total'] += r['total']
+            m['histogram'][r['bucket']] = r['count']
+        for m in out.values():
+            m['avg'] = m['total'] / m['count'] if m['count'] else 0.0
+        return out
+
+    async def get_ticket_sla_staff(self, guild_id: str, metric: str, limit: int = 10) -> List[Dict]:
+        """ترتيب الطاقم حسب مقياس معين (الأكثر عدداً)"""
+        try:
+            return await self.fetchall('''
+                SELECT scope_id AS staff_id, SUM(count) AS count, SUM(total) AS total
+                FROM ticket_sla_stats
+                WHERE guild_id = ? AND scope = 'staff' AND metric = ?
+                GROUP BY scope_id
+                ORDER BY count DESC
+                LIMIT ?
+            ''', (guild_id, metric, limit))
+        except Exception as e:
+            bot_logger.database_error('get_ticket_sla_staff', str(e))
+            return []
+
+    async def get_ticket_sla_daily(self, guild_id: str, days: int = 30) -> List[Dict]:
+        """التجميعات اليومية (للرسوم البيانية)"""
+        try:
+            since = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+            return await self.fetchall(
+                'SELECT date, metric, count, total FROM ticket_sla_daily WHERE guild_id = ? AND date >= ? ORDER BY date ASC',
+                (guild_id, since)
+            )
+        except Exception as e:
+            bot_logger.database_error('get_ticket_sla_daily', str(e))
+            return []
+
     # ==================== ✅ TICKET CATEGORIES ====================
 
     async def save_ticket_category(self, guild_id: str, category_id: str, data: dict):
@@ -582,36 +1161,41 @@ class Database:
 
     async def add_warning(self, guild_id: str, user_id: str, moderator_id: str, reason: str = None) -> int:
         try:
-            cur = await self.execute(
-                'INSERT INTO warnings (guild_id, user_id, moderator_id, reason) VALUES (?, ?, ?, ?)',
-                (guild_id, user_id, moderator_id, reason)
-            )
-            return getattr(cur, 'lastrowid', 0) or 0
+            async with self.for_guild(guild_id) as store:
+                cur = await store.execute(
+                    'INSERT INTO warnings (guild_id, user_id, moderator_id, reason) VALUES (?, ?, ?, ?)',
+                    (guild_id, user_id, moderator_id, reason)
+                )
+                return getattr(cur, 'lastrowid', 0) or 0
         except Exception:
             return 0
 
-    async def get_warnings(self, guild_id: str, user_id: str) -> List[Dict]:
+    async def get_warnings(self, guild_id: str, user_id: str) -> List[Record]:
         try:
-            return await self.fetchall(
-                'SELECT * FROM warnings WHERE guild_id = ? AND user_id = ? ORDER BY created_at DESC',
-                (guild_id, user_id)
-            )
+            async with self.for_guild(guild_id) as store:
+                return await store.fetch_records(
+                    'warnings',
+                    'SELECT * FROM warnings WHERE guild_id = ? AND user_id = ? ORDER BY created_at DESC',
+                    (guild_id, user_id)
+                )
         except Exception:
             return []
 
     async def clear_warnings(self, guild_id: str, user_id: str):
         try:
-            await self.execute('DELETE FROM warnings WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+            async with self.for_guild(guild_id) as store:
+                await store.execute('DELETE FROM warnings WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
         except Exception as e:
             bot_logger.database_error('clear_warnings', str(e))
 
     async def get_warning_count(self, guild_id: str, user_id: str) -> int:
         try:
-            row = await self.fetchone(
-                'SELECT COUNT(*) as cnt FROM warnings WHERE guild_id = ? AND user_id = ?',
-                (guild_id, user_id)
-            )
-            return row['cnt'] if row else 0
+            async with self.for_guild(guild_id) as store:
+                row = await store.fetchone(
+                    'SELECT COUNT(*) as cnt FROM warnings WHERE guild_id = ? AND user_id = ?',
+                    (guild_id, user_id)
+                )
+                return row['cnt'] if row else 0
         except Exception:
             return 0
 
@@ -619,63 +1203,53 @@ class Database:
 
     async def create_ticket(self, channel_id: str, guild_id: str, opener_id: str, reason: str = None):
         try:
-            await self.execute(
-                'INSERT INTO tickets (channel_id, guild_id, opener_id, reason) VALUES (?, ?, ?, ?)',
-                (channel_id, guild_id, opener_id, reason)
-            )
+            async with self.for_guild(guild_id) as store:
+                await store.execute(
+                    'INSERT INTO tickets (channel_id, guild_id, opener_id, reason) VALUES (?, ?, ?, ?)',
+                    (channel_id, guild_id, opener_id, reason)
+                )
         except Exception as e:
             bot_logger.database_error('create_ticket', str(e))
 
-    async def get_ticket(self, channel_id: str) -> Optional[Dict]:
+    async def get_ticket(self, channel_id: str, guild_id: str) -> Optional[Dict]:
         try:
-            return await self.fetchone('SELECT * FROM tickets WHERE channel_id = ?', (channel_id,))
+            async with self.for_guild(guild_id) as store:
+                return await store.fetchone('SELECT * FROM tickets WHERE channel_id = ?', (channel_id,))
         except Exception:
             return None
 
-    async def close_ticket(self, channel_id: str, closed_by: str):
+    async def close_ticket(self, channel_id: str, closed_by: str, guild_id: str):
         try:
-            await self.execute(
-                'UPDATE tickets SET status = ?, closed_at = ?, closed_by = ? WHERE channel_id = ?',
-                ('closed', datetime.now().isoformat(), closed_by, channel_id)
-            )
+            async with self.for_guild(guild_id) as store:
+                await store.execute(
+                    'UPDATE tickets SET status = ?, closed_at = ?, closed_by = ? WHERE channel_id = ?',
+                    ('closed', datetime.now().isoformat(), closed_by, channel_id)
+                )
         except Exception as e:
             bot_logger.database_error('close_ticket', str(e))
 
     # ==================== Leveling ====================
 
     async def add_xp(self, guild_id: str, user_id: str, xp: int) -> Dict:
-        try:
-            row = await self.fetchone('SELECT * FROM levels WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
-            if row:
-                data = dict(row)
-                new_xp = data.get('xp', 0) + xp
-                old_level = data.get('level', 0)
-                new_level = int(new_xp ** 0.5) // 10
-                new_messages = data.get('messages', 0) + 1
-                await self.execute(
-                    'UPDATE levels SET xp = ?, level = ?, messages = ?, last_xp_time = ? WHERE guild_id = ? AND user_id = ?',
-                    (new_xp, new_level, new_messages, datetime.now().isoformat(), guild_id, user_id)
-                )
-                return {'xp': new_xp, 'level': new_level, 'old_level': old_level, 'leveled_up': new_level > old_level}
-            else:
-                await self.execute(
-                    'INSERT INTO levels (guild_id, user_id, xp, level, messages, last_xp_time) VALUES (?, ?, ?, ?, ?, ?)',
-                    (guild_id, user_id, xp, 0, 1, datetime.now().isoformat())
-                )
-                return {'xp': xp, 'level': 0, 'old_level': 0, 'leveled_up': False}
-        except Exception as e:
-            bot_logger.database_error('add_xp', str(e))
-            return {'xp': 0, 'level': 0, 'old_level': 0, 'leveled_up': False}
+        """إضافة XP (يمر عبر نظام المستويات ليستخدم منحنى السيرفر نفسه)"""
+        from system_leveling import leveling_system
+        return await leveling_system.add_xp(guild_id, user_id, xp)
 
-    async def get_level(self, guild_id: str, user_id: str) -> Optional[Dict]:
+    async def get_level(self, guild_id: str, user_id: str) -> Optional[Record]:
         try:
-            return await self.fetchone('SELECT * FROM levels WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+            async with self.for_guild(guild_id) as store:
+                return await store.fetch_record('levels', 'SELECT * FROM levels WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
         except Exception:
             return None
 
-    async def get_leaderboard(self, guild_id: str, limit: int = 10) -> List[Dict]:
+    async def get_leaderboard(self, guild_id: str, limit: int = 10) -> List[Record]:
         try:
-            return await self.fetchall('SELECT * FROM levels WHERE guild_id = ? ORDER BY xp DESC LIMIT ?', (guild_id, limit))
+            async with self.for_guild(guild_id) as store:
+                return await store.fetch_records(
+                    'levels',
+                    'SELECT * FROM levels WHERE guild_id = ? ORDER BY xp DESC, user_id ASC LIMIT ?',
+                    (guild_id, limit)
+                )
         except Exception:
             return []
 
@@ -693,42 +1267,46 @@ class Database:
         channels: Optional[str] = None
     ) -> int:
         try:
-            cur = await self.execute(
-                'INSERT INTO autoresponses (guild_id, trigger, response, trigger_type, enabled, chance, cooldown, channels) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-                (guild_id, trigger, response, trigger_type, enabled, chance, cooldown, channels)
-            )
-            return getattr(cur, 'lastrowid', 0) or 0
+            async with self.for_guild(guild_id) as store:
+                cur = await store.execute(
+                    'INSERT INTO autoresponses (guild_id, trigger, response, trigger_type, enabled, chance, cooldown, channels) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (guild_id, trigger, response, trigger_type, enabled, chance, cooldown, channels)
+                )
+                return getattr(cur, 'lastrowid', 0) or 0
         except Exception as e:
             bot_logger.database_error('add_autoresponse', str(e))
             return 0
 
-    async def get_autoresponses(self, guild_id: str) -> List[Dict]:
+    async def get_autoresponses(self, guild_id: str) -> List[Record]:
         try:
-            return await self.fetchall('SELECT * FROM autoresponses WHERE guild_id = ? ORDER BY id ASC', (guild_id,))
+            async with self.for_guild(guild_id) as store:
+                return await store.fetch_records('autoresponses', 'SELECT * FROM autoresponses WHERE guild_id = ? ORDER BY id ASC', (guild_id,))
         except Exception:
             return []
 
-    async def remove_autoresponse(self, ar_id: int) -> bool:
+    async def remove_autoresponse(self, ar_id: int, guild_id: str) -> bool:
         try:
-            await self.execute('DELETE FROM autoresponses WHERE id = ?', (ar_id,))
-            return True
+            async with self.for_guild(guild_id) as store:
+                await store.execute('DELETE FROM autoresponses WHERE id = ?', (ar_id,))
+                return True
         except Exception:
             return False
 
-    async def toggle_autoresponse(self, ar_id: int) -> bool:
+    async def toggle_autoresponse(self, ar_id: int, guild_id: str) -> bool:
         try:
-            row = await self.fetchone('SELECT enabled FROM autoresponses WHERE id = ?', (ar_id,))
-            if not row:
-                return False
-            current = row['enabled']
-            new = 0 if (current == 1 or current is True) else 1
-            await self.execute('UPDATE autoresponses SET enabled = ? WHERE id = ?', (new, ar_id))
-            return bool(new)
+            async with self.for_guild(guild_id) as store:
+                row = await store.fetchone('SELECT enabled FROM autoresponses WHERE id = ?', (ar_id,))
+                if not row:
+                    return False
+                current = row['enabled']
+                new = 0 if (current == 1 or current is True) else 1
+                await store.execute('UPDATE autoresponses SET enabled = ? WHERE id = ?', (new, ar_id))
+                return bool(new)
         except Exception as e:
             bot_logger.database_error('toggle_autoresponse', str(e))
             return False
 
-    async def update_autoresponse(self, ar_id: int, **fields) -> bool:
+    async def update_autoresponse(self, ar_id: int, guild_id: str, **fields) -> bool:
         allowed = {'trigger', 'response', 'trigger_type', 'enabled', 'chance', 'cooldown', 'channels', 'last_used'}
         updates = []
         params = []
@@ -741,32 +1319,36 @@ class Database:
         params.append(ar_id)
         sql = f"UPDATE autoresponses SET {', '.join(updates)} WHERE id = ?"
         try:
-            await self.execute(sql, tuple(params))
-            return True
+            async with self.for_guild(guild_id) as store:
+                await store.execute(sql, tuple(params))
+                return True
         except Exception as e:
             bot_logger.database_error('update_autoresponse', str(e))
             return False
 
-    async def search_autoresponses(self, guild_id: str, query: str) -> List[Dict]:
+    async def search_autoresponses(self, guild_id: str, query: str) -> List[Record]:
         try:
-            q = f"%{query}%"
-            return await self.fetchall(
-                'SELECT * FROM autoresponses WHERE guild_id = ? AND (trigger LIKE ? OR response LIKE ?) ORDER BY id ASC',
-                (guild_id, q, q)
-            )
+            async with self.for_guild(guild_id) as store:
+                q = f"%{query}%"
+                return await store.fetch_records(
+                    'autoresponses',
+                    'SELECT * FROM autoresponses WHERE guild_id = ? AND (trigger LIKE ? OR response LIKE ?) ORDER BY id ASC',
+                    (guild_id, q, q)
+                )
         except Exception:
             return []
 
     async def get_autoresponse_stats(self, guild_id: str) -> Dict[str, Any]:
         try:
-            total_row = await self.fetchone('SELECT COUNT(*) as cnt FROM autoresponses WHERE guild_id = ?', (guild_id,))
-            enabled_row = await self.fetchone('SELECT COUNT(*) as cnt FROM autoresponses WHERE guild_id = ? AND enabled = 1', (guild_id,))
-            total = total_row['cnt'] if total_row else 0
-            enabled = enabled_row['cnt'] if enabled_row else 0
-            disabled = total - enabled
-            rows = await self.fetchall('SELECT trigger_type, COUNT(*) as cnt FROM autoresponses WHERE guild_id = ? GROUP BY trigger_type', (guild_id,))
-            by_type = {r['trigger_type']: r['cnt'] for r in rows} if rows else {}
-            return {'total': total, 'enabled': enabled, 'disabled': disabled, 'by_type': by_type}
+            async with self.for_guild(guild_id) as store:
+                total_row = await store.fetchone('SELECT COUNT(*) as cnt FROM autoresponses WHERE guild_id = ?', (guild_id,))
+                enabled_row = await store.fetchone('SELECT COUNT(*) as cnt FROM autoresponses WHERE guild_id = ? AND enabled = 1', (guild_id,))
+                total = total_row['cnt'] if total_row else 0
+                enabled = enabled_row['cnt'] if enabled_row else 0
+                disabled = total - enabled
+                rows = await store.fetchall('SELECT trigger_type, COUNT(*) as cnt FROM autoresponses WHERE guild_id = ? GROUP BY trigger_type', (guild_id,))
+                by_type = {r['trigger_type']: r['cnt'] for r in rows} if rows else {}
+                return {'total': total, 'enabled': enabled, 'disabled': disabled, 'by_type': by_type}
         except Exception as e:
             bot_logger.database_error('get_autoresponse_stats', str(e))
             return {'total': 0, 'enabled': 0, 'disabled': 0, 'by_type': {}}
@@ -839,11 +1421,50 @@ class Database:
 
     # ==================== Invites ====================
 
-    async def record_invite(self, guild_id: str, user_id: str, inviter_id: Optional[str] = None):
+    async def record_invite(self, guild_id: str, user_id: str, inviter_id: Optional[str] = None) -> int:
+        """تسجيل دعوة + تحديث invite_counts في transaction واحدة، ويعيد العدد الجديد للداعي"""
         try:
-            await self.execute('INSERT INTO invites (guild_id, user_id, inviter_id) VALUES (?, ?, ?)', (guild_id, user_id, inviter_id))
+            async with self.transaction('record_invite') as conn:
+                await conn.execute(
+                    'INSERT INTO invites (guild_id, user_id, inviter_id, created_at) VALUES (?, ?, ?, ?)',
+                    (guild_id, user_id, inviter_id, datetime.now().isoformat())
+                )
+                count = 0
+                if inviter_id:
+                    await conn.execute('''
+                        INSERT INTO invite_counts (guild_id, inviter_id, count) VALUES (?, ?, 1)
+                        ON CONFLICT(guild_id, inviter_id) DO UPDATE SET count = count + 1
+                    ''', (guild_id, inviter_id))
+                    cur = await conn.execute(
+                        'SELECT count FROM invite_counts WHERE guild_id = ? AND inviter_id = ?',
+                        (guild_id, inviter_id)
+                    )
+                    row = await cur.fetchone()
+                    count = row[0] if row else 0
+            return count
         except Exception as e:
             bot_logger.database_error('record_invite', str(e))
+            return 0
+
+    async def get_invite_count(self, guild_id: str, inviter_id: str) -> int:
+        try:
+            row = await self.fetchone(
+                'SELECT count FROM invite_counts WHERE guild_id = ? AND inviter_id = ?',
+                (guild_id, inviter_id)
+            )
+            return row['count'] if row else 0
+        except Exception:
+            return 0
+
+    async def get_invite_counts_top(self, guild_id: str, limit: int = 10) -> List[Record]:
+        try:
+            return await self.fetch_records(
+                'invite_counts',
+                'SELECT inviter_id, count FROM invite_counts WHERE guild_id = ? AND count > 0 ORDER BY count DESC LIMIT ?',
+                (guild_id, limit)
+            )
+        except Exception:
+            return []
 
     async def get_invites(self, guild_id: str) -> List[Dict]:
         try:
@@ -865,25 +1486,117 @@ class Database:
 
     # ==================== Stats ====================
 
+    def bump_stats_version(self, guild_id: str):
+        """تسجيل تغيّر إحصائيات السيرفر"""
+        self.stats_versions[guild_id] = self.stats_versions.get(guild_id, 0) + 1
+
+    def touch_stats_day(self, guild_id: str, day: str):
+        """
+        عدادات اليوم (رسائل، انضمامات، دقائق صوت) ترفع الإصدار عند بداية يوم جديد فقط
+
+        رفعه مع كل رسالة يُبطل كاش المخططات باستمرار في السيرفرات النشطة؛
+        تأخر أرقام اليوم الحالي محدود بمدة صلاحية الكاش (CHART_CACHE_TTL).
+        """
+        if self.stats_days.get(guild_id) != day:
+            self.stats_days[guild_id] = day
+            self.bump_stats_version(guild_id)
+
+    def stats_version(self, guild_id: str) -> int:
+        return self.stats_versions.get(guild_id, 0)
+
     async def increment_stat(self, guild_id: str, stat_name: str, amount: int = 1):
         try:
-            today = datetime.now().strftime('%Y-%m-%d')
-            row = await self.fetchone('SELECT * FROM stats WHERE guild_id = ? AND date = ?', (guild_id, today))
-            if row:
-                await self.execute(f'UPDATE stats SET {stat_name} = {stat_name} + ? WHERE guild_id = ? AND date = ?', (amount, guild_id, today))
-            else:
-                await self.execute(f'INSERT INTO stats (guild_id, date, {stat_name}) VALUES (?, ?, ?)', (guild_id, today, amount))
+            async with self.for_guild(guild_id) as store:
+                today = datetime.now().strftime('%Y-%m-%d')
+                self.touch_stats_day(guild_id, today)
+                # جملة واحدة تحت القفل (بدل SELECT ثم INSERT/UPDATE)
+                await store.execute(
+                    f'INSERT INTO stats (guild_id, date, {stat_name}) VALUES (?, ?, ?) '
+                    f'ON CONFLICT(guild_id, date) DO UPDATE SET {stat_name} = {stat_name} + excluded.{stat_name}',
+                    (guild_id, today, amount)
+                )
         except Exception as e:
             bot_logger.database_error('increment_stat', str(e))
 
     async def get_stats(self, guild_id: str, days: int = 7) -> List[Dict]:
         try:
-            rows = await self.fetchall('SELECT date, messages, joins, leaves, voice_minutes FROM stats WHERE guild_id = ? ORDER BY date DESC LIMIT ?', (guild_id, days))
-            return list(reversed(rows))
+            async with self.for_guild(guild_id) as store:
+                rows = await store.fetchall('SELECT date, messages, joins, leaves, voice_minutes FROM stats WHERE guild_id = ? ORDER BY date DESC LIMIT ?', (guild_id, days))
+                return list(reversed(rows))
         except Exception as e:
             bot_logger.database_error('get_stats', str(e))
             return []
 
+    async def add_voice_hourly(self, rows: List[tuple]):
+        """
+        حفظ ملخصات الساعات للقنوات الصوتية
+
+        rows: (guild_id, channel_id, hour, peak, occupant_minutes, active_minutes,
+               joins, leaves, h0..h6). الساعة الجزئية (عند الإيقاف) تُدمج مع الموجود.
+        """
+        try:
+            async with self.transaction('add_voice_hourly') as conn:
+                await conn.executemany('''
+                    INSERT INTO voice_channel_hourly (
+                        guild_id, channel_id, hour, peak, occupant_minutes, active_minutes,
+                        joins, leaves, h0, h1, h2, h3, h4, h5, h6
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(guild_id, channel_id, hour) DO UPDATE SET
+                        peak = MAX(peak, excluded.peak),
+                        occupant_minutes = occupant_minutes + excluded.occupant_minutes,
+                        active_minutes = active_minutes + excluded.active_minutes,
+                        joins = joins + excluded.joins,
+                        leaves = leaves + excluded.leaves,
+                        h0 = h0 + excluded.h0, h1 = h1 + excluded.h1, h2 = h2 + excluded.h2,
+                        h3 = h3 + excluded.h3, h4 = h4 + excluded.h4, h5 = h5 + excluded.h5,
+                        h6 = h6 + excluded.h6
+                ''', rows)
+            for guild_id in {row[0] for row in rows}:
+                self.bump_stats_version(guild_id)
+        except Exception as e:
+            bot_logger.database_error('add_voice_hourly', str(e))
+
+    async def get_voice_hourly(self, guild_id: str, days: int = 7) -> List[Dict]:
+        try:
+            since = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:00')
+            return await self.fetchall(
+                'SELECT * FROM voice_channel_hourly WHERE guild_id = ? AND hour >= ? ORDER BY hour',
+                (guild_id, since)
+            )
+        except Exception as e:
+            bot_logger.database_error('get_voice_hourly', str(e))
+            return []
+
+    # ==================== Custom Aliases ====================
+
+    async def add_custom_alias(self, guild_id: str, alias: str, command: str, created_by: Optional[str] = None) -> bool:
+        try:
+            await self.execute(
+                'INSERT OR REPLACE INTO custom_aliases (guild_id, alias, command, created_by) VALUES (?, ?, ?, ?)',
+                (guild_id, alias, command, created_by)
+            )
+            return True
+        except Exception as e:
+            bot_logger.database_error('add_custom_alias', str(e))
+            return False
+
+    async def remove_custom_alias(self, guild_id: str, alias: str) -> bool:
+        try:
+            row = await self.fetchone('SELECT 1 FROM custom_aliases WHERE guild_id = ? AND alias = ?', (guild_id, alias))
+            if not row:
+                return False
+            await self.execute('DELETE FROM custom_aliases WHERE guild_id = ? AND alias = ?', (guild_id, alias))
+            return True
+        except Exception as e:
+            bot_logger.database_error('remove_custom_alias', str(e))
+            return False
+
+    async def get_custom_aliases(self, guild_id: str) -> List[Dict]:
+        try:
+            return await self.fetchall('SELECT * FROM custom_aliases WHERE guild_id = ? ORDER BY alias', (guild_id,))
+        except Exception:
+            return []
+
     # ==================== Logs ====================
 
     async def add_log(
@@ -896,13 +1609,32 @@ class Database:
         reason: Optional[str] = None,
         details: Optional[str] = None
     ):
+        try:
+            async with self.for_guild(guild_id) as store:
+                await store.execute(
+                    'INSERT INTO logs (guild_id, action_type, user_id, moderator_id, target_id, reason, details) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (guild_id, action_type, user_id, moderator_id, target_id, reason, details)
+                )
+        except Exception as e:
+            bot_logger.database_error('add_log', str(e))
+
+    async def set_log_retention(self, guild_id: str, days: int):
         try:
             await self.execute(
-                'INSERT INTO logs (guild_id, action_type, user_id, moderator_id, target_id, reason, details) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                (guild_id, action_type, user_id, moderator_id, target_id, reason, details)
+                'INSERT INTO log_retention (guild_id, days) VALUES (?, ?) '
+                'ON CONFLICT(guild_id) DO UPDATE SET days = excluded.days',
+                (guild_id, days)
             )
         except Exception as e:
-            bot_logger.database_error('add_log', str(e))
+            bot_logger.database_error('set_log_retention', str(e))
+
+    async def get_log_retentions(self) -> Dict[str, int]:
+        try:
+            rows = await self.fetchall('SELECT guild_id, days FROM log_retention')
+            return {row['guild_id']: row['days'] for row in rows}
+        except Exception as e:
+            bot_logger.database_error('get_log_retentions', str(e))
+            return {}
 
     # ==================== Blacklist ====================
 
@@ -923,4 +1655,26 @@ class Database:
 
 
 # Global instance
-db = Database()
\ No newline at end of file
+db = Database()
+
+# ==================== سطر الأوامر ====================
+
+async def _migrate_cli(args):
+    await db.connect()
+    try:
+        copied = await db.migrate_to_shards(args.mode, args.buckets, args.purge)
+        print(f'{sum(copied.values())} rows -> {len(copied)} shards in {SHARD_DIR}/')
+        print(f'Set DB_SHARD_MODE={args.mode}' + (f' DB_SHARD_BUCKETS={args.buckets}' if args.mode == 'bucket' else ''))
+    finally:
+        await db.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    # python database.py --mode bucket --buckets 16 [--purge]   (والبوت متوقف)
+    parser = argparse.ArgumentParser(description='تقسيم جداول السيرفرات من database.db إلى ملفات أقسام')
+    parser.add_argument('--mode', default='bucket', choices=['guild', 'bucket'])
+    parser.add_argument('--buckets', type=int, default=SHARD_BUCKETS)
+    parser.add_argument('--purge', action='store_true', help='حذف الصفوف المنقولة من database.db')
+    asyncio.run(_migrate_cli(parser.parse_args()))
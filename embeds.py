@@ -9,6 +9,7 @@ import discord
 from datetime import datetime
 from typing import Optional, List
 import helpers
+from system_census import member_census
 
 
 class Colors:
@@ -203,9 +204,10 @@ def server_info_embed(guild: discord.Guild) -> discord.Embed:
     embed.add_field(name='الـ ID', value=f'`{guild.id}`', inline=True)
     embed.add_field(name='المالك', value=guild.owner.mention if guild.owner else 'غير معروف', inline=True)
 
+    census = member_census.get(guild)
     total_members = guild.member_count
-    humans = sum(1 for m in guild.members if not m.bot)
-    bots = sum(1 for m in guild.members if m.bot)
+    humans = census.humans
+    bots = census.bots
 
     embed.add_field(name='الأعضاء', value=f'👥 {total_members}\n👤 {humans}\n🤖 {bots}', inline=True)
 
@@ -238,8 +240,8 @@ def level_up_embed(member: discord.Member, level: int) -> discord.Embed:
     return embed
 
 
-def rank_embed(member: discord.Member, data: dict, rank: int) -> discord.Embed:
-    """Embed رتبة العضو"""
+def rank_embed(member: discord.Member, data: dict, rank: int, curve: List[int] = None) -> discord.Embed:
+    """Embed رتبة العضو (curve: منحنى المستويات التراكمي للسيرفر)"""
     embed = discord.Embed(
         title=f'📊 رتبة {helpers.format_user(member)}',
         color=helpers.get_member_color(member),
@@ -256,9 +258,15 @@ def rank_embed(member: discord.Member, data: dict, rank: int) -> discord.Embed:
     embed.add_field(name='الترتيب', value=f'`#{rank}`', inline=True)
     embed.add_field(name='الرسائل', value=f'`{messages}`', inline=True)
 
-    # شريط التقدم (تقريبي)
-    next_level_xp = ((level + 1) * 10) ** 2
-    current_level_xp = (level * 10) ** 2
+    # شريط التقدم (من منحنى السيرفر إن توفر)
+    if curve and level + 1 < len(curve):
+        next_level_xp = curve[level + 1]
+        current_level_xp = curve[level]
+    elif curve:
+        next_level_xp = current_level_xp = curve[-1]
+    else:
+        next_level_xp = ((level + 1) * 10) ** 2
+        current_level_xp = (level * 10) ** 2
     xp_progress = xp - current_level_xp
     xp_total = next_level_xp - current_level_xp
     xp_needed = xp_total - xp_progress
@@ -20,6 +20,7 @@ import discord
 from system_autoresponse import autoresponse_system
 from system_leveling import leveling_system
 from system_protection import protection_system
+from system_tickets import ticket_system
 from database import db
 from logger import bot_logger
 from config_manager import config
@@ -94,6 +95,14 @@ async def process_message(message: discord.Message):
             bot_logger.error(f'❌ خطأ في نظام الحماية: {e}')
             # نكمل حتى لو فشلت الحماية
         
+        # ==================== 🎫 التكتات (النشاط + أول رد) ====================
+        
+        try:
+            await ticket_system.handle_message(message)
+        
+        except Exception as e:
+            bot_logger.error(f'❌ خطأ في تتبع التكتات: {e}')
+        
         # ==================== 3️⃣ نظام المستويات ====================
         
         try:
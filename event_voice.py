@@ -5,16 +5,12 @@
 ✅ تم تحسين error handling
 """
 import discord
-from datetime import datetime
-from collections import defaultdict
-from database import db
 from event_logs import send_log
+from system_leveling import leveling_system
+from system_voice_activity import voice_activity
 import embeds
 from logger import bot_logger
 
-# تخزين أوقات الانضمام
-voice_times = defaultdict(dict)  # {guild_id: {user_id: join_time}}
-
 async def handle_voice_state_update(member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
     """معالجة تحديثات الحالة الصوتية"""
     try:
@@ -22,28 +18,19 @@ async def handle_voice_state_update(member: discord.Member, before: discord.Voic
         if not member or not member.guild:
             return
 
-        guild_id = str(member.guild.id)
-        user_id = str(member.id)
+        # الجلسة (الوقت و XP يُحتسبان دورياً في نظام المستويات)
+        minutes = await leveling_system.handle_voice_update(member, before, after)
+
+        # السلسلة الزمنية للقنوات
+        voice_activity.handle_voice_update(member, before, after)
 
         # انضمام لقناة صوتية
         if before.channel is None and after.channel is not None:
-            voice_times[guild_id][user_id] = datetime.now()
             await log_voice_join(member, after.channel)
 
         # مغادرة قناة صوتية
         elif before.channel is not None and after.channel is None:
-            if user_id in voice_times[guild_id]:
-                join_time = voice_times[guild_id].pop(user_id)
-                duration = (datetime.now() - join_time).total_seconds()
-                minutes = int(duration / 60)
-
-                # تحديث الإحصائيات
-                try:
-                    await db.increment_stat(guild_id, 'voice_minutes', minutes)
-                except Exception as e:
-                    bot_logger.error(f'خطأ في تحديث إحصائيات الصوت: {e}')
-
-                await log_voice_leave(member, before.channel, minutes)
+            await log_voice_leave(member, before.channel, minutes)
 
         # الانتقال بين القنوات
         elif before.channel != after.channel and before.channel is not None and after.channel is not None:
@@ -34,6 +34,13 @@ async def handle_member_join(member: discord.Member):
                     bot_logger.debug(f'خطأ في الحصول على invite_count لـ {inviter}: {e}')
                     invite_count = None
 
+                # مكافآت الدعوات (bisect على قائمة مكافآت مخزنة بالذاكرة)
+                if invite_count and isinstance(inviter, discord.Member):
+                    try:
+                        await invite_rewards.check_rewards(member.guild, inviter, invite_count)
+                    except Exception as e:
+                        bot_logger.debug(f'خطأ في check_rewards لـ {inviter}: {e}')
+
                 bot_logger.info(
                     f'Invite tracker: {member.name} انضم بواسطه {inviter} (count={invite_count})'
                 )
@@ -0,0 +1,211 @@
+"""
+expiring_map.py - خريطة بمدة صلاحية
+====================================
+dict بمدة صلاحية (TTL) على الوقت الرتيب (monotonic) وحد أقصى LRU
+
+✅ انتهاء كسول عند القراءة + تنظيف دوري في الخلفية لكل الخرائط المسجلة
+✅ TTL افتراضي أو لكل مفتاح
+✅ default_factory مثل defaultdict
+✅ إحصائيات وذاكرة تقريبية لكل خريطة
+"""
+
+import asyncio
+import sys
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, List, Optional
+
+from logger import bot_logger
+
+
+# كل الخرائط الحية (للتنظيف الدوري والتقارير)
+_registry: "weakref.WeakSet[ExpiringMap]" = weakref.WeakSet()
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+class ExpiringMap(MutableMapping):
+    """
+    dict تنتهي مفاتيحه بعد ttl ثانية من آخر كتابة
+
+    Args:
+        ttl: مدة الصلاحية الافتراضية بالثواني (None = بدون انتهاء)
+        max_size: أقصى عدد مفاتيح؛ الأقدم استخداماً يُحذف أولاً
+        default_factory: قيمة افتراضية للمفاتيح غير الموجودة (مثل defaultdict)
+        name: اسم للتقارير
+    """
+
+    # المقارنة بالهوية (Mapping يلغي __hash__، ونحتاجه للسجل)
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        max_size: Optional[int] = None,
+        default_factory: Optional[Callable[[], Any]] = None,
+        name: str = 'map'
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.default_factory = default_factory
+        self.name = name
+        self._data: "OrderedDict[Any, list]" = OrderedDict()  # {key: [expires_at, value]}
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        _registry.add(self)
+
+    # ==================== الوصول ====================
+
+    def _live(self, key) -> Optional[list]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.monotonic():
+            del self._data[key]
+            self.expired += 1
+            return None
+        return entry
+
+    def __getitem__(self, key):
+        entry = self._live(key)
+        if entry is None:
+            self.misses += 1
+            if self.default_factory is None:
+                raise KeyError(key)
+            value = self.default_factory()
+            self.set(key, value)
+            return value
+        self.hits += 1
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        """تعيين قيمة (ttl يتجاوز الافتراضي لهذا المفتاح)"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        entry = self._data.get(key)
+        if entry is not None:
+            entry[0] = expires_at
+            entry[1] = value
+            self._data.move_to_end(key)
+        else:
+            self._data[key] = [expires_at, value]
+            if self.max_size is not None:
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+                    self.evicted += 1
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __contains__(self, key) -> bool:
+        return self._live(key) is not None
+
+    def __iter__(self):
+        self.sweep()
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=None):
+        entry = self._live(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def touch(self, key, ttl: Optional[float] = None) -> bool:
+        """تمديد صلاحية مفتاح موجود من الآن (للقيم التي تُعدَّل في مكانها)"""
+        entry = self._live(key)
+        if entry is None:
+            return False
+        ttl = self.ttl if ttl is None else ttl
+        entry[0] = time.monotonic() + ttl if ttl is not None else None
+        self._data.move_to_end(key)
+        return True
+
+    def pop(self, key, *args):
+        entry = self._live(key)
+        if entry is None:
+            if args:
+                return args[0]
+            raise KeyError(key)
+        del self._data[key]
+        return entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    # ==================== الصيانة ====================
+
+    def sweep(self) -> int:
+        """حذف كل المفاتيح المنتهية"""
+        now = time.monotonic()
+        stale = [k for k, (expires_at, _) in self._data.items() if expires_at is not None and expires_at <= now]
+        for key in stale:
+            del self._data[key]
+        self.expired += len(stale)
+        return len(stale)
+
+    def memory_usage(self) -> int:
+        """حجم تقريبي بالبايت (الحاوية + المفاتيح + القيم، بدون تعمق)"""
+        size = sys.getsizeof(self._data)
+        for key, entry in self._data.items():
+            size += sys.getsizeof(key) + sys.getsizeof(entry) + sys.getsizeof(entry[1])
+        return size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'bytes': self.memory_usage()
+        }
+
+
+# ==================== التنظيف الدوري ====================
+
+def sweep_all() -> int:
+    """تنظيف كل الخرائط المسجلة"""
+    return sum(m.sweep() for m in list(_registry))
+
+
+def memory_report() -> List[Dict[str, Any]]:
+    """إحصائيات كل الخرائط (الأكبر أولاً)"""
+    return sorted((m.stats() for m in list(_registry)), key=lambda s: s['bytes'], reverse=True)
+
+
+async def _sweep_loop(interval: float):
+    while True:
+        try:
+            await asyncio.sleep(interval)
+            removed = sweep_all()
+            if removed:
+                bot_logger.debug(f'🧹 ExpiringMap: حُذف {removed} مفتاح منتهي')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            bot_logger.error(f'خطأ في _sweep_loop: {e}')
+
+
+def start_sweeper(interval: float = 60):
+    """بدء التنظيف الدوري (مرة واحدة)"""
+    global _sweeper_task
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.create_task(_sweep_loop(interval))
@@ -0,0 +1,120 @@
+"""
+records.py - سجلات صفوف الجداول
+================================
+أصناف بـ __slots__ لكل (جدول، أعمدة) تُولَّد من وصف المؤشر (cursor.description)
+بدلاً من تحويل كل aiosqlite.Row إلى dict:
+
+✅ وصول سريع بالخاصية (row.xp) وذاكرة أقل لكل صف (بدون __dict__ ولا جدول hash)
+✅ متوافقة مع واجهة dict للقراءة والتعديل (row['xp'], row.get, keys/items, dict(row))
+   فالكود الحالي يعمل دون تغيير
+✅ الصنف يُولَّد مرة واحدة لكل (جدول، أعمدة) ويُعاد استخدامه
+"""
+
+import keyword
+from typing import Any, Dict, Iterator, Sequence, Tuple, Type
+
+
+class Record:
+    """صف جدول بخانات ثابتة (الأصناف الفعلية تُولَّد عبر record_class)"""
+
+    __slots__ = ()
+    _table: str = ''
+    _fields: Tuple[str, ...] = ()
+
+    # ==================== واجهة dict ====================
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self._fields:
+            return default
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._fields
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._fields
+
+    def values(self) -> list:
+        return [getattr(self, name) for name in self._fields]
+
+    def items(self) -> list:
+        return [(name, getattr(self, name)) for name in self._fields]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self._fields}
+
+    def _replace(self, **changes) -> 'Record':
+        """نسخة مع تعديل بعض الأعمدة (مثل namedtuple)"""
+        return type(self)(*(changes.pop(name, getattr(self, name)) for name in self._fields))
+
+    # ==================== المقارنة والعرض ====================
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Record):
+            return self._fields == other._fields and self.values() == other.values()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self._fields)
+        return f'{type(self).__name__}({fields})'
+
+
+_classes: Dict[Tuple[str, Tuple[str, ...]], Type[Record]] = {}
+
+
+def record_class(table: str, fields: Sequence[str]) -> Type[Record]:
+    """
+    صنف سجل لأعمدة جدول (يُنشأ مرة واحدة لكل مجموعة أعمدة)
+
+    Args:
+        table: اسم الجدول (للاسم والتقارير فقط)
+        fields: أسماء الأعمدة بترتيب الاستعلام
+    """
+    fields = tuple(fields)
+    key = (table, fields)
+    cls = _classes.get(key)
+    if cls is not None:
+        return cls
+
+    for name in fields:
+        if not name.isidentifier() or keyword.iskeyword(name) or name.startswith('_'):
+            raise ValueError(f'اسم عمود غير صالح لسجل {table}: {name!r}')
+    if len(set(fields)) != len(fields):
+        raise ValueError(f'أعمدة مكررة في سجل {table}: {fields}')
+
+    # __init__ مُولَّد بمعاملات موضعية (أسرع من حلقة setattr)
+    args = ', '.join(fields)
+    body = ''.join(f'\n    self.{name} = {name}' for name in fields) or '\n    pass'
+    namespace: Dict[str, Any] = {}
+    exec(f'def __init__(self, {args}):{body}' if fields else f'def __init__(self):{body}', namespace)
+
+    name = ''.join(part.capitalize() for part in table.split('_')) + 'Record'
+    cls = type(name, (Record,), {
+        '__slots__': fields,
+        '__init__': namespace['__init__'],
+        '_table': table,
+        '_fields': fields
+    })
+    _classes[key] = cls
+    return cls
+
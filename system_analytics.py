@@ -4,23 +4,37 @@ system_analytics.py
 Comprehensive analytics subsystem for Zex-Bot.
 
 Features:
-- Attempts to reuse project's database connection if available (module `database`).
-- Falls back to its own aiosqlite connection (default file 'analytics.db' or ANALYTICS_DB env).
+- Dedicated aiosqlite connection in WAL mode (default file 'analytics.db' or ANALYTICS_DB env),
+  so analytics writes never contend with the main bot database.
 - Creates an `analytics_events` table to store events.
+- Ingestion is queue-backed: `record_event` only enqueues; a single consumer task
+  batches events (by size or time) into one `executemany` transaction.
+- Bounded queue with drop-oldest under overload, plus counters for
+  enqueued/dropped/flushed events (`stats()`).
+- Rollup tables (guild x event x hour, guild x event x day, per-guild and
+  per-event totals) are maintained inside the same batch transaction, so count
+  and top-N queries never scan the raw table.
+- Retention: raw events older than RAW_RETENTION_DAYS (and hourly rollups older
+  than HOURLY_RETENTION_DAYS) are deleted in chunks; daily rollups and totals stay.
 - Provides a module-level `analytics_system` instance with async methods:
     - init(db_path=None)
     - record_event(guild_id, user_id, event, metadata=None)
+    - record_event_nowait(guild_id, user_id, event, metadata=None)  (sync)
+    - flush()
     - get_recent(limit=50)
     - get_count_by_guild(guild_id)
-    - get_top_events(limit=10)
-    - close()
+    - get_top_events(limit=10, guild_id=None)
+    - get_event_counts(guild_id, days=7)
+    - compact()
+    - stats()
+    - close()  (flushes pending events first)
 - Defensive: failures in analytics do not raise unhandled exceptions (best-effort).
 - JSON-friendly metadata handling (stores metadata as JSON string if dict provided).
-- Detailed docstrings and examples.
 
 Usage:
     from system_analytics import analytics_system
-    await analytics_system.record_event("guild_id", "user_id", "command:help", {"args": []})
+    await analytics_system.init()
+    analytics_system.record_event_nowait("guild_id", "user_id", "command:help", {"args": []})
 """
 
 from __future__ import annotations
@@ -28,7 +42,10 @@ from __future__ import annotations
 import os
 import asyncio
 import json
-from typing import Optional, List, Dict, Any
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple
 
 # aiosqlite is optional but recommended; we'll handle its absence gracefully.
 try:
@@ -36,31 +53,96 @@ try:
 except Exception:
     aiosqlite = None  # type: ignore
 
+from logger import bot_logger
+
 DEFAULT_DB = os.getenv("ANALYTICS_DB", "analytics.db")
 
+# Queue / batching limits
+QUEUE_MAX_SIZE = 10_000   # events buffered before drop-oldest kicks in
+BATCH_SIZE = 500          # flush when this many events are collected...
+FLUSH_INTERVAL = 2.0      # ...or this many seconds after the first one
+
+CLOSE_TIMEOUT = 10.0      # seconds close() waits for the consumer to drain
 
-class _NoopCursor:
-    """Fallback cursor that does nothing (used when connection is missing)."""
+# Retention (raw events are already counted in the rollups when written)
+RAW_RETENTION_DAYS = int(os.getenv("ANALYTICS_RAW_RETENTION_DAYS", "30"))
+HOURLY_RETENTION_DAYS = int(os.getenv("ANALYTICS_HOURLY_RETENTION_DAYS", "90"))
+RETENTION_INTERVAL = 6 * 3600   # seconds between retention runs
+RETENTION_CHUNK = 5000          # rows deleted per transaction
 
-    def execute(self, *args, **kwargs):
-        return self
+# NULL guild ids are stored as '' in rollups (NULLs are never equal inside a PRIMARY KEY)
+NO_GUILD = ""
 
-    def fetchall(self):
-        return []
+ROLLUP_SCHEMA = (
+    """
+    CREATE INDEX IF NOT EXISTS idx_analytics_events_created
+    ON analytics_events (created_at);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analytics_hourly (
+        guild_id TEXT NOT NULL,
+        event TEXT NOT NULL,
+        hour TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, event, hour)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analytics_daily (
+        guild_id TEXT NOT NULL,
+        event TEXT NOT NULL,
+        day TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, event, day)
+    );
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_analytics_daily_guild_day
+    ON analytics_daily (guild_id, day);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analytics_guild_totals (
+        guild_id TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analytics_event_totals (
+        event TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    );
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_analytics_event_totals_count
+    ON analytics_event_totals (count DESC);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analytics_guild_event_totals (
+        guild_id TEXT NOT NULL,
+        event TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, event)
+    );
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_analytics_guild_event_totals_count
+    ON analytics_guild_event_totals (guild_id, count DESC);
+    """,
+)
 
-    def fetchone(self):
-        return None
+EventRow = Tuple[Optional[str], Optional[str], str, Optional[str], str]
 
-    def close(self):
-        return None
+# Queued by close(): the consumer writes everything before it, then exits
+_STOP = object()
 
 
 class AnalyticsSystem:
     """
     AnalyticsSystem manages a lightweight analytics store.
 
-    It tries to detect and reuse a project's database connection automatically.
-    If not found, it opens its own aiosqlite connection.
+    Producers call `record_event`/`record_event_nowait`, which never touch the
+    database: events go into a bounded asyncio queue. A single consumer drains
+    the queue in batches and writes each batch in one transaction.
 
     The implementation is defensive: if analytics fails it won't crash the bot.
     """
@@ -68,72 +150,26 @@ class AnalyticsSystem:
     def __init__(self) -> None:
         self._db_path: str = DEFAULT_DB
         self._conn: Optional[Any] = None
-        self._own_connection: bool = False
         self._inited: bool = False
         self._init_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAX_SIZE)
+        self._consumer_task: Optional[asyncio.Task] = None
+        self._retention_task: Optional[asyncio.Task] = None
+        self._closing: bool = False
+
+        # Counters (exported via stats())
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+        self.compacted = 0
 
     # ---------------------
-    # DB detection & utils
+    # Utils
     # ---------------------
-    async def _detect_shared_db(self) -> Optional[Any]:
-        """
-        Try to detect a shared DB connection exported by `database` module.
-
-        Looks for:
-        - async/sync functions: get_connection(), get_db(), get_conn()
-        - attributes: conn, connection, db, db_conn
-        Returns a connection-like object or None.
-        """
-        try:
-            import database  # type: ignore
-        except Exception:
-            return None
-
-        # Try common async getters
-        for fn_name in ("get_connection", "get_db", "get_conn"):
-            if hasattr(database, fn_name):
-                fn = getattr(database, fn_name)
-                if callable(fn):
-                    try:
-                        # prefer awaiting if coroutine
-                        if asyncio.iscoroutinefunction(fn):
-                            conn = await fn()
-                        else:
-                            conn = fn()
-                        if conn:
-                            return conn
-                    except Exception:
-                        # continue to next possibility
-                        pass
-
-        # Try attributes
-        for attr in ("conn", "connection", "db", "db_conn", "connection_obj"):
-            if hasattr(database, attr):
-                try:
-                    c = getattr(database, attr)
-                    if c:
-                        return c
-                except Exception:
-                    pass
-
-        # Some projects expose a wrapper object `db` with an internal connection
-        # Try db.connection or db._conn
-        if hasattr(database, "db"):
-            try:
-                db_obj = getattr(database, "db")
-                for sub in ("connection", "_conn", "_connection", "conn"):
-                    if hasattr(db_obj, sub):
-                        try:
-                            val = getattr(db_obj, sub)
-                            if val:
-                                return val
-                        except Exception:
-                            pass
-            except Exception:
-                pass
-
-        return None
-
     def _serialize_metadata(self, metadata: Optional[Any]) -> Optional[str]:
         """Serialize metadata to a JSON string when possible; otherwise string-cast."""
         if metadata is None:
@@ -153,10 +189,10 @@ class AnalyticsSystem:
     # ---------------------
     async def init(self, db_path: Optional[str] = None) -> None:
         """
-        Initialize analytics system.
+        Initialize analytics system and start the batching consumer.
 
         If `db_path` provided, it overrides the default analytics DB path.
-        This function is idempotent.
+        This function is idempotent. Events recorded before `init` stay queued.
         """
         async with self._init_lock:
             if self._inited:
@@ -164,109 +200,85 @@ class AnalyticsSystem:
 
             if db_path:
                 self._db_path = db_path
+            self._closing = False
 
-            # 1) Try to detect a project's shared DB connection
-            shared_conn = None
-            try:
-                shared_conn = await self._detect_shared_db()
-            except Exception:
-                shared_conn = None
-
-            if shared_conn:
-                # Reuse shared connection (do not close it on close())
-                self._conn = shared_conn
-                self._own_connection = False
-            else:
-                # Fallback: create own aiosqlite connection
-                if aiosqlite is None:
-                    # If aiosqlite not installed, we cannot create an async sqlite connection.
-                    # Keep analytics disabled but do not crash.
-                    self._conn = None
-                    self._own_connection = False
-                    self._inited = True
-                    return
-
-                # Ensure directory exists
-                db_dir = os.path.dirname(self._db_path)
-                if db_dir and not os.path.exists(db_dir):
-                    try:
-                        os.makedirs(db_dir, exist_ok=True)
-                    except Exception:
-                        pass
+            if aiosqlite is None:
+                # Without aiosqlite analytics stays disabled (events are discarded).
+                bot_logger.warning("aiosqlite not installed - analytics disabled")
+                self._inited = True
+                return
 
-                try:
-                    self._conn = await aiosqlite.connect(self._db_path)
-                    self._own_connection = True
-                    # performance tweak
-                    try:
-                        await self._conn.execute("PRAGMA journal_mode=WAL;")
-                    except Exception:
-                        pass
-                except Exception:
-                    # if can't open DB, mark as inited to avoid retry loops and return
-                    self._conn = None
-                    self._own_connection = False
-                    self._inited = True
-                    return
+            db_dir = os.path.dirname(self._db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
 
-            # Ensure schema exists (best-effort)
             try:
-                if self._conn is not None:
-                    # Some connections are sync connections; attempt async execute, else fallback
-                    try:
-                        await self._conn.execute(
-                            """
-                            CREATE TABLE IF NOT EXISTS analytics_events (
-                                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                guild_id TEXT,
-                                user_id TEXT,
-                                event TEXT NOT NULL,
-                                metadata TEXT,
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                            );
-                            """
-                        )
-                        # commit if possible
-                        try:
-                            await self._conn.commit()
-                        except Exception:
-                            pass
-                    except Exception:
-                        # Try sync execution (for sqlite3.Connection)
-                        try:
-                            cur = self._conn.cursor()
-                            cur.execute(
-                                """
-                                CREATE TABLE IF NOT EXISTS analytics_events (
-                                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                    guild_id TEXT,
-                                    user_id TEXT,
-                                    event TEXT NOT NULL,
-                                    metadata TEXT,
-                                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                                );
-                                """
-                            )
-                            try:
-                                self._conn.commit()
-                            except Exception:
-                                pass
-                            try:
-                                cur.close()
-                            except Exception:
-                                pass
-                        except Exception:
-                            pass
-            except Exception:
-                # swallow any errors related to schema creation
-                pass
+                self._conn = await aiosqlite.connect(self._db_path)
+                await self._conn.execute("PRAGMA journal_mode=WAL;")
+                await self._conn.execute("PRAGMA synchronous=NORMAL;")
+                await self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS analytics_events (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        guild_id TEXT,
+                        user_id TEXT,
+                        event TEXT NOT NULL,
+                        metadata TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
+                    """
+                )
+                for statement in ROLLUP_SCHEMA:
+                    await self._conn.execute(statement)
+                await self._conn.commit()
+                await self._backfill_rollups()
+            except Exception as e:
+                # if can't open DB, mark as inited to avoid retry loops
+                bot_logger.error(f"analytics init failed: {e}")
+                self._conn = None
+                self._inited = True
+                return
 
             self._inited = True
+            self._consumer_task = asyncio.create_task(self._consume())
+            self._retention_task = asyncio.create_task(self._retention_loop())
+
+    async def _backfill_rollups(self) -> None:
+        """One-off: build rollups from raw events written before rollups existed."""
+        cur = await self._conn.execute("SELECT 1 FROM analytics_event_totals LIMIT 1;")
+        has_totals = await cur.fetchone()
+        await cur.close()
+        cur = await self._conn.execute("SELECT 1 FROM analytics_events LIMIT 1;")
+        has_events = await cur.fetchone()
+        await cur.close()
+        if has_totals or not has_events:
+            return
+
+        g = f"COALESCE(guild_id, '{NO_GUILD}')"
+        await self._conn.executescript(
+            f"""
+            BEGIN;
+            INSERT INTO analytics_hourly (guild_id, event, hour, count)
+                SELECT {g}, event, strftime('%Y-%m-%d %H:00', created_at), COUNT(*)
+                FROM analytics_events GROUP BY 1, 2, 3;
+            INSERT INTO analytics_daily (guild_id, event, day, count)
+                SELECT {g}, event, date(created_at), COUNT(*)
+                FROM analytics_events GROUP BY 1, 2, 3;
+            INSERT INTO analytics_guild_event_totals (guild_id, event, count)
+                SELECT {g}, event, COUNT(*) FROM analytics_events GROUP BY 1, 2;
+            INSERT INTO analytics_guild_totals (guild_id, count)
+                SELECT guild_id, SUM(count) FROM analytics_guild_event_totals GROUP BY 1;
+            INSERT INTO analytics_event_totals (event, count)
+                SELECT event, SUM(count) FROM analytics_guild_event_totals GROUP BY 1;
+            COMMIT;
+            """
+        )
+        bot_logger.info("analytics rollups backfilled from raw events")
 
     # ---------------------
-    # Recording & Queries
+    # Ingestion
     # ---------------------
-    async def record_event(
+    def record_event_nowait(
         self,
         guild_id: Optional[str],
         user_id: Optional[str],
@@ -274,57 +286,249 @@ class AnalyticsSystem:
         metadata: Optional[Any] = None,
     ) -> None:
         """
-        Record an analytics event. Best-effort only — failures are swallowed.
+        Enqueue an analytics event without awaiting anything.
 
-        `metadata` can be a dict which will be JSON-serialized.
+        When the queue is full the oldest queued event is dropped to make room,
+        so producers never block and the most recent activity is kept.
         """
-        if not self._inited:
-            try:
-                await self.init()
-            except Exception:
-                return
-
-        if self._conn is None:
-            # No connection available; no-op
+        if self._closing:
+            self.dropped += 1
             return
 
-        meta_str = self._serialize_metadata(metadata)
-
-        # Attempt async insert first (aiosqlite-like)
+        row: EventRow = (
+            guild_id,
+            user_id,
+            event,
+            self._serialize_metadata(metadata),
+            datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        )
         try:
-            await self._conn.execute(
-                "INSERT INTO analytics_events (guild_id, user_id, event, metadata) VALUES (?, ?, ?, ?);",
-                (guild_id, user_id, event, meta_str),
-            )
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
             try:
-                await self._conn.commit()
-            except Exception:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
                 pass
-            return
-        except Exception:
-            # fall through to sync attempt
-            pass
+            try:
+                self._queue.put_nowait(row)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                return
+        self.enqueued += 1
 
-        # Try sync insert (sqlite3.Connection)
-        try:
-            cur = self._conn.cursor()
-            cur.execute(
-                "INSERT INTO analytics_events (guild_id, user_id, event, metadata) VALUES (?, ?, ?, ?);",
-                (guild_id, user_id, event, meta_str),
-            )
+    async def record_event(
+        self,
+        guild_id: Optional[str],
+        user_id: Optional[str],
+        event: str,
+        metadata: Optional[Any] = None,
+    ) -> None:
+        """
+        Record an analytics event. Best-effort only — never waits on the database.
+
+        `metadata` can be a dict which will be JSON-serialized.
+        """
+        self.record_event_nowait(guild_id, user_id, event, metadata)
+
+    def _take(self, batch: List[EventRow], item: Any) -> bool:
+        """Add a dequeued item to `batch`; returns True for the stop marker."""
+        self._queue.task_done()
+        if item is _STOP:
+            return True
+        batch.append(item)
+        return False
+
+    def _drain(self, batch: List[EventRow]) -> bool:
+        """Move already-queued events into `batch` (up to BATCH_SIZE); True if stop was seen."""
+        while len(batch) < BATCH_SIZE:
             try:
-                self._conn.commit()
-            except Exception:
-                pass
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return False
+            if self._take(batch, item):
+                return True
+        return False
+
+    async def _consume(self) -> None:
+        """Single consumer: wait for an event, then batch by size or time."""
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            batch: List[EventRow] = []
             try:
-                cur.close()
-            except Exception:
-                pass
+                stop = self._take(batch, await self._queue.get())
+                deadline = loop.time() + FLUSH_INTERVAL
+
+                while not stop and len(batch) < BATCH_SIZE:
+                    stop = self._drain(batch)
+                    remaining = deadline - loop.time()
+                    if stop or len(batch) >= BATCH_SIZE or remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    stop = self._take(batch, item)
+
+                await self._write(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                bot_logger.error(f"analytics consumer error: {e}")
+
+    async def _write(self, batch: List[EventRow]) -> None:
+        """Write one batch in a single transaction (the batch is dropped on failure)."""
+        if not batch:
             return
-        except Exception:
-            # give up silently
+        if self._conn is None:
+            self.dropped += len(batch)
             return
 
+        # Aggregate the batch in memory: one upsert per distinct rollup key
+        hourly: Counter = Counter()
+        daily: Counter = Counter()
+        for guild_id, _user_id, event, _metadata, created_at in batch:
+            guild_key = guild_id or NO_GUILD
+            hourly[(guild_key, event, created_at[:13] + ":00")] += 1
+            daily[(guild_key, event, created_at[:10])] += 1
+        guild_events: Counter = Counter()
+        for (guild_key, event, _day), count in daily.items():
+            guild_events[(guild_key, event)] += count
+        guilds: Counter = Counter()
+        events: Counter = Counter()
+        for (guild_key, event), count in guild_events.items():
+            guilds[guild_key] += count
+            events[event] += count
+
+        start = time.perf_counter()
+        async with self._write_lock:
+            try:
+                await self._conn.executemany(
+                    "INSERT INTO analytics_events (guild_id, user_id, event, metadata, created_at) "
+                    "VALUES (?, ?, ?, ?, ?);",
+                    batch,
+                )
+                await self._conn.executemany(
+                    "INSERT INTO analytics_hourly (guild_id, event, hour, count) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(guild_id, event, hour) DO UPDATE SET count = count + excluded.count;",
+                    [(*key, count) for key, count in hourly.items()],
+                )
+                await self._conn.executemany(
+                    "INSERT INTO analytics_daily (guild_id, event, day, count) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(guild_id, event, day) DO UPDATE SET count = count + excluded.count;",
+                    [(*key, count) for key, count in daily.items()],
+                )
+                await self._conn.executemany(
+                    "INSERT INTO analytics_guild_event_totals (guild_id, event, count) VALUES (?, ?, ?) "
+                    "ON CONFLICT(guild_id, event) DO UPDATE SET count = count + excluded.count;",
+                    [(*key, count) for key, count in guild_events.items()],
+                )
+                await self._conn.executemany(
+                    "INSERT INTO analytics_guild_totals (guild_id, count) VALUES (?, ?) "
+                    "ON CONFLICT(guild_id) DO UPDATE SET count = count + excluded.count;",
+                    list(guilds.items()),
+                )
+                await self._conn.executemany(
+                    "INSERT INTO analytics_event_totals (event, count) VALUES (?, ?) "
+                    "ON CONFLICT(event) DO UPDATE SET count = count + excluded.count;",
+                    list(events.items()),
+                )
+                await self._conn.commit()
+                self.flushed += len(batch)
+                self.batches += 1
+            except Exception as e:
+                self.failed += len(batch)
+                bot_logger.error(f"analytics batch write failed ({len(batch)} events): {e}")
+                try:
+                    await self._conn.rollback()
+                except Exception:
+                    pass
+        self.last_flush_ms = (time.perf_counter() - start) * 1000
+
+    async def flush(self) -> None:
+        """Write every queued event now (used on shutdown)."""
+        while not self._queue.empty():
+            batch: List[EventRow] = []
+            self._drain(batch)
+            await self._write(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """Ingestion counters."""
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "compacted": self.compacted,
+        }
+
+    # ---------------------
+    # Retention
+    # ---------------------
+    async def _delete_older(self, table: str, column: str, cutoff: str) -> int:
+        """Delete rows older than `cutoff` in RETENTION_CHUNK-sized transactions."""
+        total = 0
+        while True:
+            async with self._write_lock:
+                cur = await self._conn.execute(
+                    f"DELETE FROM {table} WHERE rowid IN "
+                    f"(SELECT rowid FROM {table} WHERE {column} < ? LIMIT ?);",
+                    (cutoff, RETENTION_CHUNK),
+                )
+                deleted = cur.rowcount
+                await cur.close()
+                await self._conn.commit()
+            total += deleted
+            if deleted < RETENTION_CHUNK:
+                return total
+            await asyncio.sleep(0)  # let batch writes interleave
+
+    async def compact(
+        self,
+        raw_days: int = RAW_RETENTION_DAYS,
+        hourly_days: int = HOURLY_RETENTION_DAYS,
+    ) -> Dict[str, int]:
+        """
+        Apply retention.
+
+        Raw events were counted into the rollups when they were written, so
+        compacting them is just a chunked delete. Daily rollups and totals are kept.
+        """
+        if self._conn is None:
+            return {"events": 0, "hourly": 0}
+
+        now = datetime.utcnow()
+        raw_cutoff = (now - timedelta(days=raw_days)).strftime("%Y-%m-%d %H:%M:%S")
+        hourly_cutoff = (now - timedelta(days=hourly_days)).strftime("%Y-%m-%d %H:00")
+
+        result = {
+            "events": await self._delete_older("analytics_events", "created_at", raw_cutoff),
+            "hourly": await self._delete_older("analytics_hourly", "hour", hourly_cutoff),
+        }
+        self.compacted += result["events"]
+        if result["events"] or result["hourly"]:
+            bot_logger.info(f"analytics retention: {result}")
+        return result
+
+    async def _retention_loop(self) -> None:
+        while True:
+            try:
+                await self.compact()
+                await asyncio.sleep(RETENTION_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                bot_logger.error(f"analytics retention error: {e}")
+                await asyncio.sleep(RETENTION_INTERVAL)
+
+    # ---------------------
+    # Queries
+    # ---------------------
     async def get_recent(self, limit: int = 50) -> List[Dict[str, Any]]:
         """
         Return recent events as list of dicts:
@@ -336,7 +540,6 @@ class AnalyticsSystem:
         if self._conn is None:
             return []
 
-        # Async attempt
         try:
             cur = await self._conn.execute(
                 "SELECT id, guild_id, user_id, event, metadata, created_at "
@@ -344,55 +547,23 @@ class AnalyticsSystem:
                 (limit,),
             )
             rows = await cur.fetchall()
-            try:
-                await cur.close()
-            except Exception:
-                pass
-            result = []
-            for r in rows:
-                result.append(
-                    {
-                        "id": r[0],
-                        "guild_id": r[1],
-                        "user_id": r[2],
-                        "event": r[3],
-                        "metadata": r[4],
-                        "created_at": r[5],
-                    }
-                )
-            return result
+            await cur.close()
+            return [
+                {
+                    "id": r[0],
+                    "guild_id": r[1],
+                    "user_id": r[2],
+                    "event": r[3],
+                    "metadata": r[4],
+                    "created_at": r[5],
+                }
+                for r in rows
+            ]
         except Exception:
-            # Sync fallback
-            try:
-                cur = self._conn.cursor()
-                cur.execute(
-                    "SELECT id, guild_id, user_id, event, metadata, created_at "
-                    "FROM analytics_events ORDER BY id DESC LIMIT ?;",
-                    (limit,),
-                )
-                rows = cur.fetchall()
-                result = []
-                for r in rows:
-                    result.append(
-                        {
-                            "id": r[0],
-                            "guild_id": r[1],
-                            "user_id": r[2],
-                            "event": r[3],
-                            "metadata": r[4],
-                            "created_at": r[5],
-                        }
-                    )
-                try:
-                    cur.close()
-                except Exception:
-                    pass
-                return result
-            except Exception:
-                return []
+            return []
 
     async def get_count_by_guild(self, guild_id: str) -> int:
-        """Return number of events for a given guild_id."""
+        """Return number of events ever recorded for a given guild_id (from totals)."""
         if not self._inited:
             await self.init()
 
@@ -401,29 +572,16 @@ class AnalyticsSystem:
 
         try:
             cur = await self._conn.execute(
-                "SELECT COUNT(*) FROM analytics_events WHERE guild_id = ?;", (guild_id,)
+                "SELECT count FROM analytics_guild_totals WHERE guild_id = ?;", (guild_id or NO_GUILD,)
             )
             row = await cur.fetchone()
-            try:
-                await cur.close()
-            except Exception:
-                pass
+            await cur.close()
             return row[0] if row else 0
         except Exception:
-            try:
-                cur = self._conn.cursor()
-                cur.execute("SELECT COUNT(*) FROM analytics_events WHERE guild_id = ?;", (guild_id,))
-                row = cur.fetchone()
-                try:
-                    cur.close()
-                except Exception:
-                    pass
-                return row[0] if row else 0
-            except Exception:
-                return 0
+            return 0
 
-    async def get_top_events(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Return top events by count."""
+    async def get_top_events(self, limit: int = 10, guild_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return top events by count (all guilds, or one guild), read from the totals index."""
         if not self._inited:
             await self.init()
 
@@ -431,50 +589,108 @@ class AnalyticsSystem:
             return []
 
         try:
+            if guild_id is None:
+                cur = await self._conn.execute(
+                    "SELECT event, count FROM analytics_event_totals ORDER BY count DESC LIMIT ?;", (limit,)
+                )
+            else:
+                cur = await self._conn.execute(
+                    "SELECT event, count FROM analytics_guild_event_totals "
+                    "WHERE guild_id = ? ORDER BY count DESC LIMIT ?;",
+                    (guild_id, limit),
+                )
+            rows = await cur.fetchall()
+            await cur.close()
+            return [{"event": r[0], "count": r[1]} for r in rows]
+        except Exception:
+            return []
+
+    async def get_event_counts(self, guild_id: str, days: int = 7) -> List[Dict[str, Any]]:
+        """Return per-day counts for each event in a guild over the last `days` days."""
+        if not self._inited:
+            await self.init()
+
+        if self._conn is None:
+            return []
+
+        try:
+            since = (datetime.utcnow() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
             cur = await self._conn.execute(
-                "SELECT event, COUNT(*) as cnt FROM analytics_events GROUP BY event ORDER BY cnt DESC LIMIT ?;", (limit,)
+                "SELECT day, event, count FROM analytics_daily "
+                "WHERE guild_id = ? AND day >= ? ORDER BY day, count DESC;",
+                (guild_id, since),
             )
             rows = await cur.fetchall()
-            try:
-                await cur.close()
-            except Exception:
-                pass
-            return [{"event": r[0], "count": r[1]} for r in rows]
+            await cur.close()
+            return [{"day": r[0], "event": r[1], "count": r[2]} for r in rows]
         except Exception:
-            try:
-                cur = self._conn.cursor()
-                cur.execute("SELECT event, COUNT(*) as cnt FROM analytics_events GROUP BY event ORDER BY cnt DESC LIMIT ?;", (limit,))
-                rows = cur.fetchall()
-                try:
-                    cur.close()
-                except Exception:
-                    pass
-                return [{"event": r[0], "count": r[1]} for r in rows]
-            except Exception:
+            return []
+
+    async def fetchall(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        """
+        Run a read query on the analytics DB and return rows as dicts (used by exports).
+
+        Runs under the write lock: the batching connection is shared, so an
+        unlocked read could see a batch that is later rolled back and move the
+        export watermark past rows that never got committed.
+        """
+        if not self._inited:
+            await self.init()
+
+        async with self._write_lock:
+            if self._conn is None:
                 return []
+            cur = await self._conn.execute(sql, params)
+            rows = await cur.fetchall()
+            columns = [d[0] for d in cur.description]
+            await cur.close()
+        return [dict(zip(columns, r)) for r in rows]
 
     # ---------------------
     # Close
     # ---------------------
     async def close(self) -> None:
-        """Close analytics connection only if it was opened by this module."""
+        """Stop the consumer, flush pending events and close the connection."""
         if not self._inited:
             return
-        if self._own_connection and self._conn is not None:
+
+        self._closing = True
+
+        if self._retention_task is not None:
+            self._retention_task.cancel()
+            self._retention_task = None
+
+        if self._consumer_task is not None:
+            # The stop marker goes behind every queued event, so the consumer flushes them all
+            try:
+                self._queue.put_nowait(_STOP)
+            except asyncio.QueueFull:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self.dropped += 1
+                self._queue.put_nowait(_STOP)
+
+            done, _ = await asyncio.wait({self._consumer_task}, timeout=CLOSE_TIMEOUT)
+            if not done:
+                bot_logger.warning("analytics consumer did not drain in time - cancelling")
+                self._consumer_task.cancel()
+            self._consumer_task = None
+
+        # Leftovers (no consumer, or it timed out)
+        try:
+            await self.flush()
+        except Exception as e:
+            bot_logger.error(f"analytics flush on close failed: {e}")
+
+        if self._conn is not None:
             try:
-                # aiosqlite
                 await self._conn.close()
             except Exception:
-                try:
-                    # sync sqlite3
-                    self._conn.close()
-                except Exception:
-                    pass
+                pass
 
         self._conn = None
-        self._own_connection = False
         self._inited = False
 
 
 # Module-level ready-to-use instance
-analytics_system = AnalyticsSystem()
\ No newline at end of file
+analytics_system = AnalyticsSystem()
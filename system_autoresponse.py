@@ -15,15 +15,19 @@ import re
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
 from database import db
+from records import Record
 import helpers
 from logger import bot_logger
+from expiring_map import ExpiringMap
 
 
 class AutoResponseSystem:
     """نظام الردود التلقائية الذكي"""
     
     def __init__(self):
-        self.cooldowns = {}  # {user_id: {response_id: last_time}}
+        # {(user_id, response_id): last_time} - ينتهي كل مفتاح بانتهاء cooldown الرد
+        self.cooldowns = ExpiringMap(max_size=50_000, name='autoresponse.cooldowns')
+        self.responses_cache: Dict[str, List[Record]] = {}  # {guild_id: [responses]}
         bot_logger.info('✅ تم تهيئة نظام الردود التلقائية')
     
     async def check_and_respond(self, message: discord.Message) -> bool:
@@ -48,8 +52,8 @@ class AutoResponseSystem:
                 f'🔍 فحص ردود تلقائية: {message.author.name} - "{message.content[:30]}..."'
             )
             
-            # جلب جميع الردود التلقائية
-            responses = await db.get_autoresponses(guild_id)
+            # جلب جميع الردود التلقائية (من الكاش)
+            responses = await self._get_cached_responses(guild_id)
             
             if not responses:
                 bot_logger.debug(f'📝 لا توجد ردود تلقائية في {message.guild.name}')
@@ -60,12 +64,12 @@ class AutoResponseSystem:
             # البحث عن رد مطابق
             for response in responses:
                 # تخطي الردود المعطلة
-                if not response.get('enabled', 1):
+                if not response.enabled:
                     continue
                 
                 bot_logger.debug(
-                    f'  🔎 فحص: {response["trigger"]} '
-                    f'({response.get("trigger_type", "contains")})'
+                    f'  🔎 فحص: {response.trigger} '
+                    f'({response.trigger_type})'
                 )
                 
                 if await self._check_response(message, response):
@@ -80,7 +84,7 @@ class AutoResponseSystem:
             bot_logger.exception('خطأ في check_and_respond', e)
             return False
     
-    async def _check_response(self, message: discord.Message, response: Dict) -> bool:
+    async def _check_response(self, message: discord.Message, response: Record) -> bool:
         """
         التحقق من مطابقة الرسالة للرد
         
@@ -88,9 +92,9 @@ class AutoResponseSystem:
             bool: True إذا كانت مطابقة
         """
         try:
-            trigger = response['trigger'].lower()
+            trigger = response.trigger.lower()
             content = message.content.lower()
-            trigger_type = response.get('trigger_type', 'contains')
+            trigger_type = response.trigger_type or 'contains'
             
             # 1️⃣ التحقق من نوع المطابقة
             matches = False
@@ -125,21 +129,21 @@ class AutoResponseSystem:
             bot_logger.debug(f'    ✅ مطابقة نجحت!')
             
             # 2️⃣ التحقق من القنوات المحددة
-            if response.get('channels'):
-                allowed_channels = response['channels'].split(',') if isinstance(response['channels'], str) else response['channels']
+            if response.channels:
+                allowed_channels = response.channels.split(',') if isinstance(response.channels, str) else response.channels
                 if str(message.channel.id) not in allowed_channels:
                     bot_logger.debug(f'    ❌ القناة {message.channel.id} غير مسموحة')
                     return False
             
             # 3️⃣ التحقق من الـ cooldown
-            cooldown = response.get('cooldown', 0)
+            cooldown = response.cooldown or 0
             if cooldown > 0:
-                response_id = response['id']
+                response_id = response.id
                 user_id = str(message.author.id)
                 
                 # التحقق من آخر استخدام
-                if user_id in self.cooldowns and response_id in self.cooldowns[user_id]:
-                    last_time = self.cooldowns[user_id][response_id]
+                last_time = self.cooldowns.get((user_id, response_id))
+                if last_time is not None:
                     time_passed = (datetime.now() - last_time).total_seconds()
                     
                     if time_passed < cooldown:
@@ -150,7 +154,7 @@ class AutoResponseSystem:
                         return False
             
             # 4️⃣ التحقق من الاحتمالية (chance)
-            chance = response.get('chance', 100)
+            chance = response.chance if response.chance is not None else 100
             if chance < 100:
                 if not helpers.roll_chance(chance):
                     bot_logger.debug(f'    🎲 فشل احتمال {chance}%')
@@ -164,16 +168,16 @@ class AutoResponseSystem:
             bot_logger.exception(f'خطأ في _check_response', e)
             return False
     
-    async def _send_response(self, message: discord.Message, response: Dict):
+    async def _send_response(self, message: discord.Message, response: Record):
         """إرسال الرد"""
         try:
-            response_text = response['response']
-            response_id = response['id']
+            response_text = response.response
+            response_id = response.id
             user_id = str(message.author.id)
             
             bot_logger.info(
                 f'📤 إرسال رد تلقائي #{response_id}: '
-                f'{response["trigger"]} -> {message.author.name}'
+                f'{response.trigger} -> {message.author.name}'
             )
             
             # استبدال المتغيرات
@@ -201,13 +205,14 @@ class AutoResponseSystem:
             try:
                 await db.update_autoresponse(
                     response_id,
+                    str(message.guild.id),
                     last_used=datetime.now().isoformat()
                 )
                 
                 # تحديث cooldown في الذاكرة
-                if user_id not in self.cooldowns:
-                    self.cooldowns[user_id] = {}
-                self.cooldowns[user_id][response_id] = datetime.now()
+                cooldown = response.cooldown or 0
+                if cooldown > 0:
+                    self.cooldowns.set((user_id, response_id), datetime.now(), ttl=cooldown)
                 
                 bot_logger.debug('✅ تم تحديث last_used و cooldown')
             
@@ -217,6 +222,27 @@ class AutoResponseSystem:
         except Exception as e:
             bot_logger.exception('خطأ في _send_response', e)
     
+    # ==================== الكاش ====================
+    
+    async def _get_cached_responses(self, guild_id: str) -> List[Record]:
+        """الردود من الكاش (تُحمّل من DB عند أول طلب)"""
+        responses = self.responses_cache.get(guild_id)
+        if responses is None:
+            responses = await db.get_autoresponses(guild_id)
+            self.responses_cache[guild_id] = responses
+        return responses
+    
+    def invalidate_cache(self, guild_id: str = None, response_id: int = None):
+        """مسح الكاش لسيرفر، أو للسيرفر الذي يحتوي الرد المحدد"""
+        if guild_id:
+            self.responses_cache.pop(guild_id, None)
+        elif response_id is not None:
+            for gid, responses in list(self.responses_cache.items()):
+                if any(r.get('id') == response_id for r in responses):
+                    self.responses_cache.pop(gid, None)
+        else:
+            self.responses_cache.clear()
+    
     # ==================== إدارة الردود ====================
     
     async def add_response(
@@ -246,6 +272,7 @@ class AutoResponseSystem:
                 1,  # enabled
                 channels
             )
+            self.invalidate_cache(guild_id)
             
             if response_id:
                 bot_logger.success(
@@ -261,10 +288,11 @@ class AutoResponseSystem:
             bot_logger.exception('خطأ في add_response', e)
             return 0
     
-    async def remove_response(self, response_id: int) -> bool:
+    async def remove_response(self, response_id: int, guild_id: Optional[str] = None) -> bool:
         """حذف رد تلقائي"""
         try:
-            success = await db.remove_autoresponse(response_id)
+            success = await db.remove_autoresponse(response_id, guild_id)
+            self.invalidate_cache(response_id=response_id)
             
             if success:
                 bot_logger.success(f'✅ تم حذف رد تلقائي #{response_id}')
@@ -277,10 +305,11 @@ class AutoResponseSystem:
             bot_logger.exception(f'خطأ في remove_response: {response_id}', e)
             return False
     
-    async def toggle_response(self, response_id: int) -> bool:
+    async def toggle_response(self, response_id: int, guild_id: Optional[str] = None) -> bool:
         """تفعيل/تعطيل رد تلقائي"""
         try:
-            new_state = await db.toggle_autoresponse(response_id)
+            new_state = await db.toggle_autoresponse(response_id, guild_id)
+            self.invalidate_cache(response_id=response_id)
             
             status = 'مفعل' if new_state else 'معطل'
             bot_logger.success(f'✅ الرد #{response_id} الآن {status}')
@@ -309,18 +338,21 @@ class AutoResponseSystem:
         response: str = None,
         trigger_type: str = None,
         chance: int = None,
-        cooldown: int = None
+        cooldown: int = None,
+        guild_id: Optional[str] = None
     ) -> bool:
         """تحديث رد تلقائي"""
         try:
             success = await db.update_autoresponse(
                 response_id,
+                guild_id,
                 trigger=trigger,
                 response=response,
                 trigger_type=trigger_type,
                 chance=chance,
                 cooldown=cooldown
             )
+            self.invalidate_cache(response_id=response_id)
             
             if success:
                 bot_logger.success(f'✅ تم تحديث رد تلقائي #{response_id}')
@@ -0,0 +1,189 @@
+"""
+system_backup.py - النسخ الاحتياطي لقاعدة البيانات
+===================================================
+نسخ احتياطي دوري لـ database.db أثناء عمل البوت دون نسخة ممزقة:
+
+✅ SQLite Online Backup API في خيط منفصل، من لقطة واحدة (معاملة قراءة)
+✅ فحص النسخة بـ PRAGMA integrity_check قبل اعتمادها
+✅ لقطات مضغوطة (gzip) مع تدوير: يُحتفظ بآخر BACKUP_KEEP نسخة فقط
+✅ وقت ومدة وحجم آخر نسخة متاحة في stats() (تظهر في /stats)
+✅ مع التجزئة (DB_SHARD_MODE) تُنسخ ملفات الأقسام في shards-<الوقت>/ بنفس الطريقة
+
+ملاحظة: القاعدة والأقسام بوضع WAL (database.py)، فمعاملة القراءة الطويلة لا تمنع
+كتابات البوت. النسخ على دفعات غير مناسب هنا: أي كتابة من اتصال آخر بين الدفعات
+تُعيد النسخ من البداية، وفي بوت نشط لا ينتهي.
+"""
+
+import asyncio
+import gzip
+import os
+import shutil
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from database import db, shard_path
+from logger import bot_logger
+
+
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+BACKUP_INTERVAL = int(os.getenv('BACKUP_INTERVAL_HOURS', '6')) * 3600
+BACKUP_DELAY = 900  # أول نسخة بعد 15 دقيقة من الإقلاع
+
+
+class BackupManager:
+    """نسخ احتياطي دوري + تدوير + مقاييس"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self._running = asyncio.Lock()
+        self.last_backup_at: Optional[datetime] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_size: int = 0
+        self.last_path: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.backups_count: int = 0
+
+    # ==================== النسخ (داخل الخيط) ====================
+
+    def _copy(self, source_path: str, target: str):
+        """نسخ قاعدة إلى target وفحصها (يعمل في خيط)"""
+        source = sqlite3.connect(source_path)
+        dest = sqlite3.connect(target)
+        try:
+            # خطوة واحدة = لقطة متسقة؛ في وضع WAL لا تحجب الكتابة
+            source.backup(dest)
+
+            result = [row[0] for row in dest.execute('PRAGMA integrity_check').fetchall()]
+            if result != ['ok']:
+                raise sqlite3.DatabaseError(f'integrity_check: {"; ".join(result[:5])}')
+        finally:
+            dest.close()
+            source.close()
+
+    @staticmethod
+    def _compress(source: str, target: str):
+        with open(source, 'rb') as src, gzip.open(target, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+    # ==================== النسخة الاحتياطية ====================
+
+    def list_backups(self) -> List[str]:
+        """مسارات النسخ الموجودة (الأقدم أولاً)"""
+        if not os.path.isdir(BACKUP_DIR):
+            return []
+        return sorted(
+            os.path.join(BACKUP_DIR, name) for name in os.listdir(BACKUP_DIR)
+            if name.startswith('database-') and name.endswith('.db.gz')
+        )
+
+    def rotate(self) -> int:
+        """حذف النسخ الأقدم من آخر BACKUP_KEEP (مع مجلدات أقسامها)"""
+        removed = 0
+        backups = self.list_backups()
+        for path in backups[:max(len(backups) - BACKUP_KEEP, 0)]:
+            stamp = os.path.basename(path)[len('database-'):-len('.db.gz')]
+            try:
+                os.remove(path)
+                shutil.rmtree(os.path.join(BACKUP_DIR, f'shards-{stamp}'), ignore_errors=True)
+                removed += 1
+            except OSError as e:
+                bot_logger.error(f'خطأ في حذف النسخة {path}: {e}')
+        return removed
+
+    async def _backup_file(self, source_path: str, final_path: str):
+        """نسخ ملف SQLite واحد وفحصه وضغطه"""
+        raw_path = os.path.join(os.path.dirname(final_path), '.' + os.path.basename(final_path) + '.tmp')
+        try:
+            await asyncio.to_thread(self._copy, source_path, raw_path)
+            await asyncio.to_thread(self._compress, raw_path, final_path)
+        except Exception:
+            if os.path.exists(final_path):
+                os.remove(final_path)
+            raise
+        finally:
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
+
+    async def backup(self) -> Optional[str]:
+        """
+        أخذ نسخة احتياطية الآن
+
+        Returns:
+            str: مسار النسخة المضغوطة، أو None عند الفشل
+        """
+        async with self._running:
+            os.makedirs(BACKUP_DIR, exist_ok=True)
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            final_path = os.path.join(BACKUP_DIR, f'database-{stamp}.db.gz')
+            shards_dir = os.path.join(BACKUP_DIR, f'shards-{stamp}')
+
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            try:
+                await self._backup_file(db.db_path, final_path)
+                shard_keys = db.shard_keys()
+                if shard_keys:
+                    os.makedirs(shards_dir, exist_ok=True)
+                for key in shard_keys:
+                    await self._backup_file(shard_path(key), os.path.join(shards_dir, f'{key}.db.gz'))
+            except Exception as e:
+                self.last_error = str(e)
+                bot_logger.error(f'❌ فشل النسخ الاحتياطي: {e}')
+                if os.path.exists(final_path):
+                    os.remove(final_path)
+                shutil.rmtree(shards_dir, ignore_errors=True)
+                return None
+
+            self.last_duration_ms = (loop.time() - start) * 1000
+            self.last_backup_at = datetime.now()
+            self.last_size = os.path.getsize(final_path)
+            self.last_path = final_path
+            self.last_error = None
+            self.backups_count += 1
+
+            removed = self.rotate()
+            bot_logger.performance('db_backup', self.last_duration_ms)
+            bot_logger.info(
+                f'💾 نسخة احتياطية: {final_path} ({self.last_size / 1024 / 1024:.2f} MB, '
+                f'محذوفة: {removed})'
+            )
+            return final_path
+
+    # ==================== الجدولة ====================
+
+    async def _backup_loop(self):
+        await asyncio.sleep(BACKUP_DELAY)
+        while True:
+            try:
+                await self.backup()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                bot_logger.error(f'خطأ في حلقة النسخ الاحتياطي: {e}')
+            await asyncio.sleep(BACKUP_INTERVAL)
+
+    def start(self):
+        """بدء النسخ الاحتياطي الدوري"""
+        if BACKUP_INTERVAL <= 0:
+            return
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self._backup_loop())
+
+    # ==================== المقاييس ====================
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'last_backup_at': self.last_backup_at,
+            'last_duration_ms': self.last_duration_ms,
+            'last_size': self.last_size,
+            'last_error': self.last_error,
+            'backups': self.backups_count,
+            'kept': len(self.list_backups())
+        }
+
+
+# ==================== النسخة العامة ====================
+
+backup_manager = BackupManager()
@@ -0,0 +1,178 @@
+"""
+system_census.py - إحصاء الأعضاء التراكمي
+==========================================
+عدادات لكل سيرفر (بشر، بوتات، الحالات، البوسترز، أعضاء كل دور، القنوات)
+تُبنى مرة واحدة عند التشغيل وتُحدّث من أحداث الأعضاء والحضور والقنوات،
+فتقرأها الأوامر في O(1) بدل المرور على guild.members.
+
+ملاحظة: الحالات (online/idle/dnd) تحتاج intents.presences؛ بدونه الكل offline.
+"""
+
+import asyncio
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import discord
+from logger import bot_logger
+
+
+def _role_ids(member: discord.Member) -> set:
+    """معرفات أدوار العضو (بدون @everyone)"""
+    return {role.id for role in member.roles if not role.is_default()}
+
+
+class GuildCensus:
+    """عدادات سيرفر واحد"""
+
+    __slots__ = ('humans', 'bots', 'statuses', 'boosters', 'roles', 'text_channels', 'voice_channels', 'channels')
+
+    def __init__(self):
+        self.humans = 0
+        self.bots = 0
+        self.statuses: Counter = Counter()  # {'online': n, 'idle': n, 'dnd': n, 'offline': n}
+        self.boosters = 0
+        self.roles: Counter = Counter()  # {role_id: عدد الأعضاء}
+        self.text_channels = 0
+        self.voice_channels = 0
+        self.channels = 0
+
+    @property
+    def members(self) -> int:
+        return self.humans + self.bots
+
+    @property
+    def online(self) -> int:
+        """كل من ليس offline"""
+        return self.members - self.statuses['offline']
+
+    def add_member(self, member: discord.Member, sign: int = 1):
+        if member.bot:
+            self.bots += sign
+        else:
+            self.humans += sign
+        self.statuses[str(member.status)] += sign
+        if member.premium_since is not None:
+            self.boosters += sign
+        for role_id in _role_ids(member):
+            self.roles[role_id] += sign
+
+    def count_channels(self, guild: discord.Guild):
+        self.text_channels = len(guild.text_channels)
+        self.voice_channels = len(guild.voice_channels)
+        self.channels = len(guild.channels)
+
+    def top_roles(self, limit: int = 5) -> List[Tuple[int, int]]:
+        """الأدوار الأكثر أعضاءً: [(role_id, عدد)]"""
+        return [(role_id, count) for role_id, count in self.roles.most_common(limit) if count > 0]
+
+    def to_dict(self) -> Dict:
+        return {
+            'members': self.members,
+            'humans': self.humans,
+            'bots': self.bots,
+            'online': self.online,
+            'statuses': dict(self.statuses),
+            'boosters': self.boosters,
+            'text_channels': self.text_channels,
+            'voice_channels': self.voice_channels,
+            'channels': self.channels
+        }
+
+
+class MemberCensus:
+    """إحصاء كل السيرفرات + مجاميع البوت"""
+
+    def __init__(self):
+        self.guilds: Dict[int, GuildCensus] = {}
+
+    # ==================== البناء ====================
+
+    def build(self, guild: discord.Guild) -> GuildCensus:
+        """بناء إحصاء سيرفر (مرور واحد على الأعضاء)"""
+        census = GuildCensus()
+        for member in guild.members:
+            census.add_member(member)
+        census.count_channels(guild)
+        self.guilds[guild.id] = census
+        return census
+
+    async def build_all(self, guilds: Iterable[discord.Guild]):
+        """بناء إحصاء كل السيرفرات (مع إفساح المجال للحلقة بين السيرفرات)"""
+        for guild in guilds:
+            self.build(guild)
+            await asyncio.sleep(0)
+        bot_logger.debug(f'👥 تم بناء إحصاء الأعضاء لـ {len(self.guilds)} سيرفر')
+
+    def get(self, guild: discord.Guild) -> GuildCensus:
+        """إحصاء السيرفر (يُبنى عند أول طلب إن لم يكن موجوداً)"""
+        census = self.guilds.get(guild.id)
+        if census is None:
+            census = self.build(guild)
+        return census
+
+    def remove_guild(self, guild_id: int):
+        self.guilds.pop(guild_id, None)
+
+    def totals(self) -> Dict[str, int]:
+        """مجاميع كل السيرفرات (O(عدد السيرفرات))"""
+        totals = Counter()
+        for census in self.guilds.values():
+            totals['members'] += census.members
+            totals['humans'] += census.humans
+            totals['bots'] += census.bots
+            totals['channels'] += census.channels
+            totals['text_channels'] += census.text_channels
+            totals['voice_channels'] += census.voice_channels
+        return dict(totals)
+
+    # ==================== الأحداث ====================
+
+    def handle_member_join(self, member: discord.Member):
+        census = self.guilds.get(member.guild.id)
+        if census is not None:
+            census.add_member(member)
+
+    def handle_member_remove(self, member: discord.Member):
+        census = self.guilds.get(member.guild.id)
+        if census is not None:
+            census.add_member(member, -1)
+
+    def handle_member_update(self, before: discord.Member, after: discord.Member):
+        """تغيّر الأدوار أو البوست"""
+        census = self.guilds.get(after.guild.id)
+        if census is None:
+            return
+
+        old, new = _role_ids(before), _role_ids(after)
+        if old != new:
+            for role_id in old - new:
+                census.roles[role_id] -= 1
+            for role_id in new - old:
+                census.roles[role_id] += 1
+
+        if (before.premium_since is None) != (after.premium_since is None):
+            census.boosters += 1 if after.premium_since is not None else -1
+
+    def handle_presence_update(self, before: discord.Member, after: discord.Member):
+        if before.status == after.status:
+            return
+        census = self.guilds.get(after.guild.id)
+        if census is not None:
+            census.statuses[str(before.status)] -= 1
+            census.statuses[str(after.status)] += 1
+
+    def handle_role_delete(self, role: discord.Role):
+        census = self.guilds.get(role.guild.id)
+        if census is not None:
+            census.roles.pop(role.id, None)
+
+    def handle_channel_change(self, channel: discord.abc.GuildChannel):
+        """إنشاء/حذف قناة"""
+        census = self.guilds.get(channel.guild.id)
+        if census is not None:
+            census.count_channels(channel.guild)
+
+
+# ==================== النسخة العامة ====================
+
+member_census = MemberCensus()
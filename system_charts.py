@@ -0,0 +1,127 @@
+"""
+system_charts.py - رسم المخططات خارج حلقة الأحداث
+==================================================
+الرسم يتم في ProcessPoolExecutor (عمليات spawn) حتى لا يُحجب البوت،
+والصور تُخزن لكل (سيرفر, مدة) مع رقم إصدار بيانات الإحصائيات؛
+الإصدار يرتفع مع ملخصات الصوت الساعية وبداية كل يوم (لا مع كل رسالة)،
+وعدادات اليوم الحالي تتحدث في الصورة بعد انتهاء CHART_CACHE_TTL على الأكثر.
+
+العمليات العاملة تستورد main.py كـ __mp_main__ (spawn)، لذلك main.py نقطة
+تشغيل خالية من التهيئة والبوت نفسه في bot_app.py.
+
+matplotlib اختياري: إن لم يكن مثبتاً تُعيد الدوال None ويُستخدم الرسم النصي.
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import charts
+from database import db
+from expiring_map import ExpiringMap
+from logger import bot_logger
+
+
+CHART_WORKERS = 2
+CHART_TIMEOUT = 30  # ثانية
+CHART_CACHE_TTL = 600  # حد تأخر أرقام اليوم الحالي في الصورة
+CHART_CACHE_SIZE = 128
+
+
+class ChartRenderer:
+    """رسم المخططات في عمليات منفصلة مع كاش للصور"""
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.available = True  # False بعد أول ImportError لـ matplotlib
+        # {(guild_id, days): (stats_version, png)}
+        self.cache = ExpiringMap(ttl=CHART_CACHE_TTL, max_size=CHART_CACHE_SIZE, name='charts')
+        self._pending: Dict[Tuple, asyncio.Task] = {}  # رسم جارٍ لنفس المفتاح يُشارك
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: لا نرث خيوط aiosqlite/discord من العملية الرئيسية
+            self._executor = ProcessPoolExecutor(
+                max_workers=CHART_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    async def _run(self, func, *args) -> Optional[bytes]:
+        """تشغيل دالة رسم في العمليات العاملة"""
+        if not self.available:
+            return None
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            png = await asyncio.wait_for(
+                loop.run_in_executor(self._get_executor(), func, *args),
+                CHART_TIMEOUT
+            )
+            bot_logger.performance(f'chart:{func.__name__}', (loop.time() - start) * 1000)
+            return png
+        except ImportError:
+            self.available = False
+            bot_logger.warning('⚠️ matplotlib غير مثبت - سيتم استخدام الرسم النصي')
+        except BrokenProcessPool:
+            self._executor = None
+            bot_logger.error('عمليات الرسم توقفت - ستُنشأ من جديد في الطلب التالي')
+        except asyncio.TimeoutError:
+            bot_logger.warning(f'⏱️ انتهت مهلة الرسم: {func.__name__}')
+        except Exception as e:
+            bot_logger.error(f'خطأ في الرسم {func.__name__}: {e}')
+        return None
+
+    async def analytics_chart(self, guild_id: str, days: int, stats: List[Dict]) -> Optional[bytes]:
+        """
+        صورة لوحة /analytics (من الكاش إن لم تتغير الإحصائيات)
+
+        Returns:
+            bytes: PNG، أو None إن لم يتوفر الرسم
+        """
+        if not self.available:
+            return None
+
+        key = (guild_id, days)
+        version = db.stats_version(guild_id)
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        pending_key = (guild_id, days, version)
+        task = self._pending.get(pending_key)
+        if task is None:
+            task = asyncio.create_task(self._render_analytics(guild_id, days, version, stats))
+            self._pending[pending_key] = task
+            task.add_done_callback(lambda _: self._pending.pop(pending_key, None))
+        return await asyncio.shield(task)
+
+    async def _render_analytics(self, guild_id: str, days: int, version: int, stats: List[Dict]) -> Optional[bytes]:
+        heatmap = await self._voice_heatmap(guild_id, days)
+        png = await self._run(charts.render_analytics, [dict(s) for s in stats], heatmap)
+        if png is not None:
+            self.cache[(guild_id, days)] = (version, png)
+        return png
+
+    async def _voice_heatmap(self, guild_id: str, days: int) -> List[List[float]]:
+        """7 × 24: ساعات التواجد الصوتي لكل (يوم أسبوع, ساعة)"""
+        grid = [[0.0] * 24 for _ in range(7)]
+        for row in await db.get_voice_hourly(guild_id, days):
+            hour = datetime.strptime(row['hour'], '%Y-%m-%d %H:00')
+            grid[hour.weekday()][hour.hour] += row['occupant_minutes'] / 60
+        return grid
+
+    def shutdown(self):
+        """إيقاف العمليات العاملة"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# ==================== النسخة العامة ====================
+
+chart_renderer = ChartRenderer()
@@ -0,0 +1,267 @@
+"""
+system_db_profiler.py - قياس استعلامات قاعدة البيانات
+======================================================
+غلاف لاتصال aiosqlite يقيس كل استعلام (بما فيها db.conn.execute المباشرة)
+ويجمع النتائج حسب قالب الجملة (المسافات موحدة، القيم الحرفية وقوائم IN → ?):
+
+✅ العدد، الزمن الكلي، p50/p95/p99، أقصى زمن، عدد الصفوف المُعادة
+✅ انتظار قفل الكتابة (execute/fetchone/fetchall) منفصلاً عن زمن التنفيذ
+✅ سجل الاستعلامات البطيئة (≥ DB_SLOW_QUERY_MS) مع إخفاء قيم المعاملات
+✅ أمر /debug db لصاحب البوت
+
+DB_PROFILE=0 يعطّل الغلاف تماماً (الاتصال الخام يُستخدم كما هو).
+"""
+
+import os
+import re
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+from logger import bot_logger
+
+
+PROFILE_ENABLED = os.getenv('DB_PROFILE', '1') != '0'
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '100'))
+SLOW_LOG_SIZE = 200
+LATENCY_SAMPLES = 512  # آخر N زمن لكل قالب (للنسب المئوية)
+TEMPLATE_MAX_LENGTH = 300
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=2048)
+def statement_template(sql: str) -> str:
+    """قالب الجملة: القيم الحرفية (نصوص/أرقام) وقوائم IN (?, ?, ...) تُوحّد"""
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (?, …)', sql)
+    return sql[:TEMPLATE_MAX_LENGTH]
+
+
+def redact_params(params: Any) -> str:
+    """أنواع المعاملات فقط (بدون القيم)"""
+    if not params:
+        return ''
+    if isinstance(params, dict):
+        return ', '.join(f'{k}=<{type(v).__name__}>' for k, v in params.items())
+    return ', '.join(f'<{type(v).__name__}>' for v in params)
+
+
+class Sample:
+    """زمن تنفيذ واحد (execute + ما قُرئ من مؤشره) - يملكه المؤشر حتى تُضاف له أزمنة fetch"""
+
+    __slots__ = ('ms',)
+
+    def __init__(self, ms: float):
+        self.ms = ms
+
+
+class QueryStats:
+    """إحصائيات قالب جملة واحد"""
+
+    __slots__ = ('count', 'total_ms', 'max_ms', 'lock_wait_ms', 'rows', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.lock_wait_ms = 0.0
+        self.rows = 0
+        self.samples: Deque[Sample] = deque(maxlen=LATENCY_SAMPLES)
+
+    def percentile(self, pct: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(sample.ms for sample in self.samples)
+        return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'total_ms': self.total_ms,
+            'avg_ms': self.total_ms / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max_ms,
+            'lock_wait_ms': self.lock_wait_ms,
+            'rows': self.rows
+        }
+
+
+class QueryProfiler:
+    """تجميع أزمنة الاستعلامات حسب القالب + سجل البطيئة"""
+
+    def __init__(self):
+        self.enabled = PROFILE_ENABLED
+        self.slow_ms = SLOW_QUERY_MS
+        self.stats: Dict[str, QueryStats] = {}
+        self.slow_log: Deque[Dict[str, Any]] = deque(maxlen=SLOW_LOG_SIZE)
+        self.since = datetime.now()
+
+    def _get(self, template: str) -> QueryStats:
+        stats = self.stats.get(template)
+        if stats is None:
+            stats = self.stats[template] = QueryStats()
+        return stats
+
+    # ==================== التسجيل ====================
+
+    def record(self, sql: str, duration_ms: float, params: Any = None) -> Sample:
+        """تسجيل تنفيذ جملة - يُعيد عينته ليضيف لها المؤشر زمن القراءة"""
+        template = statement_template(sql)
+        stats = self._get(template)
+        stats.count += 1
+        stats.total_ms += duration_ms
+        sample = Sample(duration_ms)
+        stats.samples.append(sample)
+        if duration_ms > stats.max_ms:
+            stats.max_ms = duration_ms
+        self._check_slow(template, duration_ms, params)
+        return sample
+
+    def record_fetch(self, template: str, sample: Sample, duration_ms: float, rows: int):
+        """زمن قراءة نتائج المؤشر يُضاف لعينة تنفيذه هو (لا لآخر تنفيذ للقالب على أي اتصال)"""
+        stats = self._get(template)
+        stats.total_ms += duration_ms
+        stats.rows += rows
+        sample.ms += duration_ms
+        if sample.ms > stats.max_ms:
+            stats.max_ms = sample.ms
+        self._check_slow(template, duration_ms, None, fetch=True)
+
+    def record_lock_wait(self, sql: str, duration_ms: float):
+        if self.enabled:
+            self._get(statement_template(sql)).lock_wait_ms += duration_ms
+
+    def _check_slow(self, template: str, duration_ms: float, params: Any, fetch: bool = False):
+        if duration_ms < self.slow_ms:
+            return
+        entry = {
+            'at': datetime.now(),
+            'sql': template,
+            'ms': duration_ms,
+            'params': redact_params(params),
+            'phase': 'fetch' if fetch else 'execute'
+        }
+        self.slow_log.append(entry)
+        bot_logger.warning(f'🐢 استعلام بطيء ({duration_ms:.1f}ms, {entry["phase"]}): {template[:120]}')
+
+    # ==================== القراءة ====================
+
+    def top(self, limit: int = 10, order: str = 'total_ms') -> List[Dict[str, Any]]:
+        """أعلى القوالب حسب order (total_ms | count | p95_ms | max_ms | lock_wait_ms | rows)"""
+        rows = [{'sql': template, **stats.to_dict()} for template, stats in self.stats.items()]
+        rows.sort(key=lambda r: r[order], reverse=True)
+        return rows[:limit]
+
+    def slow_queries(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """آخر الاستعلامات البطيئة (الأحدث أولاً)"""
+        return list(self.slow_log)[::-1][:limit]
+
+    def totals(self) -> Dict[str, Any]:
+        count = sum(s.count for s in self.stats.values())
+        return {
+            'statements': len(self.stats),
+            'count': count,
+            'total_ms': sum(s.total_ms for s in self.stats.values()),
+            'lock_wait_ms': sum(s.lock_wait_ms for s in self.stats.values()),
+            'slow': len(self.slow_log),
+            'since': self.since
+        }
+
+    def reset(self):
+        self.stats.clear()
+        self.slow_log.clear()
+        self.since = datetime.now()
+
+    # ==================== الغلاف ====================
+
+    def wrap(self, conn):
+        """تغليف اتصال aiosqlite (أو إعادته كما هو إن كان القياس معطلاً)"""
+        return ProfiledConnection(conn, self) if self.enabled else conn
+
+
+class ProfiledCursor:
+    """مؤشر يقيس fetch* ويعدّ الصفوف (على عينة تنفيذه)"""
+
+    __slots__ = ('_cursor', '_profiler', '_template', '_sample')
+
+    def __init__(self, cursor, profiler: QueryProfiler, template: str, sample: Sample):
+        self._cursor = cursor
+        self._profiler = profiler
+        self._template = template
+        self._sample = sample
+
+    def _fetched(self, start: float, rows: int):
+        self._profiler.record_fetch(self._template, self._sample, (time.perf_counter() - start) * 1000, rows)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __aiter__(self):
+        return self._cursor.__aiter__()
+
+    async def fetchone(self):
+        start = time.perf_counter()
+        row = await self._cursor.fetchone()
+        self._fetched(start, 1 if row else 0)
+        return row
+
+    async def fetchall(self):
+        start = time.perf_counter()
+        rows = await self._cursor.fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    async def fetchmany(self, size: Optional[int] = None):
+        start = time.perf_counter()
+        rows = await (self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany())
+        self._fetched(start, len(rows))
+        return rows
+
+
+class ProfiledConnection:
+    """اتصال aiosqlite يقيس execute/executemany/commit (وباقي الخصائص تمر كما هي)"""
+
+    __slots__ = ('_conn', '_profiler')
+
+    def __init__(self, conn, profiler: QueryProfiler):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_profiler', profiler)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        # row_factory وغيرها تُضبط على الاتصال الحقيقي
+        setattr(self._conn, name, value)
+
+    async def execute(self, sql: str, parameters: Iterable[Any] = ()):
+        start = time.perf_counter()
+        cursor = await self._conn.execute(sql, parameters)
+        sample = self._profiler.record(sql, (time.perf_counter() - start) * 1000, parameters)
+        return ProfiledCursor(cursor, self._profiler, statement_template(sql), sample)
+
+    async def executemany(self, sql: str, parameters: Iterable[Iterable[Any]]):
+        start = time.perf_counter()
+        cursor = await self._conn.executemany(sql, parameters)
+        sample = self._profiler.record(sql, (time.perf_counter() - start) * 1000)
+        return ProfiledCursor(cursor, self._profiler, statement_template(sql), sample)
+
+    async def commit(self):
+        start = time.perf_counter()
+        await self._conn.commit()
+        self._profiler.record('COMMIT', (time.perf_counter() - start) * 1000)
+
+
+# ==================== النسخة العامة ====================
+
+query_profiler = QueryProfiler()
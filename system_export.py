@@ -0,0 +1,271 @@
+"""
+system_export.py - تصدير الجداول للتحليل
+==========================================
+تصدير stats و logs و levels و analytics_events لسيرفر ومدة زمنية
+إلى CSV (مع gzip اختياري) أو Parquet (مع pyarrow، بضغط zstd)
+
+✅ قراءة على دفعات (keyset على rowid) - الجدول لا يُحمّل كاملاً في الذاكرة
+✅ القفل يُحرر بين الدفعات فلا يتوقف البوت أثناء التصدير
+✅ تصدير تراكمي (high-water mark لكل مهمة/جدول/سيرفر) للمهام الليلية
+✅ أمر /export للإدارة + واجهة سطر أوامر:
+
+    python system_export.py logs --guild 123 --since 2026-01-01 --format parquet --job nightly
+"""
+
+import argparse
+import asyncio
+import csv
+import gzip
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from database import db
+from system_analytics import analytics_system
+from logger import bot_logger
+
+# pyarrow اختياري (Parquet فقط)
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+EXPORT_DIR = os.getenv('EXPORT_DIR', 'exports')
+EXPORT_CHUNK_SIZE = 5000
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    """وصف جدول قابل للتصدير"""
+    database: str            # 'main' أو 'analytics'
+    date_column: str         # عمود التاريخ لفلترة المدة
+    watermark: Optional[str] # 'rowid' (جداول إلحاق فقط) أو 'date' (أيام مكتملة) أو None (لقطة كاملة)
+
+
+EXPORT_TABLES: Dict[str, ExportSpec] = {
+    'stats': ExportSpec('main', 'date', 'date'),
+    'logs': ExportSpec('main', 'created_at', 'rowid'),
+    'levels': ExportSpec('main', 'last_xp_time', None),
+    'analytics_events': ExportSpec('analytics', 'created_at', 'rowid'),
+}
+
+# أنواع SQLite → أنواع Parquet
+_ARROW_TYPES = {'INTEGER': 'int64', 'REAL': 'float64'}
+
+
+async def _fetchall(spec: ExportSpec, sql: str, params: tuple = (), guild_id: Optional[str] = None) -> List[Dict]:
+    if spec.database == 'analytics':
+        return await analytics_system.fetchall(sql, params)
+    # جداول السيرفرات قد تكون في ملف قسم (DB_SHARD_MODE)
+    async with db.for_guild(guild_id) as store:
+        return await store.fetchall(sql, params)
+
+
+# ==================== العلامة المائية ====================
+
+async def get_watermark(job: str, table: str, guild_id: str) -> Optional[str]:
+    row = await db.fetchone(
+        'SELECT value FROM export_watermarks WHERE job = ? AND table_name = ? AND guild_id = ?',
+        (job, table, guild_id)
+    )
+    return row['value'] if row else None
+
+
+async def set_watermark(job: str, table: str, guild_id: str, value: str):
+    await db.execute('''
+        INSERT INTO export_watermarks (job, table_name, guild_id, value, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(job, table_name, guild_id) DO UPDATE SET
+            value = excluded.value, updated_at = excluded.updated_at
+    ''', (job, table, guild_id, value))
+
+
+# ==================== القراءة ====================
+
+async def iter_rows(
+    table: str,
+    guild_id: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    after_rowid: int = 0,
+    after_date: Optional[str] = None,
+    before_date: Optional[str] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> AsyncIterator[List[Dict]]:
+    """
+    دفعات الصفوف بترتيب rowid (كل دفعة استعلام مستقل)
+
+    since/until: مدة [since, until) على عمود التاريخ
+    after_rowid / after_date / before_date: شروط التصدير التراكمي
+    """
+    spec = EXPORT_TABLES[table]
+    conditions = ['guild_id = ?', 'rowid > ?']
+    params: List[Any] = [guild_id]
+    filters: List[Any] = []
+
+    for op, value in (('>=', since), ('<', until), ('>', after_date), ('<', before_date)):
+        if value is not None:
+            conditions.append(f'{spec.date_column} {op} ?')
+            filters.append(value)
+
+    sql = (
+        f'SELECT rowid AS _rowid, * FROM {table} WHERE {" AND ".join(conditions)} '
+        f'ORDER BY rowid LIMIT ?'
+    )
+    last = after_rowid
+    while True:
+        rows = await _fetchall(spec, sql, (*params, last, *filters, chunk_size), guild_id)
+        if not rows:
+            return
+        last = rows[-1]['_rowid']
+        yield rows
+        if len(rows) < chunk_size:
+            return
+
+
+# ==================== الكتابة ====================
+
+class _CsvWriter:
+    def __init__(self, path: str):
+        self.file = gzip.open(path, 'wt', newline='', encoding='utf-8') if path.endswith('.gz') \
+            else open(path, 'w', newline='', encoding='utf-8')
+        self.writer: Optional[csv.DictWriter] = None
+
+    def write(self, rows: List[Dict]):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(rows[0]))
+            self.writer.writeheader()
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path: str, columns: List[Dict]):
+        fields = [
+            pyarrow.field(c['name'], getattr(pyarrow, _ARROW_TYPES.get((c['type'] or '').upper(), 'string'))())
+            for c in columns
+        ]
+        self.schema = pyarrow.schema(fields)
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, rows: List[Dict]):
+        self.writer.write_table(pyarrow.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+async def _table_columns(table: str) -> List[Dict]:
+    spec = EXPORT_TABLES[table]
+    return await _fetchall(spec, f'PRAGMA table_info({table})')
+
+
+# ==================== التصدير ====================
+
+async def export_table(
+    table: str,
+    guild_id: str,
+    fmt: str = 'csv',
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    job: Optional[str] = None,
+    out_dir: str = EXPORT_DIR,
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Dict[str, Any]:
+    """
+    تصدير جدول لسيرفر إلى ملف
+
+    Args:
+        fmt: 'csv' أو 'csv.gz' أو 'parquet'
+        job: اسم مهمة التصدير التراكمي (None = تصدير كامل للمدة)
+
+    Returns:
+        Dict: {'path', 'rows', 'watermark'} (path = None إن لم توجد صفوف جديدة)
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f'جدول غير مدعوم: {table}')
+    if fmt not in ('csv', 'csv.gz', 'parquet'):
+        raise ValueError(f'صيغة غير مدعومة: {fmt}')
+    if fmt == 'parquet' and pyarrow is None:
+        raise ValueError('Parquet يتطلب تثبيت pyarrow')
+
+    spec = EXPORT_TABLES[table]
+    query: Dict[str, Any] = {'since': since, 'until': until}
+    watermark = None
+
+    if job:
+        if spec.watermark is None:
+            raise ValueError(f'{table} لقطة متغيرة ولا يدعم التصدير التراكمي')
+        watermark = await get_watermark(job, table, guild_id)
+        if spec.watermark == 'rowid':
+            query['after_rowid'] = int(watermark or 0)
+        else:
+            # أيام مكتملة فقط: صف اليوم الحالي ما زال يتغير
+            query['after_date'] = watermark
+            query['before_date'] = datetime.now().strftime('%Y-%m-%d')
+
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(out_dir, f'{table}-{guild_id}-{stamp}.{fmt}')
+
+    writer = None
+    rows_written = 0
+    new_watermark = watermark
+    try:
+        async for chunk in iter_rows(table, guild_id, chunk_size=chunk_size, **query):
+            if spec.watermark == 'rowid':
+                new_watermark = str(chunk[-1]['_rowid'])
+            elif spec.watermark == 'date':
+                new_watermark = max([r[spec.date_column] for r in chunk] + [new_watermark or ''])
+            for row in chunk:
+                del row['_rowid']
+
+            if writer is None:
+                writer = _ParquetWriter(path, await _table_columns(table)) if fmt == 'parquet' else _CsvWriter(path)
+            await asyncio.to_thread(writer.write, chunk)
+            rows_written += len(chunk)
+    finally:
+        if writer is not None:
+            await asyncio.to_thread(writer.close)
+
+    if writer is None:
+        path = None
+    elif job and new_watermark is not None:
+        # العلامة تُحدّث بعد اكتمال الملف فقط
+        await set_watermark(job, table, guild_id, new_watermark)
+
+    bot_logger.info(f'📤 تصدير {table} لـ {guild_id}: {rows_written} صف → {path}')
+    return {'path': path, 'rows': rows_written, 'watermark': new_watermark}
+
+
+# ==================== سطر الأوامر ====================
+
+async def _cli(args: argparse.Namespace):
+    await db.connect()
+    await analytics_system.init()
+    try:
+        result = await export_table(
+            args.table, args.guild, args.format, args.since, args.until, args.job, args.out, args.chunk_size
+        )
+        print(f"{result['rows']} rows -> {result['path']} (watermark: {result['watermark']})")
+    finally:
+        await analytics_system.close()
+        await db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='تصدير جداول البوت على دفعات')
+    parser.add_argument('table', choices=sorted(EXPORT_TABLES))
+    parser.add_argument('--guild', required=True)
+    parser.add_argument('--since', help='YYYY-MM-DD (شامل)')
+    parser.add_argument('--until', help='YYYY-MM-DD (غير شامل)')
+    parser.add_argument('--format', default='csv', choices=['csv', 'csv.gz', 'parquet'])
+    parser.add_argument('--job', help='اسم مهمة تراكمية (تصدير الصفوف الجديدة فقط)')
+    parser.add_argument('--out', default=EXPORT_DIR)
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+    asyncio.run(_cli(parser.parse_args()))
@@ -4,104 +4,234 @@
 """
 
 import discord
-from typing import Optional, Dict, List
+import asyncio
+from bisect import bisect_right
+from typing import Optional, Dict, List, Tuple
 from datetime import datetime
 from database import db
+from records import Record, record_class
 from config_manager import config
+from logger import bot_logger
 import embeds
 
+# مدة تجميع الانضمامات المتزامنة قبل جلب الدعوات (ثواني)
+INVITE_COALESCE_DELAY = 1.5
+
+InviteLeaderboardRow = record_class('invite_counts', ('user_id', 'invites'))
+InviteRewardRow = record_class('invite_rewards', ('required_invites', 'role_id'))
+
+
+class CachedInvite:
+    """نسخة خفيفة من الدعوة في الكاش"""
+
+    __slots__ = ('code', 'uses', 'max_uses', 'inviter')
+
+    def __init__(self, code: str, uses: int, max_uses: int = 0, inviter: Optional[discord.abc.User] = None):
+        self.code = code
+        self.uses = uses or 0
+        self.max_uses = max_uses or 0
+        self.inviter = inviter
+
+    @classmethod
+    def from_invite(cls, invite: discord.Invite) -> 'CachedInvite':
+        return cls(invite.code, invite.uses, invite.max_uses, invite.inviter)
+
+
 class InviteTracker:
-    """تتبع الدعوات"""
+    """
+    تتبع الدعوات
+
+    الانضمامات المتزامنة في نفس السيرفر تُجمع في طلب guild.invites() واحد،
+    ثم تُقارن الاستخدامات مع الكاش مرة واحدة وتوزع على الأعضاء بترتيب ثابت.
+    الكاش يُحدّث من on_invite_create / on_invite_delete بدون polling.
+    """
 
     def __init__(self):
-        self.invites_cache = {}  # {guild_id: {code: Invite}}
+        self.invites_cache: Dict[int, Dict[str, CachedInvite]] = {}  # {guild_id: {code: CachedInvite}}
+        # دعوات حُذفت منذ آخر مطابقة (تبقى حتى المطابقة التالية لاحتساب آخر استخدام)
+        self._tombstones: Dict[int, Dict[str, CachedInvite]] = {}
+        self._pending: Dict[int, List[Tuple[discord.Member, asyncio.Future]]] = {}
+        self._reconcile_tasks: Dict[int, asyncio.Task] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
 
     async def cache_invites(self, guild: discord.Guild):
         """تخزين جميع الدعوات الحالية"""
         try:
             invites = await guild.invites()
-            self.invites_cache[guild.id] = {inv.code: inv for inv in invites}
+            self.invites_cache[guild.id] = {inv.code: CachedInvite.from_invite(inv) for inv in invites}
+            self._tombstones.pop(guild.id, None)
         except discord.Forbidden:
-            print(f"⚠️ لا يمكن الوصول لدعوات {guild.name} - تحقق من الصلاحيات!")
+            bot_logger.warning(f"لا يمكن الوصول لدعوات {guild.name} - تحقق من الصلاحيات!")
+
+    # ==================== Gateway Events ====================
+
+    def handle_invite_create(self, invite: discord.Invite):
+        """إضافة دعوة جديدة للكاش (on_invite_create)"""
+        if not invite.guild:
+            return
+        self.invites_cache.setdefault(invite.guild.id, {})[invite.code] = CachedInvite.from_invite(invite)
 
-    async def find_inviter(self, member: discord.Member) -> Optional[discord.Member]:
+    def handle_invite_delete(self, invite: discord.Invite):
+        """
+        حذف دعوة من الكاش (on_invite_delete)
+
+        الدعوات التي تنتهي بسبب max_uses تُحذف بعد آخر استخدام، وقد يصل الحذف
+        قبل حدث الانضمام؛ لذلك تُنقل لـ tombstones حتى المطابقة التالية لتحتسبها.
+        """
+        if not invite.guild:
+            return
+        guild_id = invite.guild.id
+        cached = self.invites_cache.get(guild_id, {}).pop(invite.code, None)
+        if cached is not None:
+            self._tombstones.setdefault(guild_id, {})[invite.code] = cached
+
+    # ==================== Reconciler ====================
+
+    async def find_inviter(self, member: discord.Member) -> Optional[discord.abc.User]:
         """
         اكتشاف من دعا العضو
 
         Returns:
-            المستخدم الذي دعا أو None
+            المستخدم الذي دعا أو None (vanity / غير معروف)
         """
         guild = member.guild
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(guild.id, []).append((member, future))
+
+        if guild.id not in self._reconcile_tasks:
+            self._reconcile_tasks[guild.id] = asyncio.create_task(self._reconcile(guild))
 
-        # جلب الدعوات الجديدة
+        return await future
+
+    async def _reconcile(self, guild: discord.Guild):
+        """جلب الدعوات مرة واحدة لكل دفعة انضمامات ومطابقتها"""
+        batch: List[Tuple[discord.Member, asyncio.Future]] = []
+        results: Dict[int, Optional[discord.abc.User]] = {}
         try:
-            new_invites = await guild.invites()
-        except discord.Forbidden:
-            return None
+            await asyncio.sleep(INVITE_COALESCE_DELAY)
+            lock = self._locks.setdefault(guild.id, asyncio.Lock())
+            async with lock:
+                batch = self._pending.pop(guild.id, [])
+                # الانضمامات الجديدة أثناء الجلب تبدأ دفعة جديدة
+                self._reconcile_tasks.pop(guild.id, None)
+                if not batch:
+                    return
 
-        # المقارنة مع الكاش
-        old_invites = self.invites_cache.get(guild.id, {})
+                try:
+                    fetched = await guild.invites()
+                except (discord.Forbidden, discord.HTTPException) as e:
+                    bot_logger.debug(f'فشل جلب دعوات {guild.name}: {e}')
+                    return
 
-        for invite in new_invites:
-            old_invite = old_invites.get(invite.code)
+                results = self._attribute(guild, [m for m, _ in batch], fetched)
+                self.invites_cache[guild.id] = {inv.code: CachedInvite.from_invite(inv) for inv in fetched}
+                self._tombstones.pop(guild.id, None)
 
-            # إذا زاد الاستخدام
-            if old_invite and invite.uses > old_invite.uses:
-                # تحديث الكاش
-                await self.cache_invites(guild)
+                for member, _ in batch:
+                    inviter = results.get(member.id)
+                    if inviter:
+                        await self.record_invite(guild.id, member.id, inviter.id)
+        except Exception as e:
+            bot_logger.exception(f'خطأ في مطابقة الدعوات: {guild.name}', e)
+        finally:
+            if self._reconcile_tasks.get(guild.id) is asyncio.current_task():
+                self._reconcile_tasks.pop(guild.id, None)
+            # لا مطابقة لاحقة تنتظر القفل → حذفه (يُنشأ من جديد مع أول انضمام)
+            if guild.id not in self._reconcile_tasks and not self._pending.get(guild.id):
+                self._locks.pop(guild.id, None)
+            for member, future in batch:
+                if not future.done():
+                    future.set_result(results.get(member.id))
 
-                # حفظ في DB
-                await self.record_invite(guild.id, member.id, invite.inviter.id if invite.inviter else None)
+    def _attribute(
+        self,
+        guild: discord.Guild,
+        members: List[discord.Member],
+        fetched: List[discord.Invite]
+    ) -> Dict[int, Optional[discord.abc.User]]:
+        """
+        مقارنة الاستخدامات مع الكاش في مرور واحد وتوزيعها على الأعضاء
 
-                return invite.inviter
+        الترتيب ثابت: الأعضاء حسب وقت الانضمام ثم الـ ID، والدعوات حسب الكود.
+        الأعضاء الزائدون عن الاستخدامات المرصودة → vanity / غير معروف (None).
+        """
+        old = {**self._tombstones.get(guild.id, {}), **self.invites_cache.get(guild.id, {})}
+        seen = set()
+        credits: List[Tuple[str, Optional[discord.abc.User], int]] = []
 
-        # تحديث الكاش في كل الأحوال
-        await self.cache_invites(guild)
-        return None
+        for invite in fetched:
+            seen.add(invite.code)
+            before = old.get(invite.code)
+            delta = (invite.uses or 0) - (before.uses if before else 0)
+            if delta > 0:
+                credits.append((invite.code, invite.inviter, delta))
 
-    async def record_invite(self, guild_id: int, user_id: int, inviter_id: Optional[int]):
-        """تسجيل دعوة في قاعدة البيانات"""
-        await db.conn.execute('''
-            INSERT INTO invites (guild_id, user_id, inviter_id, created_at)
-            VALUES (?, ?, ?, ?)
-        ''', (str(guild_id), str(user_id), str(inviter_id) if inviter_id else None, datetime.now().isoformat()))
-        await db.conn.commit()
+        # دعوات اختفت بعد الوصول لـ max_uses → استُخدمت مرة أخيرة
+        for code, cached in old.items():
+            if code not in seen and cached.max_uses and cached.uses == cached.max_uses - 1:
+                credits.append((code, cached.inviter, 1))
+
+        credits.sort(key=lambda c: c[0])
+        ordered = sorted(members, key=lambda m: (m.joined_at.timestamp() if m.joined_at else 0, m.id))
+
+        results: Dict[int, Optional[discord.abc.User]] = {}
+        slots = [(code, inviter) for code, inviter, delta in credits for _ in range(delta)]
+        for member, (code, inviter) in zip(ordered, slots):
+            if inviter:
+                results[member.id] = guild.get_member(inviter.id) or inviter
+            bot_logger.debug(f'Invite reconcile: {member} ← {code}')
+
+        unknown = ordered[len(slots):]
+        if unknown:
+            source = 'vanity' if 'VANITY_URL' in guild.features else 'unknown'
+            for member in unknown:
+                results.setdefault(member.id, None)
+            bot_logger.debug(f'Invite reconcile: {len(unknown)} انضمام بدون دعوة مطابقة ({source}) في {guild.name}')
+
+        return results
+
+    async def record_invite(self, guild_id: int, user_id: int, inviter_id: Optional[int]) -> int:
+        """تسجيل دعوة في قاعدة البيانات (يعيد عدد دعوات الداعي بعد التسجيل)"""
+        return await db.record_invite(str(guild_id), str(user_id), str(inviter_id) if inviter_id else None)
 
     async def get_user_invites(self, guild_id: str, user_id: str) -> int:
-        """عدد الدعوات الناجحة للمستخدم"""
-        cursor = await db.conn.execute('''
-            SELECT COUNT(*) FROM invites 
-            WHERE guild_id = ? AND inviter_id = ?
-        ''', (guild_id, user_id))
-        row = await cursor.fetchone()
-        return row[0] if row else 0
-
-    async def get_invite_leaderboard(self, guild_id: str, limit: int = 10) -> List[Dict]:
-        """لوحة صدارة الدعوات"""
-        cursor = await db.conn.execute('''
-            SELECT inviter_id, COUNT(*) as count
-            FROM invites
-            WHERE guild_id = ? AND inviter_id IS NOT NULL
-            GROUP BY inviter_id
-            ORDER BY count DESC
-            LIMIT ?
-        ''', (guild_id, limit))
-        rows = await cursor.fetchall()
-        return [{'user_id': row[0], 'invites': row[1]} for row in rows]
+        """عدد الدعوات الناجحة للمستخدم (من invite_counts)"""
+        return await db.get_invite_count(guild_id, user_id)
+
+    async def get_invite_leaderboard(self, guild_id: str, limit: int = 10) -> List[Record]:
+        """لوحة صدارة الدعوات (من invite_counts)"""
+        rows = await db.get_invite_counts_top(guild_id, limit)
+        return [InviteLeaderboardRow(row.inviter_id, row.count) for row in rows]
 
     async def get_invited_by(self, guild_id: str, user_id: str) -> Optional[str]:
         """من دعا هذا المستخدم؟"""
-        cursor = await db.conn.execute('''
+        row = await db.fetchone('''
             SELECT inviter_id FROM invites
             WHERE guild_id = ? AND user_id = ?
             LIMIT 1
         ''', (guild_id, user_id))
-        row = await cursor.fetchone()
         return row[0] if row else None
 
 class InviteRewards:
     """نظام مكافآت الدعوات"""
 
+    def __init__(self):
+        # {guild_id: (required_invites مرتبة تصاعدياً, role_ids بنفس الترتيب)}
+        self._thresholds: Dict[str, Tuple[List[int], List[str]]] = {}
+
+    async def _get_thresholds(self, guild_id: str) -> Tuple[List[int], List[str]]:
+        """قائمة المكافآت المرتبة (تُحمّل مرة واحدة لكل سيرفر)"""
+        cached = self._thresholds.get(guild_id)
+        if cached is None:
+            rewards = await self.get_rewards(guild_id)
+            cached = ([r.required_invites for r in rewards], [r.role_id for r in rewards])
+            self._thresholds[guild_id] = cached
+        return cached
+
+    def invalidate(self, guild_id: str):
+        """مسح كاش المكافآت لسيرفر"""
+        self._thresholds.pop(guild_id, None)
+
     async def check_rewards(self, guild: discord.Guild, inviter: discord.Member, invite_count: int):
         """
         التحقق من المكافآت وإعطائها
@@ -111,33 +241,35 @@ class InviteRewards:
             inviter: المستخدم الذي دعا
             invite_count: عدد دعواته الحالي
         """
-        # جلب المكافآت المعدّة
-        rewards = await self.get_rewards(str(guild.id))
-
-        for reward in rewards:
-            required = reward['required_invites']
-            role_id = reward['role_id']
-
-            # إذا وصل العدد المطلوب
-            if invite_count == required:
-                role = guild.get_role(int(role_id))
-                if role:
-                    try:
-                        # إعطاء الدور
-                        await inviter.add_roles(role)
-
-                        # إرسال DM
-                        await self.send_reward_dm(inviter, role, invite_count)
-
-                        # تسجيل
-                        await db.add_log(
-                            str(guild.id),
-                            'invite_reward',
-                            str(inviter.id),
-                            details=f'Role: {role.name}, Invites: {invite_count}'
-                        )
-                    except discord.Forbidden:
-                        pass
+        required, role_ids = await self._get_thresholds(str(guild.id))
+
+        # كل العتبات ≤ العدد الحالي (bisect_right): دفعة انضمامات قد تتخطى عتبة دون أن تساويها
+        held = {role.id for role in inviter.roles}
+        earned = []
+        for threshold, role_id in zip(required[:bisect_right(required, invite_count)], role_ids):
+            role = guild.get_role(int(role_id))
+            if role and role.id not in held:
+                earned.append((threshold, role))
+        if not earned:
+            return
+
+        try:
+            # إعطاء الأدوار في طلب واحد
+            await inviter.add_roles(*(role for _, role in earned))
+        except discord.Forbidden:
+            return
+
+        for threshold, role in earned:
+            # إرسال DM
+            await self.send_reward_dm(inviter, role, invite_count)
+
+            # تسجيل
+            await db.add_log(
+                str(guild.id),
+                'invite_reward',
+                str(inviter.id),
+                details=f'Role: {role.name}, Required: {threshold}, Invites: {invite_count}'
+            )
 
     async def send_reward_dm(self, user: discord.Member, role: discord.Role, invite_count: int):
         """إرسال رسالة خاصة بالمكافأة"""
@@ -157,45 +289,38 @@ class InviteRewards:
 
     async def add_reward(self, guild_id: str, required_invites: int, role_id: str):
         """إضافة مكافأة جديدة"""
-        await db.conn.execute('''
+        await db.execute('''
             INSERT INTO invite_rewards (guild_id, required_invites, role_id)
             VALUES (?, ?, ?)
             ON CONFLICT(guild_id, required_invites) 
             DO UPDATE SET role_id = excluded.role_id
         ''', (guild_id, required_invites, role_id))
-        await db.conn.commit()
+        self.invalidate(guild_id)
 
     async def remove_reward(self, guild_id: str, required_invites: int):
         """حذف مكافأة"""
-        await db.conn.execute('''
+        await db.execute('''
             DELETE FROM invite_rewards
             WHERE guild_id = ? AND required_invites = ?
         ''', (guild_id, required_invites))
-        await db.conn.commit()
+        self.invalidate(guild_id)
 
-    async def get_rewards(self, guild_id: str) -> List[Dict]:
+    async def get_rewards(self, guild_id: str) -> List[Record]:
         """جلب جميع المكافآت"""
-        cursor = await db.conn.execute('''
+        rows = await db.fetchall('''
             SELECT required_invites, role_id
             FROM invite_rewards
             WHERE guild_id = ?
             ORDER BY required_invites ASC
         ''', (guild_id,))
-        rows = await cursor.fetchall()
-        return [{'required_invites': row[0], 'role_id': row[1]} for row in rows]
+        return [InviteRewardRow(*row) for row in rows]
 
     async def get_next_reward(self, guild_id: str, current_invites: int) -> Optional[Dict]:
         """المكافأة التالية للمستخدم"""
-        cursor = await db.conn.execute('''
-            SELECT required_invites, role_id
-            FROM invite_rewards
-            WHERE guild_id = ? AND required_invites > ?
-            ORDER BY required_invites ASC
-            LIMIT 1
-        ''', (guild_id, current_invites))
-        row = await cursor.fetchone()
-        if row:
-            return {'required_invites': row[0], 'role_id': row[1]}
+        required, role_ids = await self._get_thresholds(guild_id)
+        i = bisect_right(required, current_invites)
+        if i < len(required):
+            return {'required_invites': required[i], 'role_id': role_ids[i]}
         return None
 
 # النسخ العامة
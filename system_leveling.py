@@ -17,7 +17,12 @@ Features:
 """
 
 import discord
+import asyncio
 import random
+import math
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Tuple, List
 from collections import defaultdict
@@ -26,6 +31,14 @@ from config_manager import config
 import embeds
 import json
 from logger import bot_logger
+from expiring_map import ExpiringMap
+from records import Record, record_class
+
+# NumPy اختياري (يأتي مع matplotlib)؛ بدونه نستخدم bisect
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 # ==================== Constants ====================
@@ -33,6 +46,11 @@ from logger import bot_logger
 DEFAULT_XP_RANGE = (15, 25)
 DEFAULT_COOLDOWN = 60  # ثانية
 DEFAULT_VOICE_XP = 1  # XP لكل دقيقة
+VOICE_TICK_MINUTES = 5  # كل كم دقيقة يُحتسب وقت الصوت
+
+DEFAULT_MAX_LEVEL = 100
+RECOMPUTE_CHUNK_SIZE = 5000  # صفوف لكل دفعة عند إعادة حساب المستويات
+ROLE_GRANT_DELAY = 0.5  # ثانية بين منح أدوار المستوى (تجنب rate limit)
 
 # منحنى المستويات الافتراضي
 def default_level_curve(level: int) -> int:
@@ -46,7 +64,9 @@ class LevelCalculator:
     """آلة حاسبة المستويات المتقدمة"""
 
     def __init__(self):
-        self.curve_cache: Dict[str, List[int]] = {}
+        self.curve_cache: Dict[str, array] = {}  # {guild_id: XP تراكمي لكل مستوى}
+        self.curve_formulas: Dict[str, Optional[str]] = {}  # صيغة مدمجة لها حل مغلق (إن وُجدت)
+        self._builtin_curves: Dict[str, List[int]] = {}
 
     def generate_curve(self, max_level: int = 100, formula: str = 'default') -> List[int]:
         """
@@ -89,6 +109,52 @@ class LevelCalculator:
 
         return curve
 
+    # ==================== Curve Cache ====================
+
+    def set_curve(self, guild_id: str, curve: List[int]):
+        """تخزين منحنى السيرفر (array) وتحديد إن كان مطابقاً لصيغة مدمجة"""
+        self.curve_cache[guild_id] = array('q', curve)
+        self.curve_formulas[guild_id] = None
+        for formula in ('default', 'linear'):
+            if list(curve) == self._builtin_curve(formula, len(curve) - 1):
+                self.curve_formulas[guild_id] = formula
+                break
+
+    def invalidate(self, guild_id: str = None):
+        """مسح منحنى سيرفر (أو الكل)"""
+        if guild_id:
+            self.curve_cache.pop(guild_id, None)
+            self.curve_formulas.pop(guild_id, None)
+        else:
+            self.curve_cache.clear()
+            self.curve_formulas.clear()
+
+    def _builtin_curve(self, formula: str, max_level: int) -> List[int]:
+        key = f'{formula}:{max_level}'
+        if key not in self._builtin_curves:
+            self._builtin_curves[key] = self.generate_curve(max_level, formula)
+        return self._builtin_curves[key]
+
+    def level_for_guild(self, guild_id: str, xp: int) -> int:
+        """
+        المستوى من XP باستخدام منحنى السيرفر المخزن
+
+        حل مغلق للصيغ المدمجة (default/linear)، وإلا bisect على المنحنى.
+        """
+        curve = self.curve_cache[guild_id]
+        max_level = len(curve) - 1
+        formula = self.curve_formulas.get(guild_id)
+
+        if xp <= 0:
+            return 0
+        if formula == 'default':
+            # 50L² + 50L <= xp  =>  L = (isqrt(4n + 1) - 1) // 2 حيث n = xp // 50
+            level = (math.isqrt(4 * (xp // 50) + 1) - 1) // 2
+            return min(level, max_level)
+        if formula == 'linear':
+            return min(xp // 100, max_level)
+        return self.calculate_level(xp, curve)
+
     def calculate_level(self, xp: int, curve: List[int]) -> int:
         """
         حساب المستوى من XP
@@ -100,11 +166,7 @@ class LevelCalculator:
         Returns:
             المستوى
         """
-        for level, required_xp in enumerate(curve):
-            if xp < required_xp:
-                return max(0, level - 1)
-
-        return len(curve) - 1
+        return max(0, bisect_right(curve, xp) - 1)
 
     def xp_for_level(self, level: int, curve: List[int]) -> int:
         """XP المطلوب للوصول لمستوى"""
@@ -135,45 +197,98 @@ class LevelCalculator:
 # ==================== Voice Tracker ====================
 
 class VoiceTracker:
-    """تتبع الوقت في القنوات الصوتية"""
+    """
+    تتبع الجلسات الصوتية (المصدر الوحيد لوقت الصوت و XP الصوت)
+
+    الوقت يُجمّع في pending ويُحتسب دورياً على دفعات بدل انتظار المغادرة.
+    """
 
     def __init__(self):
-        # {guild_id: {user_id: {'join_time': datetime, 'speaking': bool}}}
+        # {guild_id: {user_id: {'join_time', 'last_credit', 'channel_id', 'eligible', 'speaking', 'total_xp'}}}
         self.sessions: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+        # ثوانٍ مستحقة لم تُحتسب بعد {guild_id: {user_id: seconds}}
+        self.pending: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
 
-    def start_session(self, guild_id: str, user_id: str):
+    def start_session(self, guild_id: str, user_id: str, channel_id: str = None, eligible: bool = True):
         """بدء جلسة صوتية"""
+        now = datetime.now()
         self.sessions[guild_id][user_id] = {
-            'join_time': datetime.now(),
+            'join_time': now,
+            'last_credit': now,
+            'channel_id': channel_id,
+            'eligible': eligible,
             'speaking': False,
             'total_xp': 0
         }
         bot_logger.debug(f'بدء جلسة صوتية: {user_id} في {guild_id}')
 
-    def end_session(self, guild_id: str, user_id: str) -> Tuple[int, int]:
+    def _accrue(self, guild_id: str, user_id: str, session: Dict, now: datetime):
+        """نقل الوقت منذ آخر احتساب إلى pending (للجلسات المؤهلة فقط)"""
+        if session['eligible']:
+            self.pending[guild_id][user_id] += (now - session['last_credit']).total_seconds()
+        session['last_credit'] = now
+
+    def end_session(self, guild_id: str, user_id: str) -> int:
         """
-        إنهاء جلسة صوتية
+        إنهاء جلسة صوتية (الوقت المتبقي يُحتسب في الدفعة التالية)
 
         Returns:
-            (duration_minutes, xp_earned)
+            مدة الجلسة بالدقائق
         """
         if guild_id not in self.sessions or user_id not in self.sessions[guild_id]:
-            return 0, 0
+            return 0
 
-        session = self.sessions[guild_id][user_id]
-        duration = (datetime.now() - session['join_time']).total_seconds()
-        minutes = int(duration / 60)
+        now = datetime.now()
+        session = self.sessions[guild_id].pop(user_id)
+        self._accrue(guild_id, user_id, session, now)
+        minutes = int((now - session['join_time']).total_seconds() / 60)
 
-        # حساب XP
-        # إذا كان يتحدث: 2 XP/دقيقة
-        # إذا كان AFK: 1 XP/دقيقة
-        xp_per_minute = 2 if session['speaking'] else 1
-        xp = minutes * xp_per_minute + session['total_xp']
+        bot_logger.debug(f'انتهاء جلسة صوتية: {user_id} - {minutes} دقيقة')
+        return minutes
 
-        del self.sessions[guild_id][user_id]
+    def update_state(self, guild_id: str, user_id: str, channel_id: str, eligible: bool):
+        """تغيير القناة أو حالة الأهلية (AFK/Deafen) بعد احتساب ما سبق"""
+        session = self.sessions.get(guild_id, {}).get(user_id)
+        if session is None:
+            self.start_session(guild_id, user_id, channel_id, eligible)
+            return
+        self._accrue(guild_id, user_id, session, datetime.now())
+        session['channel_id'] = channel_id
+        session['eligible'] = eligible
+
+    def collect(self) -> Dict[str, Dict[str, int]]:
+        """
+        احتساب كل الجلسات النشطة وإرجاع الدقائق الكاملة المستحقة
 
-        bot_logger.debug(f'انتهاء جلسة صوتية: {user_id} - {minutes} دقيقة - {xp} XP')
-        return minutes, xp
+        كسور الدقائق تبقى في pending للدفعة التالية.
+
+        Returns:
+            {guild_id: {user_id: minutes}}
+        """
+        now = datetime.now()
+        for guild_id, users in self.sessions.items():
+            for user_id, session in users.items():
+                self._accrue(guild_id, user_id, session, now)
+
+        credited: Dict[str, Dict[str, int]] = {}
+        for guild_id, users in list(self.pending.items()):
+            for user_id, seconds in list(users.items()):
+                minutes = int(seconds // 60)
+                if minutes > 0:
+                    credited.setdefault(guild_id, {})[user_id] = minutes
+                    users[user_id] = seconds - minutes * 60
+                # لا نحتفظ بكسور من غادر
+                if user_id not in self.sessions.get(guild_id, {}):
+                    users.pop(user_id, None)
+            if not users:
+                del self.pending[guild_id]
+        return credited
+
+    def restore(self, guild_id: str, minutes_by_user: Dict[str, int]):
+        """إعادة دقائق دفعة فشل احتسابها إلى pending (تُحتسب في الدفعة التالية)"""
+        users = self.pending[guild_id]
+        for user_id, minutes in minutes_by_user.items():
+            users[user_id] += minutes * 60
 
     def update_speaking(self, guild_id: str, user_id: str, speaking: bool):
         """تحديث حالة التحدث"""
@@ -190,6 +305,151 @@ class VoiceTracker:
         return guild_id in self.sessions and user_id in self.sessions[guild_id]
 
 
+# ==================== Leaderboard Cache ====================
+
+LEADERBOARD_CACHE_SIZE = 100  # أعلى 100 عضو (10 صفحات) في الذاكرة
+LEADERBOARD_PAGE_SIZE = 10
+CURSOR_TTL = 600  # ثانية؛ بعدها قد يبتعد موضع المؤشر عن ترتيبه الفعلي
+
+
+# صف لوحة الصدارة (نفس أعمدة استعلامات الكاش)
+LeaderboardRow = record_class('levels', ('user_id', 'xp', 'level', 'messages'))
+
+
+class LeaderboardCache:
+    """
+    كاش أعلى N عضو لكل سيرفر
+
+    يُحدّث تدريجياً مع كل تغيير XP (bisect على قائمة مرتبة بالمفتاح (-xp, user_id))
+    بدل إعادة الاستعلام، ويحتفظ بـ Embeds الصفحات حتى تتغير بياناتها.
+    """
+
+    def __init__(self, size: int = LEADERBOARD_CACHE_SIZE):
+        self.size = size
+        self.keys: Dict[str, List[Tuple[int, str]]] = {}  # {guild_id: [(-xp, user_id)]}
+        self.entries: Dict[str, Dict[str, Record]] = {}  # {guild_id: {user_id: LeaderboardRow}}
+        self.complete: Dict[str, bool] = {}  # الكاش يحتوي كل أعضاء السيرفر؟
+        self.versions: Dict[str, int] = defaultdict(int)  # يتغير مع أي تغيير في أعلى N
+        self.embeds: Dict[str, Dict[int, Tuple[int, discord.Embed]]] = {}  # {guild_id: {page: (version, embed)}}
+        self.cursors: Dict[str, Dict[int, Tuple[float, int, str]]] = {}  # {guild_id: {pos: (saved_at, xp, user_id)}}
+
+    def is_loaded(self, guild_id: str) -> bool:
+        return guild_id in self.keys
+
+    def load(self, guild_id: str, rows: List[Record]):
+        """تحميل أعلى N من DB (rows مرتبة، حتى size + 1 صف)"""
+        top = rows[:self.size]
+        self.keys[guild_id] = [(-row.xp, row.user_id) for row in top]
+        self.entries[guild_id] = {row.user_id: row for row in top}
+        self.complete[guild_id] = len(rows) <= self.size
+        self.versions[guild_id] += 1
+
+    def invalidate(self, guild_id: str):
+        """مسح كاش السيرفر (يُعاد تحميله عند الطلب التالي)"""
+        self.keys.pop(guild_id, None)
+        self.entries.pop(guild_id, None)
+        self.complete.pop(guild_id, None)
+        self.embeds.pop(guild_id, None)
+        self.cursors.pop(guild_id, None)
+
+    def update(self, guild_id: str, user_id: str, xp: int, level: int, messages: int):
+        """تحديث موقع عضو بعد تغيّر XP"""
+        if guild_id not in self.keys:
+            return
+
+        keys = self.keys[guild_id]
+        entries = self.entries[guild_id]
+        complete = self.complete[guild_id]
+        new_key = (-xp, user_id)
+
+        old = entries.pop(user_id, None)
+        if old is not None:
+            keys.pop(bisect_left(keys, (-old.xp, user_id)))
+            # نزل تحت آخر عضو في الكاش ولا نعرف من يحل مكانه
+            if not complete and (not keys or new_key > keys[-1]):
+                self.invalidate(guild_id)
+                return
+        elif not complete and new_key > keys[-1]:
+            # خارج أعلى N: لا يؤثر على الكاش
+            return
+
+        insort(keys, new_key)
+        entries[user_id] = LeaderboardRow(user_id, xp, level, messages)
+        if len(keys) > self.size:
+            _, dropped = keys.pop()
+            entries.pop(dropped, None)
+            self.complete[guild_id] = False
+        self.versions[guild_id] += 1
+
+    def remove(self, guild_id: str, user_id: str):
+        """حذف عضو (إعادة تعيين بياناته)"""
+        entries = self.entries.get(guild_id)
+        if not entries or user_id not in entries:
+            return
+        if not self.complete[guild_id]:
+            self.invalidate(guild_id)
+            return
+        old = entries.pop(user_id)
+        keys = self.keys[guild_id]
+        keys.pop(bisect_left(keys, (-old.xp, user_id)))
+        self.versions[guild_id] += 1
+
+    def covers(self, guild_id: str, end: int) -> bool:
+        """هل الصفوف حتى الموضع end موجودة في الكاش؟"""
+        if guild_id not in self.keys:
+            return False
+        return self.complete[guild_id] or end <= len(self.keys[guild_id])
+
+    def slice(self, guild_id: str, offset: int, limit: int) -> List[Record]:
+        """صفوف الكاش نفسها (بدون نسخ) - للقراءة فقط؛ update يستبدل الصف ولا يعدّله"""
+        entries = self.entries[guild_id]
+        return [entries[uid] for _, uid in self.keys[guild_id][offset:offset + limit]]
+
+    # ---------- Keyset cursors (للصفحات خارج الكاش) ----------
+
+    def anchor(self, guild_id: str, offset: int) -> Tuple[int, Optional[Tuple[int, str]]]:
+        """
+        أقرب نقطة بداية معروفة قبل offset
+
+        المؤشر قيمة (xp, user_id) وليس موضعاً، فيبقى حداً صالحاً بعد تغيّر XP:
+        الاستعلام يكمل بعده بلا تكرار ولا تخطٍّ، وقد ينزاح الترقيم بقدر التغييرات
+        منذ حفظه (لذا تنتهي المؤشرات بعد CURSOR_TTL).
+
+        Returns:
+            (الموضع, (xp, user_id)) أو (0, None) إن لم توجد
+        """
+        pos, key = 0, None
+        keys = self.keys.get(guild_id)
+        if keys:
+            pos, key = len(keys), (-keys[-1][0], keys[-1][1])
+
+        cursors = self.cursors.get(guild_id)
+        if cursors:
+            expired = time.monotonic() - CURSOR_TTL
+            for cursor_pos in [p for p, c in cursors.items() if c[0] < expired]:
+                del cursors[cursor_pos]
+            for cursor_pos, (_, xp, user_id) in cursors.items():
+                if pos < cursor_pos <= offset:
+                    pos, key = cursor_pos, (xp, user_id)
+        return pos, key
+
+    def save_cursor(self, guild_id: str, pos: int, xp: int, user_id: str):
+        self.cursors.setdefault(guild_id, {})[pos] = (time.monotonic(), xp, user_id)
+
+    # ---------- Page embeds ----------
+
+    def get_embed(self, guild_id: str, page: int) -> Optional[discord.Embed]:
+        cached = self.embeds.get(guild_id, {}).get(page)
+        if cached and cached[0] == self.versions[guild_id] and guild_id in self.keys:
+            return cached[1]
+        return None
+
+    def store_embed(self, guild_id: str, page: int, embed: discord.Embed):
+        """تخزين Embed صفحة (فقط للصفحات المخدومة من الكاش)"""
+        if self.covers(guild_id, page * LEADERBOARD_PAGE_SIZE):
+            self.embeds.setdefault(guild_id, {})[page] = (self.versions[guild_id], embed)
+
+
 # ==================== Leveling System ====================
 
 class LevelingSystem:
@@ -198,8 +458,15 @@ class LevelingSystem:
     def __init__(self):
         self.calculator = LevelCalculator()
         self.voice_tracker = VoiceTracker()
-        self.message_cooldowns: Dict[str, datetime] = {}  # {user_id: last_xp_time}
+        # {guild_id:user_id: last_xp_time} - ينتهي بانتهاء cooldown السيرفر
+        self.message_cooldowns = ExpiringMap(max_size=100_000, name='leveling.cooldowns')
         self.role_multipliers_cache: Dict[str, Dict[int, float]] = {}  # {guild_id: {role_id: multiplier}}
+        self.multiplier_cache = ExpiringMap(max_size=10_000, name='leveling.multipliers')  # {(guild_id, role ids): multiplier}
+        self.member_role_keys = ExpiringMap(ttl=3600, max_size=50_000, name='leveling.member_roles')  # {(guild_id, user_id): role ids}
+        self.leaderboard_cache = LeaderboardCache()
+        self._recompute_tasks: Dict[str, asyncio.Task] = {}
+        self.bot: Optional[discord.Client] = None
+        self.voice_task: Optional[asyncio.Task] = None
 
     # ==================== Message XP ====================
 
@@ -223,25 +490,21 @@ class LevelingSystem:
 
         # التحقق من Cooldown
         cooldown_key = f'{guild_id}:{user_id}'
-        if cooldown_key in self.message_cooldowns:
-            last_time = self.message_cooldowns[cooldown_key]
+        last_time = self.message_cooldowns.get(cooldown_key)
+        if last_time is not None:
             if (datetime.now() - last_time).total_seconds() < leveling_config.cooldown:
                 return None
 
         # حساب XP
         base_xp = random.randint(leveling_config.xp_min, leveling_config.xp_max)
 
-        # مضاعف الأدوار
-        multiplier = await self.get_role_multiplier(message.author)
-
-        # مضاعف Boost
-        if message.guild.premium_subscriber_role in message.author.roles:
-            multiplier *= 1.5
+        # مضاعف الأدوار + Boost (من الكاش حسب مجموعة الأدوار)
+        multiplier = await self.get_member_multiplier(message.author)
 
         xp_gained = int(base_xp * multiplier)
 
         # تحديث Cooldown
-        self.message_cooldowns[cooldown_key] = datetime.now()
+        self.message_cooldowns.set(cooldown_key, datetime.now(), ttl=leveling_config.cooldown)
 
         # إضافة XP
         result = await self.add_xp(guild_id, user_id, xp_gained)
@@ -303,41 +566,180 @@ class LevelingSystem:
 
     # ==================== Voice XP ====================
 
-    async def handle_voice_join(self, member: discord.Member, channel: discord.VoiceChannel):
-        """معالجة انضمام لقناة صوتية"""
-        guild_id = str(member.guild.id)
-        user_id = str(member.id)
+    @staticmethod
+    def is_voice_eligible(member: discord.Member, channel) -> bool:
+        """هل يُحتسب وقت العضو؟ (ليس في قناة AFK وليس Deafened)"""
+        if channel is None or member.bot:
+            return False
+        if member.guild.afk_channel and channel.id == member.guild.afk_channel.id:
+            return False
+        voice = member.voice
+        if voice and (voice.self_deaf or voice.deaf):
+            return False
+        return True
 
-        # التحقق من تفعيل النظام
-        leveling_config = await config.get_leveling_config(guild_id)
-        if not leveling_config.enabled:
-            return
+    async def handle_voice_update(
+        self,
+        member: discord.Member,
+        before: discord.VoiceState,
+        after: discord.VoiceState
+    ) -> int:
+        """
+        تحديث الجلسة الصوتية حسب تغيّر الحالة
 
-        self.voice_tracker.start_session(guild_id, user_id)
+        Returns:
+            مدة الجلسة بالدقائق عند المغادرة، وإلا 0
+        """
+        if member.bot:
+            return 0
 
-    async def handle_voice_leave(self, member: discord.Member):
-        """معالجة مغادرة قناة صوتية"""
         guild_id = str(member.guild.id)
         user_id = str(member.id)
 
-        # التحقق من تفعيل النظام
+        if after.channel is None:
+            return self.voice_tracker.end_session(guild_id, user_id)
+
+        eligible = self.is_voice_eligible(member, after.channel)
+        if before.channel is None:
+            self.voice_tracker.start_session(guild_id, user_id, str(after.channel.id), eligible)
+        else:
+            self.voice_tracker.update_state(guild_id, user_id, str(after.channel.id), eligible)
+        return 0
+
+    def start_voice_accrual(self, bot: discord.Client):
+        """إعادة بناء الجلسات من القنوات الحالية وبدء الاحتساب الدوري"""
+        self.bot = bot
+        self.rebuild_voice_sessions(bot)
+        if not self.voice_task or self.voice_task.done():
+            self.voice_task = asyncio.create_task(self._voice_accrual_loop())
+
+    def rebuild_voice_sessions(self, bot: discord.Client):
+        """مطابقة الجلسات مع الأعضاء الموجودين فعلاً في القنوات الصوتية (بعد التشغيل أو إعادة الاتصال)"""
+        present = set()
+        for guild in bot.guilds:
+            guild_id = str(guild.id)
+            for channel in list(guild.voice_channels) + list(guild.stage_channels):
+                for member in channel.members:
+                    if member.bot:
+                        continue
+                    user_id = str(member.id)
+                    present.add((guild_id, user_id))
+                    self.voice_tracker.update_state(
+                        guild_id, user_id, str(channel.id), self.is_voice_eligible(member, channel)
+                    )
+
+        # من غادر أثناء انقطاع الاتصال
+        for guild_id, users in list(self.voice_tracker.sessions.items()):
+            for user_id in list(users):
+                if (guild_id, user_id) not in present:
+                    self.voice_tracker.end_session(guild_id, user_id)
+
+        bot_logger.info(f'🔊 تمت استعادة {len(present)} جلسة صوتية')
+
+    async def _voice_accrual_loop(self):
+        """مهمة احتساب وقت و XP الصوت الدورية"""
+        while True:
+            try:
+                await asyncio.sleep(VOICE_TICK_MINUTES * 60)
+                await self.flush_voice()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                bot_logger.error(f'خطأ في _voice_accrual_loop: {e}')
+
+    async def flush_voice(self):
+        """احتساب كل الدقائق المستحقة الآن (يُستدعى دورياً وعند الإيقاف)"""
+        for guild_id, minutes_by_user in self.voice_tracker.collect().items():
+            try:
+                await self._credit_voice(guild_id, minutes_by_user)
+            except Exception as e:
+                # المعاملة لم تُحفظ: الدقائق تعود لـ pending بدل أن تضيع
+                self.voice_tracker.restore(guild_id, minutes_by_user)
+                bot_logger.exception(f'خطأ في احتساب الصوت: {guild_id}', e)
+
+    async def _credit_voice(self, guild_id: str, minutes_by_user: Dict[str, int]):
+        """
+        احتساب XP و voice_minutes لكل أعضاء السيرفر في معاملة واحدة
+
+        أي استثناء يخرج من هنا يعني أن المعاملة لم تُحفظ (ما بعد الحفظ لا يرفع).
+        """
         leveling_config = await config.get_leveling_config(guild_id)
-        if not leveling_config.enabled:
-            return
+        if leveling_config.enabled:
+            await self.get_level_curve(guild_id)
+
+        now = datetime.now()
+        level_ups: List[Tuple[str, int]] = []
+        updates: List[Tuple] = []
+
+        async with db.for_guild(guild_id) as store:
+            async with store.transaction('credit_voice') as conn:
+                if leveling_config.enabled:
+                    # XP تراكمي (xp = levels.xp + excluded.xp) فلا يُستبدل XP رسائل كُتب بالتوازي
+                    await conn.executemany('''
+                        INSERT INTO levels (guild_id, user_id, xp, level, messages, last_xp_time)
+                        VALUES (?, ?, ?, 0, 0, ?)
+                        ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                            xp = levels.xp + excluded.xp
+                    ''', [
+                        (guild_id, user_id, minutes * DEFAULT_VOICE_XP, now.isoformat())
+                        for user_id, minutes in minutes_by_user.items()
+                    ])
+
+                    # المستوى من XP بعد الكتابة
+                    user_ids = list(minutes_by_user)
+                    level_fixes: List[Tuple] = []
+                    for i in range(0, len(user_ids), 500):
+                        chunk = user_ids[i:i + 500]
+                        cursor = await conn.execute(
+                            f'SELECT user_id, xp, level, messages FROM levels '
+                            f'WHERE guild_id = ? AND user_id IN ({",".join("?" * len(chunk))})',
+                            (guild_id, *chunk)
+                        )
+                        for row in await cursor.fetchall():
+                            new_level = await self.calculate_level(guild_id, row['xp'] or 0)
+                            old_level = row['level'] or 0
+                            updates.append((guild_id, row['user_id'], row['xp'] or 0, new_level, row['messages'] or 0))
+                            if new_level != old_level:
+                                level_fixes.append((new_level, guild_id, row['user_id']))
+                            if new_level > old_level:
+                                level_ups.append((row['user_id'], new_level))
+
+                    if level_fixes:
+                        await conn.executemany(
+                            'UPDATE levels SET level = ? WHERE guild_id = ? AND user_id = ?', level_fixes
+                        )
+
+                await conn.execute('''
+                    INSERT INTO stats (guild_id, date, voice_minutes)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(guild_id, date) DO UPDATE SET
+                        voice_minutes = voice_minutes + excluded.voice_minutes
+                ''', (guild_id, now.strftime('%Y-%m-%d'), sum(minutes_by_user.values())))
+        db.touch_stats_day(guild_id, now.strftime('%Y-%m-%d'))
 
-        # إنهاء الجلسة وحساب XP
-        minutes, xp = self.voice_tracker.end_session(guild_id, user_id)
+        try:
+            for g_id, user_id, xp, level, messages in updates:
+                self.leaderboard_cache.update(g_id, user_id, xp, level, messages)
 
-        if xp > 0:
-            result = await self.add_xp(guild_id, user_id, xp)
+            if level_ups:
+                await self._announce_voice_level_ups(guild_id, level_ups)
+        except Exception as e:
+            bot_logger.exception(f'خطأ بعد احتساب الصوت: {guild_id}', e)
 
-            if result['leveled_up']:
-                # إرسال DM بالترقية
-                try:
-                    embed = embeds.level_up_embed(member, result['level'])
-                    await member.send(embed=embed)
-                except:
-                    pass
+    async def _announce_voice_level_ups(self, guild_id: str, level_ups: List[Tuple[str, int]]):
+        """DM بالترقية ومنح أدوار المستوى لمن ترقّى من الصوت"""
+        guild = self.bot.get_guild(int(guild_id)) if self.bot else None
+        if not guild:
+            return
+        for user_id, level in level_ups:
+            member = guild.get_member(int(user_id))
+            if not member:
+                continue
+            try:
+                await member.send(embed=embeds.level_up_embed(member, level))
+            except Exception:
+                pass
+            await self._grant_level_roles(member, level)
 
     async def update_speaking_status(self, member: discord.Member, is_speaking: bool):
         """تحديث حالة التحدث"""
@@ -356,34 +758,41 @@ class LevelingSystem:
             {'xp': int, 'level': int, 'old_level': int, 'leveled_up': bool}
         """
         try:
-            # جلب البيانات الحالية
-            data = await db.get_level(guild_id, user_id)
-
-            if data:
-                old_xp = data['xp']
-                old_level = data['level']
-                new_xp = old_xp + xp
-            else:
-                old_xp = 0
-                old_level = 0
-                new_xp = xp
-
-            # حساب المستوى الجديد
-            curve = await self.get_level_curve(guild_id)
-            new_level = self.calculator.calculate_level(new_xp, curve)
-
-            # حفظ في قاعدة البيانات
-            await db.conn.execute('''
-                INSERT INTO levels (guild_id, user_id, xp, level, messages, last_xp_time)
-                VALUES (?, ?, ?, ?, COALESCE((SELECT messages FROM levels WHERE guild_id = ? AND user_id = ?), 0) + 1, ?)
-                ON CONFLICT(guild_id, user_id) DO UPDATE SET
-                    xp = xp + ?,
-                    level = ?,
-                    messages = messages + 1,
-                    last_xp_time = ?
-            ''', (guild_id, user_id, xp, new_level, guild_id, user_id, datetime.now().isoformat(),
-                  xp, new_level, datetime.now().isoformat()))
-            await db.conn.commit()
+            # المنحنى قبل القفل (تحميله أول مرة يقرأ من القاعدة)
+            await self.get_level_curve(guild_id)
+            now = datetime.now().isoformat()
+
+            # القراءة والكتابة في معاملة واحدة تحت قفل المخزن
+            async with db.for_guild(guild_id) as store:
+                async with store.transaction('add_xp') as conn:
+                    cursor = await conn.execute(
+                        'SELECT xp, level, messages FROM levels WHERE guild_id = ? AND user_id = ?',
+                        (guild_id, user_id)
+                    )
+                    data = await cursor.fetchone()
+
+                    if data:
+                        old_level = data['level'] or 0
+                        new_xp = (data['xp'] or 0) + xp
+                        messages = (data['messages'] or 0) + 1
+                    else:
+                        old_level = 0
+                        new_xp = xp
+                        messages = 1
+
+                    new_level = await self.calculate_level(guild_id, new_xp)
+
+                    await conn.execute('''
+                        INSERT INTO levels (guild_id, user_id, xp, level, messages, last_xp_time)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                            xp = excluded.xp,
+                            level = excluded.level,
+                            messages = excluded.messages,
+                            last_xp_time = excluded.last_xp_time
+                    ''', (guild_id, user_id, new_xp, new_level, messages, now))
+
+            self.leaderboard_cache.update(guild_id, user_id, new_xp, new_level, messages)
 
             return {
                 'xp': new_xp,
@@ -399,15 +808,19 @@ class LevelingSystem:
     async def set_xp(self, guild_id: str, user_id: str, xp: int) -> bool:
         """تعيين XP مباشرة"""
         try:
-            curve = await self.get_level_curve(guild_id)
-            level = self.calculator.calculate_level(xp, curve)
-
-            await db.conn.execute('''
-                INSERT OR REPLACE INTO levels (guild_id, user_id, xp, level, messages, last_xp_time)
-                VALUES (?, ?, ?, ?, COALESCE((SELECT messages FROM levels WHERE guild_id = ? AND user_id = ?), 0), ?)
-            ''', (guild_id, user_id, xp, level, guild_id, user_id, datetime.now().isoformat()))
-            await db.conn.commit()
-
+            level = await self.calculate_level(guild_id, xp)
+
+            async with db.for_guild(guild_id) as store:
+                await store.execute('''
+                    INSERT INTO levels (guild_id, user_id, xp, level, messages, last_xp_time)
+                    VALUES (?, ?, ?, ?, 0, ?)
+                    ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                        xp = excluded.xp,
+                        level = excluded.level,
+                        last_xp_time = excluded.last_xp_time
+                ''', (guild_id, user_id, xp, level, datetime.now().isoformat()))
+
+            await self._refresh_leaderboard_entry(guild_id, user_id)
             return True
         except Exception as e:
             bot_logger.exception(f'خطأ في set_xp: {guild_id}:{user_id}', e)
@@ -416,19 +829,26 @@ class LevelingSystem:
     async def remove_xp(self, guild_id: str, user_id: str, xp: int) -> Dict:
         """إزالة XP"""
         try:
-            data = await db.get_level(guild_id, user_id)
-            if not data:
-                return {'xp': 0, 'level': 0}
-
-            new_xp = max(0, data['xp'] - xp)
-            curve = await self.get_level_curve(guild_id)
-            new_level = self.calculator.calculate_level(new_xp, curve)
-
-            await db.conn.execute('''
-                UPDATE levels SET xp = ?, level = ? WHERE guild_id = ? AND user_id = ?
-            ''', (new_xp, new_level, guild_id, user_id))
-            await db.conn.commit()
-
+            await self.get_level_curve(guild_id)
+
+            async with db.for_guild(guild_id) as store:
+                async with store.transaction('remove_xp') as conn:
+                    cursor = await conn.execute(
+                        'SELECT xp, messages FROM levels WHERE guild_id = ? AND user_id = ?',
+                        (guild_id, user_id)
+                    )
+                    data = await cursor.fetchone()
+                    if not data:
+                        return {'xp': 0, 'level': 0}
+
+                    new_xp = max(0, (data['xp'] or 0) - xp)
+                    new_level = await self.calculate_level(guild_id, new_xp)
+
+                    await conn.execute('''
+                        UPDATE levels SET xp = ?, level = ? WHERE guild_id = ? AND user_id = ?
+                    ''', (new_xp, new_level, guild_id, user_id))
+
+            self.leaderboard_cache.update(guild_id, user_id, new_xp, new_level, data['messages'] or 0)
             return {'xp': new_xp, 'level': new_level}
 
         except Exception as e:
@@ -441,27 +861,93 @@ class LevelingSystem:
         """الحصول على بيانات مستوى العضو"""
         return await db.get_level(guild_id, user_id)
 
-    async def get_user_rank(self, guild_id: str, user_id: str) -> int:
-        """الحصول على ترتيب العضو"""
+    async def get_user_rank(self, guild_id: str, user_id: str, xp: Optional[int] = None) -> int:
+        """
+        الحصول على ترتيب العضو
+
+        يعدّ الأعضاء الأعلى منه عبر الفهرس (guild_id, xp DESC, user_id) بدل
+        جلب لوحة الصدارة ومسحها. التعادل يُحسم بـ user_id مثل get_leaderboard.
+
+        Args:
+            xp: خبرة العضو إن كانت معروفة مسبقاً (توفر استعلاماً)
+
+        Returns:
+            الترتيب (يبدأ من 1)، أو 0 إذا لم يكن للعضو سجل
+        """
         try:
-            leaderboard = await self.get_leaderboard(guild_id, limit=1000)
-            for i, entry in enumerate(leaderboard, 1):
-                if entry['user_id'] == user_id:
-                    return i
-            return 0
+            async with db.for_guild(guild_id) as store:
+                if xp is None:
+                    row = await store.fetchone('''
+                        SELECT xp FROM levels WHERE guild_id = ? AND user_id = ?
+                    ''', (guild_id, user_id))
+                    if not row:
+                        return 0
+                    xp = row[0]
+
+                row = await store.fetchone('''
+                    SELECT COUNT(*) FROM levels
+                    WHERE guild_id = ? AND (xp > ? OR (xp = ? AND user_id < ?))
+                ''', (guild_id, xp, xp, user_id))
+                return row[0] + 1
         except Exception as e:
             bot_logger.error(f'خطأ في get_user_rank: {e}')
             return 0
 
+    async def get_users_around(self, guild_id: str, user_id: str, radius: int = 2) -> List[Dict]:
+        """
+        الأعضاء المحيطون بالعضو في الترتيب (radius فوقه و radius تحته)
+
+        Returns:
+            قائمة الأعضاء مع مفتاح rank، مرتبة تنازلياً
+        """
+        try:
+            async with db.for_guild(guild_id) as store:
+                row = await store.fetchone('''
+                    SELECT xp FROM levels WHERE guild_id = ? AND user_id = ?
+                ''', (guild_id, user_id))
+                if not row:
+                    return []
+                xp = row[0]
+                rank = await self.get_user_rank(guild_id, user_id, xp=xp)
+
+                # فوق العضو: نقرأ تصاعدياً من موقعه ثم نعكس النتيجة
+                rows = await store.fetchall('''
+                    SELECT user_id, xp, level, messages FROM levels
+                    WHERE guild_id = ? AND (xp > ? OR (xp = ? AND user_id < ?))
+                    ORDER BY xp ASC, user_id DESC
+                    LIMIT ?
+                ''', (guild_id, xp, xp, user_id, radius))
+                above = [dict(r) for r in rows][::-1]
+
+                rows = await store.fetchall('''
+                    SELECT user_id, xp, level, messages FROM levels
+                    WHERE guild_id = ? AND (xp < ? OR (xp = ? AND user_id >= ?))
+                    ORDER BY xp DESC, user_id ASC
+                    LIMIT ?
+                ''', (guild_id, xp, xp, user_id, radius + 1))
+                below = [dict(r) for r in rows]
+
+                result = above + below
+                first_rank = rank - len(above)
+                for i, entry in enumerate(result):
+                    entry['rank'] = first_rank + i
+                return result
+        except Exception as e:
+            bot_logger.error(f'خطأ في get_users_around: {e}')
+            return []
+
     async def get_leaderboard(
         self,
         guild_id: str,
         limit: int = 10,
         offset: int = 0
-    ) -> List[Dict]:
+    ) -> List[Record]:
         """
         الحصول على لوحة الصدارة
 
+        أعلى N من الكاش؛ ما بعدها بـ keyset على (xp, user_id) من آخر موضع معروف
+        بدل OFFSET من البداية.
+
         Args:
             guild_id: معرف السيرفر
             limit: عدد النتائج
@@ -471,61 +957,282 @@ class LevelingSystem:
             قائمة الأعضاء
         """
         try:
-            cursor = await db.conn.execute('''
-                SELECT user_id, xp, level, messages
-                FROM levels
-                WHERE guild_id = ?
-                ORDER BY xp DESC
-                LIMIT ? OFFSET ?
-            ''', (guild_id, limit, offset))
-
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+            cache = self.leaderboard_cache
+            if not cache.is_loaded(guild_id):
+                await self._load_leaderboard(guild_id)
+
+            if cache.covers(guild_id, offset + limit):
+                return cache.slice(guild_id, offset, limit)
+
+            rows = cache.slice(guild_id, offset, limit) if cache.is_loaded(guild_id) else []
+            start = offset + len(rows)
+            pos, key = cache.anchor(guild_id, start)
+
+            async with db.for_guild(guild_id) as store:
+                if key is None:
+                    found = await store.fetchall('''
+                        SELECT user_id, xp, level, messages
+                        FROM levels
+                        WHERE guild_id = ?
+                        ORDER BY xp DESC, user_id ASC
+                        LIMIT ? OFFSET ?
+                    ''', (guild_id, limit - len(rows), start))
+                else:
+                    found = await store.fetchall('''
+                        SELECT user_id, xp, level, messages
+                        FROM levels
+                        WHERE guild_id = ? AND (xp < ? OR (xp = ? AND user_id > ?))
+                        ORDER BY xp DESC, user_id ASC
+                        LIMIT ? OFFSET ?
+                    ''', (guild_id, key[0], key[0], key[1], limit - len(rows), start - pos))
+
+                fetched = [LeaderboardRow(*row) for row in found]
+                if fetched:
+                    last = fetched[-1]
+                    cache.save_cursor(guild_id, start + len(fetched), last.xp, last.user_id)
+                return rows + fetched
 
         except Exception as e:
             bot_logger.exception(f'خطأ في get_leaderboard: {guild_id}', e)
             return []
 
+    async def _load_leaderboard(self, guild_id: str):
+        """تحميل أعلى N عضو إلى الكاش"""
+        async with db.for_guild(guild_id) as store:
+            rows = await store.fetchall('''
+                SELECT user_id, xp, level, messages
+                FROM levels
+                WHERE guild_id = ?
+                ORDER BY xp DESC, user_id ASC
+                LIMIT ?
+            ''', (guild_id, self.leaderboard_cache.size + 1))
+            self.leaderboard_cache.load(guild_id, [LeaderboardRow(*row) for row in rows])
+
+    async def _refresh_leaderboard_entry(self, guild_id: str, user_id: str):
+        """مزامنة عضو واحد مع الكاش بعد كتابة مباشرة"""
+        data = await db.get_level(guild_id, user_id)
+        if data:
+            self.leaderboard_cache.update(guild_id, user_id, data['xp'], data['level'], data['messages'] or 0)
+
     # ==================== Level Curve ====================
 
     async def get_level_curve(self, guild_id: str) -> List[int]:
-        """الحصول على منحنى المستويات للسيرفر"""
+        """الحصول على منحنى المستويات للسيرفر (من الكاش بعد أول تحميل)"""
+        curve = self.calculator.curve_cache.get(guild_id)
+        if curve is not None:
+            return curve
+
         try:
-            cursor = await db.conn.execute('''
+            row = await db.fetchone('''
                 SELECT level_curve FROM leveling_config WHERE guild_id = ?
             ''', (guild_id,))
 
-            row = await cursor.fetchone()
-
             if row and row[0]:
-                return json.loads(row[0])
+                curve = json.loads(row[0])
             else:
                 # توليد منحنى افتراضي
-                return self.calculator.generate_curve(max_level=100, formula='default')
+                curve = self.calculator.generate_curve(max_level=DEFAULT_MAX_LEVEL, formula='default')
 
         except Exception as e:
             bot_logger.error(f'خطأ في get_level_curve: {e}')
-            return self.calculator.generate_curve(max_level=100, formula='default')
+            return self.calculator.generate_curve(max_level=DEFAULT_MAX_LEVEL, formula='default')
+
+        self.calculator.set_curve(guild_id, curve)
+        return self.calculator.curve_cache[guild_id]
+
+    async def calculate_level(self, guild_id: str, xp: int) -> int:
+        """المستوى من XP حسب منحنى السيرفر (المسار الوحيد لكل عمليات الكتابة)"""
+        if guild_id not in self.calculator.curve_cache:
+            curve = await self.get_level_curve(guild_id)
+            if guild_id not in self.calculator.curve_cache:
+                # فشل التحميل: لا نخزن المنحنى الاحتياطي
+                return self.calculator.calculate_level(xp, curve)
+        return self.calculator.level_for_guild(guild_id, xp)
+
+    async def set_level_curve(
+        self,
+        guild_id: str,
+        curve: List[int],
+        guild: Optional[discord.Guild] = None
+    ) -> bool:
+        """
+        تعيين منحنى المستويات
 
-    async def set_level_curve(self, guild_id: str, curve: List[int]) -> bool:
-        """تعيين منحنى المستويات"""
+        يُعاد حساب مستويات كل الأعضاء في الخلفية، ومع guild تُمنح أدوار المستوى
+        لمن تجاوز عتبة جديدة.
+        """
         try:
-            curve_json = json.dumps(curve)
+            if not curve or curve[0] != 0 or any(b < a for a, b in zip(curve, curve[1:])):
+                bot_logger.warning(f'منحنى مستويات غير صالح لـ {guild_id} (يجب أن يبدأ بـ 0 وأن يكون متزايداً)')
+                return False
+
+            curve_json = json.dumps(list(curve))
 
-            await db.conn.execute('''
+            await db.execute('''
                 INSERT INTO leveling_config (guild_id, level_curve)
                 VALUES (?, ?)
                 ON CONFLICT(guild_id) DO UPDATE SET level_curve = excluded.level_curve
             ''', (guild_id, curve_json))
-            await db.conn.commit()
 
+            self.calculator.set_curve(guild_id, curve)
+
+            # إعادة الحساب في الخلفية (تغيير جديد يلغي أي إعادة حساب جارية)
+            previous = self._recompute_tasks.get(guild_id)
+            if previous and not previous.done():
+                previous.cancel()
+            self._recompute_tasks[guild_id] = asyncio.create_task(
+                self._recompute_after_curve_change(guild_id, guild)
+            )
             return True
         except Exception as e:
             bot_logger.exception(f'خطأ في set_level_curve: {guild_id}', e)
             return False
 
+    async def recompute_levels(self, guild_id: str) -> Dict:
+        """
+        إعادة حساب المستوى المخزن لكل أعضاء السيرفر حسب المنحنى الحالي
+
+        تقرأ الصفوف على دفعات (keyset على user_id) وتكتب المتغير فقط في
+        معاملة لكل دفعة، مع التخلي عن الـ loop بين الدفعات.
+
+        Returns:
+            {'scanned': int, 'updated': int, 'changes': [(user_id, old_level, new_level)]}
+        """
+        curve = await self.get_level_curve(guild_id)
+        curve_np = np.asarray(curve, dtype=np.int64) if np is not None else None
+
+        scanned = updated = 0
+        changes: List[Tuple[str, int, int]] = []
+        last_user = ''
+
+        async with db.for_guild(guild_id) as store:
+            while True:
+                # القراءة والكتابة في معاملة واحدة تحت قفل القسم؛ شرط xp IS ? يحمي
+                # من كتابة مستوى محسوب من XP قديم إن تغيّر الصف من اتصال آخر
+                async with store.transaction('recompute_levels') as conn:
+                    cursor = await conn.execute('''
+                        SELECT user_id, xp, level FROM levels
+                        WHERE guild_id = ? AND user_id > ?
+                        ORDER BY user_id
+                        LIMIT ?
+                    ''', (guild_id, last_user, RECOMPUTE_CHUNK_SIZE))
+                    rows = await cursor.fetchall()
+                    if not rows:
+                        break
+
+                    if curve_np is not None:
+                        xps = np.fromiter((row[1] or 0 for row in rows), dtype=np.int64, count=len(rows))
+                        new_levels = np.maximum(np.searchsorted(curve_np, xps, side='right') - 1, 0).tolist()
+                    else:
+                        new_levels = [self.calculator.calculate_level(row[1] or 0, curve) for row in rows]
+
+                    batch = []
+                    for row, new_level in zip(rows, new_levels):
+                        if new_level != row[2]:
+                            batch.append((new_level, guild_id, row[0], row[1]))
+                            changes.append((row[0], row[2] or 0, new_level))
+
+                    if batch:
+                        await conn.executemany(
+                            'UPDATE levels SET level = ? WHERE guild_id = ? AND user_id = ? AND xp IS ?', batch
+                        )
+
+                scanned += len(rows)
+                updated += len(batch)
+                last_user = rows[-1][0]
+                await asyncio.sleep(0)
+
+            if updated:
+                self.leaderboard_cache.invalidate(guild_id)
+
+            bot_logger.info(f'إعادة حساب المستويات في {guild_id}: {updated}/{scanned} تغيّر')
+            return {'scanned': scanned, 'updated': updated, 'changes': changes}
+
+    async def grant_level_roles_batch(self, guild: discord.Guild, changes: List[Tuple[str, int, int]]) -> int:
+        """
+        منح أدوار المستوى لمن تجاوز عتبة بعد إعادة الحساب (بمعدل محدود)
+
+        Returns:
+            عدد الأعضاء الذين تمت معالجتهم
+        """
+        leveling_config = await config.get_leveling_config(str(guild.id))
+        if not leveling_config.level_roles:
+            return 0
+
+        thresholds = sorted(int(level) for level in leveling_config.level_roles)
+        granted = 0
+        for user_id, old_level, new_level in changes:
+            # هل عبر عتبة دور للأعلى؟
+            if bisect_right(thresholds, new_level) <= bisect_right(thresholds, old_level):
+                continue
+            member = guild.get_member(int(user_id))
+            if not member:
+                continue
+            await self._grant_level_roles(member, new_level)
+            granted += 1
+            await asyncio.sleep(ROLE_GRANT_DELAY)
+        return granted
+
+    async def _recompute_after_curve_change(self, guild_id: str, guild: Optional[discord.Guild]):
+        try:
+            result = await self.recompute_levels(guild_id)
+            if guild and result['changes']:
+                granted = await self.grant_level_roles_batch(guild, result['changes'])
+                bot_logger.info(f'أدوار المستوى بعد تغيير المنحنى: {granted} عضو في {guild.name}')
+        except asyncio.CancelledError:
+            bot_logger.debug(f'أُلغيت إعادة حساب المستويات في {guild_id} (منحنى أحدث)')
+            raise
+        except Exception as e:
+            bot_logger.exception(f'خطأ في إعادة حساب المستويات: {guild_id}', e)
+        finally:
+            if self._recompute_tasks.get(guild_id) is asyncio.current_task():
+                del self._recompute_tasks[guild_id]
+
     # ==================== Role Multipliers ====================
 
+    async def get_member_multiplier(self, member: discord.Member) -> float:
+        """
+        المضاعف الكلي للعضو (أعلى مضاعف دور × Boost)
+
+        يُخزن حسب (السيرفر، مجموعة الأدوار)، فالأعضاء بنفس الأدوار يتشاركون
+        النتيجة، وعدد أدوار العضو لا يؤثر على تكلفة كل رسالة.
+        """
+        guild_id = str(member.guild.id)
+        role_ids = self._member_role_key(member)
+
+        multiplier = self.multiplier_cache.get((guild_id, role_ids))
+        if multiplier is not None:
+            return multiplier
+
+        multiplier = await self.get_role_multiplier(member)
+
+        # مضاعف Boost
+        premium_role = member.guild.premium_subscriber_role
+        if premium_role and premium_role.id in role_ids:
+            multiplier *= 1.5
+
+        self.multiplier_cache[(guild_id, role_ids)] = multiplier
+        return multiplier
+
+    def _member_role_key(self, member: discord.Member) -> frozenset:
+        """مجموعة أدوار العضو (تُحسب مرة وتُمسح عند تغير أدواره)"""
+        key = (str(member.guild.id), str(member.id))
+        role_ids = self.member_role_keys.get(key)
+        if role_ids is None:
+            role_ids = frozenset(role.id for role in member.roles)
+            self.member_role_keys[key] = role_ids
+        return role_ids
+
+    def handle_member_update(self, before: discord.Member, after: discord.Member):
+        """مسح مجموعة الأدوار المخزنة عند تغيّر أدوار العضو"""
+        if before.roles != after.roles:
+            self.member_role_keys.pop((str(after.guild.id), str(after.id)), None)
+
+    def invalidate_multipliers(self, guild_id: str):
+        """مسح المضاعفات المحسوبة للسيرفر (بعد تغيير مضاعفات الأدوار)"""
+        for key in [k for k in self.multiplier_cache if k[0] == guild_id]:
+            del self.multiplier_cache[key]
+
     async def get_role_multiplier(self, member: discord.Member) -> float:
         """الحصول على مضاعف الأدوار للعضو"""
         guild_id = str(member.guild.id)
@@ -535,24 +1242,20 @@ class LevelingSystem:
             await self._load_role_multipliers(guild_id)
 
         multipliers = self.role_multipliers_cache.get(guild_id, {})
+        if not multipliers:
+            return 1.0
 
         # إيجاد أعلى مضاعف
-        max_multiplier = 1.0
-        for role in member.roles:
-            if role.id in multipliers:
-                max_multiplier = max(max_multiplier, multipliers[role.id])
-
-        return max_multiplier
+        role_ids = self._member_role_key(member)
+        return max([1.0] + [multipliers[role_id] for role_id in role_ids if role_id in multipliers])
 
     async def _load_role_multipliers(self, guild_id: str):
         """تحميل مضاعفات الأدوار من DB"""
         try:
-            cursor = await db.conn.execute('''
+            rows = await db.fetchall('''
                 SELECT role_id, multiplier FROM leveling_role_multipliers WHERE guild_id = ?
             ''', (guild_id,))
 
-            rows = await cursor.fetchall()
-
             self.role_multipliers_cache[guild_id] = {
                 int(row[0]): row[1] for row in rows
             }
@@ -564,16 +1267,16 @@ class LevelingSystem:
     async def set_role_multiplier(self, guild_id: str, role_id: int, multiplier: float) -> bool:
         """تعيين مضاعف لدور"""
         try:
-            await db.conn.execute('''
+            await db.execute('''
                 INSERT INTO leveling_role_multipliers (guild_id, role_id, multiplier)
                 VALUES (?, ?, ?)
                 ON CONFLICT(guild_id, role_id) DO UPDATE SET multiplier = excluded.multiplier
             ''', (guild_id, str(role_id), multiplier))
-            await db.conn.commit()
 
             # تحديث Cache
             if guild_id in self.role_multipliers_cache:
                 self.role_multipliers_cache[guild_id][role_id] = multiplier
+            self.invalidate_multipliers(guild_id)
 
             bot_logger.info(f'تم تعيين مضاعف {multiplier}x لدور {role_id} في {guild_id}')
             return True
@@ -585,14 +1288,14 @@ class LevelingSystem:
     async def remove_role_multiplier(self, guild_id: str, role_id: int) -> bool:
         """إزالة مضاعف دور"""
         try:
-            await db.conn.execute('''
+            await db.execute('''
                 DELETE FROM leveling_role_multipliers WHERE guild_id = ? AND role_id = ?
             ''', (guild_id, str(role_id)))
-            await db.conn.commit()
 
             # تحديث Cache
             if guild_id in self.role_multipliers_cache:
                 self.role_multipliers_cache[guild_id].pop(role_id, None)
+            self.invalidate_multipliers(guild_id)
 
             return True
         except Exception as e:
@@ -604,10 +1307,11 @@ class LevelingSystem:
     async def reset_user(self, guild_id: str, user_id: str) -> bool:
         """إعادة تعيين بيانات عضو"""
         try:
-            await db.conn.execute('''
-                DELETE FROM levels WHERE guild_id = ? AND user_id = ?
-            ''', (guild_id, user_id))
-            await db.conn.commit()
+            async with db.for_guild(guild_id) as store:
+                await store.execute('''
+                    DELETE FROM levels WHERE guild_id = ? AND user_id = ?
+                ''', (guild_id, user_id))
+            self.leaderboard_cache.remove(guild_id, user_id)
 
             bot_logger.info(f'تم إعادة تعيين بيانات {user_id} في {guild_id}')
             return True
@@ -618,10 +1322,11 @@ class LevelingSystem:
     async def reset_guild(self, guild_id: str) -> bool:
         """إعادة تعيين بيانات السيرفر بالكامل"""
         try:
-            await db.conn.execute('''
-                DELETE FROM levels WHERE guild_id = ?
-            ''', (guild_id,))
-            await db.conn.commit()
+            async with db.for_guild(guild_id) as store:
+                await store.execute('''
+                    DELETE FROM levels WHERE guild_id = ?
+                ''', (guild_id,))
+            self.leaderboard_cache.invalidate(guild_id)
 
             bot_logger.warning(f'تم إعادة تعيين جميع البيانات في {guild_id}')
             return True
@@ -634,36 +1339,35 @@ class LevelingSystem:
     async def get_guild_stats(self, guild_id: str) -> Dict:
         """إحصائيات السيرفر"""
         try:
-            cursor = await db.conn.execute('''
-                SELECT 
-                    COUNT(*) as total_users,
-                    SUM(xp) as total_xp,
-                    SUM(messages) as total_messages,
-                    AVG(level) as avg_level,
-                    MAX(level) as max_level
-                FROM levels
-                WHERE guild_id = ?
-            ''', (guild_id,))
-
-            row = await cursor.fetchone()
+            async with db.for_guild(guild_id) as store:
+                row = await store.fetchone('''
+                    SELECT 
+                        COUNT(*) as total_users,
+                        SUM(xp) as total_xp,
+                        SUM(messages) as total_messages,
+                        AVG(level) as avg_level,
+                        MAX(level) as max_level
+                    FROM levels
+                    WHERE guild_id = ?
+                ''', (guild_id,))
+
+                if row:
+                    return {
+                        'total_users': row[0] or 0,
+                        'total_xp': row[1] or 0,
+                        'total_messages': row[2] or 0,
+                        'avg_level': round(row[3] or 0, 2),
+                        'max_level': row[4] or 0
+                    }
 
-            if row:
                 return {
-                    'total_users': row[0] or 0,
-                    'total_xp': row[1] or 0,
-                    'total_messages': row[2] or 0,
-                    'avg_level': round(row[3] or 0, 2),
-                    'max_level': row[4] or 0
+                    'total_users': 0,
+                    'total_xp': 0,
+                    'total_messages': 0,
+                    'avg_level': 0,
+                    'max_level': 0
                 }
 
-            return {
-                'total_users': 0,
-                'total_xp': 0,
-                'total_messages': 0,
-                'avg_level': 0,
-                'max_level': 0
-            }
-
         except Exception as e:
             bot_logger.exception(f'خطأ في get_guild_stats: {guild_id}', e)
             return {}
@@ -0,0 +1,312 @@
+"""
+system_log_archive.py - أرشفة جدول السجلات
+============================================
+سياسة احتفاظ لكل سيرفر لجدول logs:
+
+✅ السجلات الأقدم من مدة الاحتفاظ تُنقل لأقسام شهرية (archives/logs-YYYY-MM.db)
+✅ النقل على دفعات: كل دفعة = معاملة قصيرة (INSERT في الأرشيف + DELETE من logs)
+   على اتصال مستقل عن اتصال البوت
+✅ بعدها VACUUM تدريجي (incremental_vacuum) بخطوات صغيرة
+✅ الأقسام تبقى قابلة للاستعلام عبر ATTACH للقراءة فقط (query_archive، الأمر /logs archive)
+
+ملاحظة: الأقسام ملفات SQLite (لتبقى قابلة للـ ATTACH) وليست مضغوطة؛
+تُضغط بـ VACUUM بعد كل أرشفة فلا تحتوي صفحات فارغة.
+"""
+
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+import aiosqlite
+from database import db
+from logger import bot_logger
+
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archives')
+LOG_RETENTION_DAYS = int(os.getenv('LOG_RETENTION_DAYS', '90'))  # 0 = بدون حذف
+ARCHIVE_CHUNK_SIZE = 2000
+VACUUM_STEP_PAGES = 500
+ARCHIVE_BUSY_TIMEOUT = 30  # ثانية انتظار قفل الكتابة على اتصال الأرشفة
+MAINTENANCE_INTERVAL = 24 * 3600
+MAINTENANCE_DELAY = 600  # أول تشغيل بعد 10 دقائق من الإقلاع
+
+LOGS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {schema}.logs (
+        id INTEGER PRIMARY KEY,
+        guild_id TEXT NOT NULL,
+        action_type TEXT NOT NULL,
+        user_id TEXT,
+        moderator_id TEXT,
+        target_id TEXT,
+        reason TEXT,
+        details TEXT,
+        created_at TIMESTAMP
+    )
+'''
+
+ARCHIVE_COLUMNS = 'guild_id, action_type, user_id, moderator_id, target_id, reason, details, created_at'
+
+
+def partition_path(month: str) -> str:
+    """مسار قسم الشهر (YYYY-MM)"""
+    return os.path.join(ARCHIVE_DIR, f'logs-{month}.db')
+
+
+class LogArchiver:
+    """أرشفة السجلات المنتهية + VACUUM تدريجي"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.last_run: Optional[datetime] = None
+        self.last_result: Dict[str, int] = {}
+        self._touched_months: Set[str] = set()  # أقسام تغيّرت في التشغيل الحالي
+
+    # ==================== الأرشفة ====================
+
+    async def _archive_chunk(self, conn: aiosqlite.Connection, guild_id: str, cutoff: str) -> int:
+        """نقل دفعة واحدة من السجلات المنتهية (معاملة واحدة لكل شهر في الدفعة)"""
+        cursor = await conn.execute(
+            'SELECT id, substr(created_at, 1, 7) AS month FROM logs '
+            'WHERE guild_id = ? AND created_at < ? ORDER BY created_at, id LIMIT ?',
+            (guild_id, cutoff, ARCHIVE_CHUNK_SIZE)
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            return 0
+
+        by_month: Dict[str, List[int]] = defaultdict(list)
+        for row in rows:
+            by_month[row['month'] or 'unknown'].append(row['id'])
+
+        for month, ids in by_month.items():
+            self._touched_months.add(month)
+            placeholders = ','.join('?' * len(ids))
+            await conn.execute('ATTACH DATABASE ? AS archive', (partition_path(month),))
+            try:
+                await conn.execute(LOGS_SCHEMA.format(schema='archive'))
+                await conn.execute(
+                    'CREATE INDEX IF NOT EXISTS archive.idx_logs_guild_created ON logs (guild_id, created_at)'
+                )
+                # الأرشيف يأخذ معرفات جديدة: المعرفات تتكرر بين الأقسام وبعد الاستعادة،
+                # وتجاهل التعارض ثم الحذف من logs يفقد الصف
+                await conn.execute(
+                    f'INSERT INTO archive.logs ({ARCHIVE_COLUMNS}) SELECT {ARCHIVE_COLUMNS} '
+                    f'FROM main.logs WHERE id IN ({placeholders})',
+                    ids
+                )
+                await conn.execute(f'DELETE FROM main.logs WHERE id IN ({placeholders})', ids)
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+            finally:
+                await conn.execute('DETACH DATABASE archive')
+
+        return len(rows)
+
+    async def archive_guild(self, guild_id: str, days: int) -> int:
+        """
+        أرشفة سجلات سيرفر الأقدم من days يوم
+
+        النقل على اتصال خاص بالأرشفة (بـ ATTACH خاص به)، فمعاملاته لا تختلط
+        بكتابات البوت على الاتصال المشترك؛ SQLite (WAL) يرتّب الكتابة بين الاتصالين.
+        """
+        if days <= 0:
+            return 0
+        cutoff = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        async with db.for_guild(guild_id) as store:
+            path = store.db_path
+        total = 0
+        async with aiosqlite.connect(path, timeout=ARCHIVE_BUSY_TIMEOUT) as conn:
+            conn.row_factory = aiosqlite.Row
+            while True:
+                moved = await self._archive_chunk(conn, guild_id, cutoff)
+                total += moved
+                if moved < ARCHIVE_CHUNK_SIZE:
+                    return total
+                await asyncio.sleep(0)  # إفساح المجال للكتابات الأخرى بين الدفعات
+
+    async def archive_expired(self) -> Dict[str, int]:
+        """تطبيق سياسات الاحتفاظ على كل السيرفرات"""
+        policies = await db.get_log_retentions()
+        guild_ids = [row['guild_id'] for row in await db.fetchall_guilds('SELECT DISTINCT guild_id FROM logs')]
+
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        result: Dict[str, int] = {}
+        for guild_id in guild_ids:
+            moved = await self.archive_guild(guild_id, policies.get(guild_id, LOG_RETENTION_DAYS))
+            if moved:
+                result[guild_id] = moved
+        return result
+
+    # ==================== VACUUM ====================
+
+    async def incremental_vacuum(self, store=db) -> int:
+        """
+        تحرير الصفحات الفارغة بخطوات صغيرة (في القاعدة أو ملف قسم)
+
+        القواعد القديمة (auto_vacuum != INCREMENTAL) تُتخطى: تحويلها يتطلب VACUUM كامل
+        يحجز القفل طوال إعادة كتابة الملف، فيتم يدوياً عبر convert_auto_vacuum (سطر الأوامر).
+        """
+        async with store._locked('incremental_vacuum'):
+            cursor = await store.conn.execute('PRAGMA auto_vacuum')
+            mode = (await cursor.fetchone())[0]
+        if mode != 2:
+            bot_logger.debug(
+                f'🧹 {store.db_path}: auto_vacuum غير تدريجي — شغّل python system_log_archive.py --convert-vacuum'
+            )
+            return 0
+
+        freed = 0
+        while True:
+            async with store._locked('incremental_vacuum'):
+                cursor = await store.conn.execute('PRAGMA freelist_count')
+                free_pages = (await cursor.fetchone())[0]
+                if not free_pages:
+                    return freed
+                step = min(free_pages, VACUUM_STEP_PAGES)
+                # كل خطوة من PRAGMA تحرر صفحة واحدة، لذا يجب قراءة كل النتائج
+                cursor = await store.conn.execute(f'PRAGMA incremental_vacuum({step})')
+                await cursor.fetchall()
+                await store.conn.commit()
+            freed += step
+            await asyncio.sleep(0)
+
+    async def convert_auto_vacuum(self, store=db) -> bool:
+        """
+        تحويل قاعدة قديمة إلى auto_vacuum=INCREMENTAL (VACUUM كامل لمرة واحدة)
+
+        خطوة يدوية والبوت متوقف؛ الملفات الجديدة تُنشأ تدريجية من البداية.
+        """
+        async with store._locked('convert_auto_vacuum'):
+            cursor = await store.conn.execute('PRAGMA auto_vacuum')
+            if (await cursor.fetchone())[0] == 2:
+                return False
+            await store.conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            await store.conn.execute('VACUUM')
+            return True
+
+    async def vacuum_partitions(self, months: List[str]):
+        """ضغط أقسام الأرشيف التي تغيّرت"""
+        for month in months:
+            path = partition_path(month)
+            if not os.path.exists(path):
+                continue
+            async with aiosqlite.connect(path) as conn:
+                await conn.execute('VACUUM')
+
+    # ==================== الصيانة الدورية ====================
+
+    async def run_maintenance(self) -> Dict[str, int]:
+        """أرشفة + VACUUM تدريجي"""
+        start = datetime.now()
+        self._touched_months = set()
+
+        archived = await self.archive_expired()
+        await self.vacuum_partitions(sorted(self._touched_months))
+        freed = await self.incremental_vacuum()
+        if db.sharded:
+            async for store in db.iter_guild_stores():
+                freed += await self.incremental_vacuum(store)
+
+        self.last_run = datetime.now()
+        self.last_result = {'archived': sum(archived.values()), 'guilds': len(archived), 'freed_pages': freed}
+        bot_logger.performance('logs_maintenance', (self.last_run - start).total_seconds() * 1000)
+        if archived:
+            bot_logger.info(f'🗄️ أرشفة السجلات: {self.last_result}')
+        return self.last_result
+
+    async def _maintenance_loop(self):
+        await asyncio.sleep(MAINTENANCE_DELAY)
+        while True:
+            try:
+                await self.run_maintenance()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                bot_logger.error(f'خطأ في صيانة السجلات: {e}')
+            await asyncio.sleep(MAINTENANCE_INTERVAL)
+
+    def start(self):
+        """بدء الصيانة اليومية"""
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self._maintenance_loop())
+
+    # ==================== الاستعلام ====================
+
+    async def query_archive(
+        self,
+        guild_id: str,
+        since: str,
+        until: str,
+        action_type: Optional[str] = None,
+        limit: int = 100
+    ) -> List[Dict]:
+        """
+        البحث في السجلات المؤرشفة (الأحدث أولاً)
+
+        since/until: YYYY-MM-DD. الأقسام تُفتح عبر ATTACH للقراءة فقط.
+        """
+        months = sorted(
+            (name[5:-3] for name in (os.listdir(ARCHIVE_DIR) if os.path.isdir(ARCHIVE_DIR) else [])
+             if name.startswith('logs-') and name.endswith('.db') and since[:7] <= name[5:-3] <= until[:7]),
+            reverse=True
+        )
+        if not months:
+            return []
+
+        sql = 'SELECT * FROM part.logs WHERE guild_id = ? AND created_at >= ? AND created_at < ?'
+        params: List = [guild_id, since, until]
+        if action_type:
+            sql += ' AND action_type = ?'
+            params.append(action_type)
+        sql += ' ORDER BY created_at DESC LIMIT ?'
+
+        results: List[Dict] = []
+        async with aiosqlite.connect('file::memory:', uri=True) as conn:
+            conn.row_factory = aiosqlite.Row
+            for month in months:
+                uri = 'file:' + os.path.abspath(partition_path(month)) + '?mode=ro'
+                await conn.execute('ATTACH DATABASE ? AS part', (uri,))
+                try:
+                    cursor = await conn.execute(sql, (*params, limit - len(results)))
+                    results.extend(dict(row) for row in await cursor.fetchall())
+                finally:
+                    await conn.execute('DETACH DATABASE part')
+                if len(results) >= limit:
+                    break
+        return results
+
+
+# ==================== النسخة العامة ====================
+
+log_archiver = LogArchiver()
+
+
+# ==================== سطر الأوامر ====================
+
+async def _convert_cli():
+    await db.connect()
+    try:
+        converted = int(await log_archiver.convert_auto_vacuum())
+        if db.sharded:
+            async for store in db.iter_guild_stores():
+                converted += await log_archiver.convert_auto_vacuum(store)
+        print(f'{converted} database file(s) converted to auto_vacuum=INCREMENTAL')
+    finally:
+        await db.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    # python system_log_archive.py --convert-vacuum   (والبوت متوقف)
+    parser = argparse.ArgumentParser(description='صيانة أرشيف السجلات')
+    parser.add_argument('--convert-vacuum', action='store_true', help='تحويل القواعد القديمة إلى auto_vacuum تدريجي')
+    args = parser.parse_args()
+    if args.convert_vacuum:
+        asyncio.run(_convert_cli())
+    else:
+        parser.print_help()
@@ -23,6 +23,7 @@ from database import db
 from config_manager import config
 import helpers
 from logger import bot_logger
+from expiring_map import ExpiringMap
 import re
 
 
@@ -30,17 +31,20 @@ class ProtectionSystem:
     """نظام الحماية الشامل والمتقدم"""
 
     def __init__(self):
-        # Spam tracking: {user_id: [messages]}
-        self.message_cache = defaultdict(list)
+        # Spam tracking: {user_id: [messages]} - ينتهي بعد دقيقة من آخر رسالة
+        self.message_cache = ExpiringMap(ttl=60, max_size=20_000, default_factory=list, name='protection.messages')
 
-        # Duplicate tracking: {user_id: {content_hash: count}}
-        self.duplicate_cache = defaultdict(lambda: defaultdict(int))
+        # Duplicate tracking: {(user_id, content_hash): count} - العد يُصفّر بعد دقيقة بلا تكرار
+        self.duplicate_cache = ExpiringMap(ttl=60, max_size=50_000, default_factory=int, name='protection.duplicates')
 
         # Raid tracking: {guild_id: [join_times]}
         self.raid_tracker = defaultdict(list)
 
-        # Violation tracking: {user_id: violation_count}
-        self.violations = defaultdict(int)
+        # Violation tracking: {user_id: violation_count} - تُنسى بعد ساعة بلا مخالفات
+        self.violations = ExpiringMap(ttl=3600, max_size=20_000, default_factory=int, name='protection.violations')
+
+        # Blacklist cache: {guild_id: [words]}
+        self.blacklist_cache: dict = {}
 
     # ==================== Main Check ====================
 
@@ -103,17 +107,16 @@ class ProtectionSystem:
         """فحص السبام"""
         user_id = message.author.id
 
-        # إضافة الرسالة للكاش
-        self.message_cache[user_id].append(message)
-
-        # تنظيف الرسائل القديمة
-        now = datetime.now()
+        # تنظيف الرسائل القديمة + إضافة الرسالة
+        now = discord.utils.utcnow()
         timewindow = protection_config.antispam_timewindow
 
-        self.message_cache[user_id] = [
-            msg for msg in self.message_cache[user_id]
+        recent = [
+            msg for msg in self.message_cache.get(user_id, [])
             if (now - msg.created_at).total_seconds() < timewindow
         ]
+        recent.append(message)
+        self.message_cache.set(user_id, recent, ttl=max(timewindow, 1))
 
         # التحقق
         threshold = protection_config.antispam_threshold
@@ -156,7 +159,10 @@ class ProtectionSystem:
     async def _check_blacklist(self, message: discord.Message) -> bool:
         """فحص الكلمات المحظورة"""
         guild_id = str(message.guild.id)
-        blacklist = await db.get_blacklist_words(guild_id)
+        blacklist = self.blacklist_cache.get(guild_id)
+        if blacklist is None:
+            blacklist = await db.get_blacklist_words(guild_id)
+            self.blacklist_cache[guild_id] = blacklist
 
         if not blacklist:
             return False
@@ -176,6 +182,13 @@ class ProtectionSystem:
 
         return False
 
+    def invalidate_blacklist(self, guild_id: str = None):
+        """مسح كاش الكلمات المحظورة"""
+        if guild_id:
+            self.blacklist_cache.pop(guild_id, None)
+        else:
+            self.blacklist_cache.clear()
+
     # ==================== Caps Detection ====================
 
     def _check_caps(self, text: str, threshold: float = 0.7) -> bool:
@@ -209,14 +222,12 @@ class ProtectionSystem:
         user_id = message.author.id
         content_hash = helpers.generate_hash(message.content[:100])
 
-        # زيادة العداد
-        self.duplicate_cache[user_id][content_hash] += 1
-
-        # تنظيف بعد دقيقة
-        # (في تطبيق حقيقي: استخدم task scheduler)
+        # زيادة العداد (ينتهي تلقائياً بعد دقيقة من آخر تكرار)
+        key = (user_id, content_hash)
+        self.duplicate_cache[key] += 1
 
         # إذا أرسل نفس الرسالة 3 مرات
-        if self.duplicate_cache[user_id][content_hash] >= 3:
+        if self.duplicate_cache[key] >= 3:
             return True
 
         return False
@@ -328,19 +339,9 @@ class ProtectionSystem:
 
     async def cleanup(self):
         """تنظيف دوري للكاش"""
-        # تنظيف message_cache
-        now = datetime.now()
-        for user_id in list(self.message_cache.keys()):
-            self.message_cache[user_id] = [
-                msg for msg in self.message_cache[user_id]
-                if (now - msg.created_at).total_seconds() < 60
-            ]
-
-            if not self.message_cache[user_id]:
-                del self.message_cache[user_id]
-
-        # تنظيف duplicate_cache
-        self.duplicate_cache.clear()
+        # message_cache و duplicate_cache تنتهي تلقائياً
+        self.message_cache.sweep()
+        self.duplicate_cache.sweep()
 
         # تنظيف violations (بعد 10 دقائق)
         for user_id in list(self.violations.keys()):
@@ -454,7 +455,7 @@ class TicketSystem:
         """إغلاق تكت"""
         try:
             # التحقق من أنها قناة تكت
-            ticket = await db.get_ticket(str(channel.id))
+            ticket = await db.get_ticket(str(channel.id), str(channel.guild.id))
             if not ticket:
                 return False
 
@@ -463,7 +464,7 @@ class TicketSystem:
                 return False
 
             # تحديث DB
-            await db.close_ticket(str(channel.id), str(closer.id))
+            await db.close_ticket(str(channel.id), str(closer.id), str(channel.guild.id))
 
             # رسالة الإغلاق
             embed = embeds.ticket_closed_embed(closer)
@@ -11,6 +11,7 @@ import aiohttp
 import json
 import io
 import os
+from bisect import bisect_left
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Tuple
 from collections import defaultdict
@@ -47,6 +48,19 @@ except Exception:
     bot_logger.setLevel(logging.INFO)
 
 
+# ==================== SLA ====================
+
+# حدود الـ histogram بالثواني (5د، 15د، 30د، 1س، 4س، 24س) — آخر bucket = أكثر من 24 ساعة
+SLA_BUCKETS = (300, 900, 1800, 3600, 14400, 86400)
+SLA_DURATION_METRICS = ('first_response', 'claim', 'close')
+SLA_TREND_POINTS = 14  # أقصى عدد نقاط في اتجاه /ticketstats (الأيام تُجمع في فترات)
+
+
+def sla_bucket(seconds: float) -> int:
+    """رقم الـ bucket لمدة معينة"""
+    return bisect_left(SLA_BUCKETS, seconds)
+
+
 # ==================== Data Classes ====================
 
 class TicketCategory:
@@ -111,6 +125,12 @@ class TicketCategory:
 
 class TicketData:
     """بيانات التكت"""
+
+    __slots__ = (
+        'ticket_id', 'channel_id', 'guild_id', 'creator_id', 'category_id', 'created_at',
+        'claimed_by', 'priority', 'tags', 'notes', 'rating', 'status', 'last_activity',
+        'first_response_at'
+    )
     
     def __init__(
         self,
@@ -140,6 +160,7 @@ class TicketData:
         self.rating = rating
         self.status = status
         self.last_activity = datetime.now()
+        self.first_response_at: Optional[datetime] = None
     
     def add_note(self, author_id: str, content: str):
         """إضافة ملاحظة داخلية"""
@@ -264,12 +285,11 @@ class TicketSystemUltimate:
                 # original code used direct SQL -> keep compatibility if save_category expects json string
                 try:
                     data_json = json.dumps(category.to_dict())
-                    await db.conn.execute('''
+                    await db.execute('''
                         INSERT INTO ticket_categories (guild_id, category_id, data)
                         VALUES (?, ?, ?)
                         ON CONFLICT(guild_id, category_id) DO UPDATE SET data = excluded.data
                     ''', (guild_id, category.category_id, data_json))
-                    await db.conn.commit()
                 except Exception as e:
                     bot_logger.error(f'خطأ في حفظ الفئة: {e}')
             
@@ -294,12 +314,11 @@ class TicketSystemUltimate:
         """حفظ الفئة في DB (احتياطي)"""
         try:
             data_json = json.dumps(category.to_dict())
-            await db.conn.execute('''
+            await db.execute('''
                 INSERT INTO ticket_categories (guild_id, category_id, data)
                 VALUES (?, ?, ?)
                 ON CONFLICT(guild_id, category_id) DO UPDATE SET data = excluded.data
             ''', (guild_id, category.category_id, data_json))
-            await db.conn.commit()
         except Exception as e:
             bot_logger.error(f'خطأ في حفظ الفئة: {e}')
     
@@ -309,12 +328,10 @@ class TicketSystemUltimate:
             if not db.conn:
                 bot_logger.debug('DB connection not ready in load_categories')
                 return
-            cursor = await db.conn.execute('''
+            rows = await db.fetchall('''
                 SELECT category_id, data FROM ticket_categories WHERE guild_id = ?
             ''', (guild_id,))
             
-            rows = await cursor.fetchall()
-            
             if guild_id not in self.categories:
                 self.categories[guild_id] = {}
             
@@ -330,6 +347,62 @@ class TicketSystemUltimate:
         except Exception as e:
             bot_logger.error(f'خطأ في تحميل الفئات: {e}')
     
+    def restore_categories(self, rows: List[Dict]):
+        """تحميل فئات كل السيرفرات من صفوف DB (تحميل مجمّع عند التشغيل)"""
+        for row in rows:
+            try:
+                category = TicketCategory.from_dict(json.loads(row['data']))
+                self.categories.setdefault(row['guild_id'], {})[row['category_id']] = category
+            except Exception:
+                bot_logger.debug(f'تجاهل فئة تالفة: {row.get("category_id")}')
+
+    @staticmethod
+    def _parse_time(value) -> Optional[datetime]:
+        try:
+            return datetime.fromisoformat(value) if value else None
+        except (TypeError, ValueError):
+            return None
+
+    def restore_tickets(
+        self,
+        rows: List[Dict],
+        activity: Optional[Dict[int, Dict]] = None,
+        notes: Optional[Dict[int, List[Dict]]] = None
+    ):
+        """
+        استعادة التكتات المفتوحة من DB بعد إعادة التشغيل
+
+        التكتات الموجودة في الذاكرة (إعادة اتصال) لا تُستبدل. أول رد وآخر نشاط
+        يُستنتجان من ticket_events (activity من db.get_ticket_activity)،
+        والملاحظات من db.get_ticket_notes.
+        """
+        activity = activity or {}
+        notes = notes or {}
+        for row in rows:
+            if row['channel_id'] in self.tickets:
+                continue
+            created_at = self._parse_time(row.get('created_at'))
+            events = activity.get(row['ticket_id'], {})
+            ticket = TicketData(
+                ticket_id=row['ticket_id'],
+                channel_id=row['channel_id'],
+                guild_id=row['guild_id'],
+                creator_id=row['creator_id'],
+                category_id=row['category_id'],
+                created_at=created_at,
+                claimed_by=row.get('claimed_by'),
+                priority=row.get('priority') or 'normal',
+                notes=notes.get(row['ticket_id']),
+                rating=row.get('rating'),
+                status=row.get('status') or 'open'
+            )
+            ticket.first_response_at = self._parse_time(events.get('first_response_at'))
+            ticket.last_activity = (
+                self._parse_time(events.get('last_event_at')) or created_at or ticket.last_activity
+            )
+            self.tickets[ticket.channel_id] = ticket
+            self.next_ticket_id = max(self.next_ticket_id, ticket.ticket_id + 1)
+
     async def remove_category(self, guild_id: str, category_id: str) -> bool:
         """حذف فئة"""
         try:
@@ -337,10 +410,9 @@ class TicketSystemUltimate:
                 del self.categories[guild_id][category_id]
             
             if db.conn:
-                await db.conn.execute('''
+                await db.execute('''
                     DELETE FROM ticket_categories WHERE guild_id = ? AND category_id = ?
                 ''', (guild_id, category_id))
-                await db.conn.commit()
             
             return True
         except Exception as e:
@@ -412,11 +484,10 @@ class TicketSystemUltimate:
             # حفظ في DB panel info (اختياري)
             try:
                 if db.conn:
-                    await db.conn.execute('''
+                    await db.execute('''
                         INSERT OR REPLACE INTO ticket_panels (message_id, guild_id, channel_id, data)
                         VALUES (?, ?, ?, ?)
                     ''', (str(message.id), guild_id, str(channel.id), json.dumps(self.panels[str(message.id)])))
-                    await db.conn.commit()
             except Exception:
                 pass
             
@@ -538,7 +609,7 @@ class TicketSystemUltimate:
             except Exception:
                 # fallback direct SQL (compat)
                 try:
-                    await db.conn.execute('''
+                    await db.execute('''
                         INSERT INTO tickets_v2 
                         (ticket_id, channel_id, guild_id, creator_id, category_id, reason, custom_answers, created_at, status)
                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -547,7 +618,6 @@ class TicketSystemUltimate:
                         ticket_data.category_id, reason, json.dumps(custom_field_answers or {}),
                         ticket_data.created_at.isoformat(), ticket_data.status
                     ))
-                    await db.conn.commit()
                 except Exception as e:
                     bot_logger.error(f'خطأ في حفظ التكت: {e}')
             
@@ -567,6 +637,8 @@ class TicketSystemUltimate:
             # تحديث الإحصائيات
             self.stats[guild_id]['total_tickets'] += 1
             self.stats[guild_id]['open_tickets'] += 1
+            await self._record_event(ticket_data, 'open', user_id)
+            await self._record_sla(ticket_data, 'opened', 0, 0)
             
             bot_logger.info(f'✅ تم إنشاء تكت #{ticket_id:04d} بواسطة {user.name}')
             return True, f"✅ تم إنشاء تكتك: {channel.mention}", channel
@@ -589,7 +661,7 @@ class TicketSystemUltimate:
     async def _save_ticket_to_db(self, ticket: TicketData, reason: str = None, custom_answers: Dict = None):
         """حفظ التكت في DB (قد لا يُستخدم إذا استخدمنا save_ticket_v2)"""
         try:
-            await db.conn.execute('''
+            await db.execute('''
                 INSERT INTO tickets_v2 
                 (ticket_id, channel_id, guild_id, creator_id, category_id, reason, custom_answers, created_at, status)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -598,7 +670,6 @@ class TicketSystemUltimate:
                 ticket.category_id, reason, json.dumps(custom_answers or {}),
                 ticket.created_at.isoformat(), ticket.status
             ))
-            await db.conn.commit()
         except Exception as e:
             bot_logger.error(f'خطأ في حفظ التكت: {e}')
     
@@ -673,7 +744,66 @@ class TicketSystemUltimate:
             'urgent': '🔴'
         }
         return emojis.get(priority, '⚪')
-    
+
+    async def _record_event(self, ticket: TicketData, event_type: str, actor_id: str = None, value=None):
+        """تسجيل حدث في ticket_events (إضافة فقط)"""
+        try:
+            await db.add_ticket_event(
+                ticket.ticket_id,
+                event_type,
+                actor_id=actor_id,
+                value=value,
+                channel_id=ticket.channel_id,
+                guild_id=ticket.guild_id
+            )
+        except Exception as e:
+            bot_logger.error(f'خطأ في تسجيل حدث التكت ({event_type}): {e}')
+
+    async def _record_sla(self, ticket: TicketData, metric: str, value: float, bucket: int = None, staff_id: str = None):
+        """تحديث مجاميع SLA لحدث تكت"""
+        if bucket is None:
+            bucket = sla_bucket(value)
+        try:
+            await db.record_ticket_sla(
+                ticket.guild_id, metric, value, bucket,
+                category_id=ticket.category_id, staff_id=staff_id
+            )
+        except Exception as e:
+            bot_logger.error(f'خطأ في تحديث SLA ({metric}): {e}')
+
+    def _seconds_since_open(self, ticket: TicketData) -> float:
+        """الثواني منذ فتح التكت"""
+        return max(0.0, (datetime.now() - ticket.created_at).total_seconds())
+
+    async def handle_message(self, message: discord.Message):
+        """
+        تتبع النشاط وأول رد من الطاقم في قنوات التكتات
+
+        تكلفة الرسائل خارج التكتات: بحث dict واحد فقط.
+        """
+        ticket = self.tickets.get(str(message.channel.id))
+        if not ticket:
+            return
+
+        ticket.last_activity = datetime.now()
+
+        if ticket.first_response_at or message.author.bot or str(message.author.id) == ticket.creator_id:
+            return
+        if not self._is_staff(message.author, ticket):
+            return
+
+        ticket.first_response_at = ticket.last_activity
+        staff_id = str(message.author.id)
+        await self._record_event(ticket, 'first_response', staff_id)
+        await self._record_sla(ticket, 'first_response', self._seconds_since_open(ticket), staff_id=staff_id)
+
+    def _find_ticket_by_id(self, ticket_id: int) -> Optional[TicketData]:
+        """البحث عن تكت في الذاكرة بالرقم"""
+        for ticket in self.tickets.values():
+            if ticket.ticket_id == ticket_id:
+                return ticket
+        return None
+
     # ==================== Ticket Management ====================
     
     async def close_ticket(
@@ -730,13 +860,17 @@ class TicketSystemUltimate:
             ticket.status = "closed"
             try:
                 if db.conn:
-                    await db.conn.execute('''
+                    await db.execute('''
                         UPDATE tickets_v2 SET status = ?, closed_at = ?, closed_by = ?, close_reason = ?
                         WHERE channel_id = ?
                     ''', ('closed', datetime.now().isoformat(), str(closer.id), reason, channel_id))
-                    await db.conn.commit()
             except Exception:
                 pass
+            await self._record_event(ticket, 'close', str(closer.id), reason)
+            await self._record_sla(
+                ticket, 'close', self._seconds_since_open(ticket),
+                staff_id=ticket.claimed_by or (str(closer.id) if self._is_staff(closer, ticket) else None)
+            )
             
             # الانتظار ثم الحذف
             await asyncio.sleep(5)
@@ -782,7 +916,10 @@ class TicketSystemUltimate:
         # صاحب التكت
         if str(user.id) == ticket.creator_id:
             return True
-        
+        return self._is_staff(user, ticket)
+
+    def _is_staff(self, user: discord.Member, ticket: TicketData) -> bool:
+        """مشرف أو صاحب دور دعم في فئة التكت"""
         # مشرف (helpers.is_mod) — إذا يوجد
         try:
             if helpers and helpers.is_mod(user):
@@ -796,13 +933,8 @@ class TicketSystemUltimate:
         try:
             if guild_id in self.categories and ticket.category_id in self.categories[guild_id]:
                 category = self.categories[guild_id][ticket.category_id]
-                for role_id in category.support_roles:
-                    # use guild lookup via user.guild if available
-                    guild_obj = getattr(user, 'guild', None)
-                    if guild_obj:
-                        role = guild_obj.get_role(int(role_id))
-                        if role and role in user.roles:
-                            return True
+                user_roles = {str(role.id) for role in getattr(user, 'roles', ())}
+                return any(role_id in user_roles for role_id in category.support_roles)
         except Exception:
             pass
         
@@ -821,8 +953,12 @@ class TicketSystemUltimate:
             async for msg in channel.history(limit=None, oldest_first=True):
                 messages.append(msg)
             
+            # الخط الزمني والملاحظات الداخلية من ticket_events
+            timeline = await db.get_ticket_timeline(ticket.ticket_id)
+            notes = await db.get_ticket_notes(ticket.ticket_id)
+            
             # إنشاء HTML
-            html = await self._generate_html_transcript(channel, ticket, messages)
+            html = await self._generate_html_transcript(channel, ticket, messages, timeline, notes)
             
             # حفظ في ملف
             os.makedirs('transcripts', exist_ok=True)
@@ -835,11 +971,10 @@ class TicketSystemUltimate:
                 # حفظ مرجع في DB
                 if db.conn:
                     try:
-                        await db.conn.execute('''
+                        await db.execute('''
                             INSERT INTO ticket_transcripts (ticket_id, file_path)
                             VALUES (?, ?)
                         ''', (ticket.ticket_id, filepath))
-                        await db.conn.commit()
                     except Exception:
                         pass
                 bot_logger.info(f'✅ تم حفظ transcript: {filepath}')
@@ -852,7 +987,14 @@ class TicketSystemUltimate:
             bot_logger.error(f'خطأ في حفظ transcript: {e}')
             return None
     
-    async def _generate_html_transcript(self, channel: discord.TextChannel, ticket: TicketData, messages: List[discord.Message]) -> str:
+    async def _generate_html_transcript(
+        self,
+        channel: discord.TextChannel,
+        ticket: TicketData,
+        messages: List[discord.Message],
+        timeline: List[Dict] = None,
+        notes: List[Dict] = None
+    ) -> str:
         """توليد HTML للـ transcript"""
         html = f"""
 <!DOCTYPE html>
@@ -908,6 +1050,12 @@ class TicketSystemUltimate:
         .text {{
             margin-top: 5px;
         }}
+        .section {{
+            background: #202225;
+            padding: 10px 20px;
+            border-radius: 8px;
+            margin-top: 20px;
+        }}
     </style>
 </head>
 <body>
@@ -945,6 +1093,41 @@ class TicketSystemUltimate:
         
         html += """
         </div>
+"""
+        
+        def escape(value) -> str:
+            return str(value if value is not None else '').replace('<', '&lt;').replace('>', '&gt;')
+        
+        events = [ev for ev in (timeline or []) if ev.get('event_type') != 'note']
+        if events:
+            html += """
+        <div class="section">
+            <h2>🕒 الخط الزمني</h2>
+"""
+            for ev in events:
+                actor = f' — &lt;@{escape(ev["actor_id"])}&gt;' if ev.get('actor_id') else ''
+                value = f': {escape(ev["value"])}' if ev.get('value') else ''
+                html += f"""
+            <p><span class="timestamp">{escape(ev.get('created_at'))}</span> {escape(ev['event_type'])}{actor}{value}</p>
+"""
+            html += """
+        </div>
+"""
+        
+        if notes:
+            html += """
+        <div class="section">
+            <h2>📝 الملاحظات الداخلية</h2>
+"""
+            for note in notes:
+                html += f"""
+            <p><span class="timestamp">{escape(note.get('timestamp'))}</span> &lt;@{escape(note.get('author_id'))}&gt;: {escape(note.get('content'))}</p>
+"""
+            html += """
+        </div>
+"""
+        
+        html += """
     </div>
 </body>
 </html>
@@ -971,19 +1154,52 @@ class TicketSystemUltimate:
         except Exception as e:
             bot_logger.error(f'خطأ في طلب التقييم: {e}')
     
-    async def rate_ticket(self, ticket_id: int, rating: int, user_id: str):
-        """تسجيل تقييم"""
+    async def rate_ticket(self, ticket_id: int, rating: int, user_id: str) -> Tuple[bool, str]:
+        """
+        تسجيل تقييم (لصاحب التكت فقط)
+
+        إعادة التقييم تحدّث tickets_v2.rating فقط؛ عيّنة SLA تُسجَّل مع أول تقييم،
+        فتبقى مجاميع التقييم متطابقة مع الجدول.
+
+        Returns:
+            (نجح؟, رسالة)
+        """
         try:
-            # حفظ في DB
-            if db.conn:
-                await db.conn.execute('''
-                    UPDATE tickets_v2 SET rating = ? WHERE ticket_id = ?
-                ''', (rating, ticket_id))
-                await db.conn.commit()
-            
+            ticket = self._find_ticket_by_id(ticket_id)
+            row = await db.get_ticket_by_id_v2(ticket_id)
+            creator_id = ticket.creator_id if ticket else (row.get('creator_id') if row else None)
+            if creator_id != user_id:
+                return False, "❌ التقييم لصاحب التكت فقط"
+
+            # أول تقييم فقط يمر بشرط rating IS NULL
+            cursor = await db.execute(
+                'UPDATE tickets_v2 SET rating = ? WHERE ticket_id = ? AND rating IS NULL', (rating, ticket_id)
+            )
+            first = cursor.rowcount > 0
+            if not first:
+                await db.execute('UPDATE tickets_v2 SET rating = ? WHERE ticket_id = ?', (rating, ticket_id))
+
+            if ticket:
+                await self._record_event(ticket, 'rating', user_id, rating)
+                if first:
+                    await self._record_sla(ticket, 'rating', rating, rating, staff_id=ticket.claimed_by)
+            else:
+                await db.add_ticket_event(
+                    ticket_id, 'rating', actor_id=user_id, value=rating,
+                    channel_id=row.get('channel_id') if row else None,
+                    guild_id=row.get('guild_id') if row else None
+                )
+                if row and first:
+                    await db.record_ticket_sla(
+                        row['guild_id'], 'rating', rating, rating,
+                        category_id=row.get('category_id'), staff_id=row.get('claimed_by')
+                    )
+
             bot_logger.info(f'✅ تم تقييم تكت #{ticket_id:04d}: {rating}/5')
+            return True, "✅ تم تسجيل التقييم"
         except Exception as e:
             bot_logger.error(f'خطأ في تسجيل التقييم: {e}')
+            return False, "❌ تعذر تسجيل التقييم"
     
     # ==================== Advanced Features ====================
     
@@ -1005,12 +1221,13 @@ class TicketSystemUltimate:
             # حفظ في DB (اختياري)
             try:
                 if db.conn:
-                    await db.conn.execute('''
+                    await db.execute('''
                         UPDATE tickets_v2 SET claimed_by = ? WHERE channel_id = ?
                     ''', (str(claimer.id), channel_id))
-                    await db.conn.commit()
             except Exception:
                 pass
+            await self._record_event(ticket, 'claim', str(claimer.id))
+            await self._record_sla(ticket, 'claim', self._seconds_since_open(ticket), staff_id=str(claimer.id))
             
             embed = discord.Embed(
                 title='✅ تم أخذ التكت',
@@ -1061,12 +1278,12 @@ class TicketSystemUltimate:
             # حفظ في DB
             try:
                 if db.conn:
-                    await db.conn.execute('''
+                    await db.execute('''
                         UPDATE tickets_v2 SET priority = ? WHERE channel_id = ?
                     ''', (priority, channel_id))
-                    await db.conn.commit()
             except Exception:
                 pass
+            await self._record_event(ticket, 'priority', value={'from': old_priority, 'to': priority})
             
             return True, "✅ تم تغيير الأولوية"
         
@@ -1085,23 +1302,8 @@ class TicketSystemUltimate:
             ticket = self.tickets[channel_id]
             ticket.add_note(str(author.id), note)
             
-            # محاولة حفظ الملاحظة في DB (append JSON)
-            try:
-                if db.conn:
-                    # جلب الملاحظات القديمة
-                    cursor = await db.conn.execute('SELECT notes FROM tickets_v2 WHERE channel_id = ?', (channel_id,))
-                    row = await cursor.fetchone()
-                    existing = []
-                    if row and row[0]:
-                        try:
-                            existing = json.loads(row[0])
-                        except Exception:
-                            existing = []
-                    existing.append({'author_id': str(author.id), 'content': note, 'timestamp': datetime.now().isoformat()})
-                    await db.conn.execute('UPDATE tickets_v2 SET notes = ? WHERE channel_id = ?', (json.dumps(existing), channel_id))
-                    await db.conn.commit()
-            except Exception:
-                pass
+            # حفظ الملاحظة كحدث مستقل في ticket_events (append-only بدل read-modify-write)
+            await self._record_event(ticket, 'note', str(author.id), note)
             
             embed = discord.Embed(
                 title='📝 ملاحظة داخلية',
@@ -1123,32 +1325,108 @@ class TicketSystemUltimate:
     
     # ==================== Statistics ====================
     
-    async def get_statistics(self, guild_id: str) -> Dict:
-        """الحصول على إحصائيات التكتات"""
+    async def get_statistics(self, guild_id: str, staff_id: str = None) -> Dict:
+        """
+        الحصول على إحصائيات التكتات
+
+        الأعداد من tickets_v2 (تشمل التكتات السابقة لمجاميع SLA)؛
+        مجاميع SLA تُستخدم لمقاييس الزمن فقط (get_sla_dashboard).
+        staff_id: التكتات التي استلمها أو أغلقها عضو الطاقم فقط
+        """
         try:
-            if not db.conn:
-                return {'total': 0, 'open': 0, 'closed': 0, 'avg_rating': 0}
-            cursor = await db.conn.execute('''
-                SELECT 
-                    COUNT(*) as total,
-                    SUM(CASE WHEN status = 'open' THEN 1 ELSE 0 END) as open,
-                    SUM(CASE WHEN status = 'closed' THEN 1 ELSE 0 END) as closed,
-                    AVG(rating) as avg_rating
-                FROM tickets_v2
-                WHERE guild_id = ?
-            ''', (guild_id,))
-            
-            row = await cursor.fetchone()
-            
-            return {
-                'total': row[0] or 0,
-                'open': row[1] or 0,
-                'closed': row[2] or 0,
-                'avg_rating': round(row[3] or 0, 2)
-            }
+            return await self._count_tickets(guild_id, staff_id)
         except Exception as e:
             bot_logger.error(f'خطأ في get_statistics: {e}')
             return {'total': 0, 'open': 0, 'closed': 0, 'avg_rating': 0}
+
+    async def _count_tickets(self, guild_id: str, staff_id: str = None) -> Dict:
+        """استعلام مباشر على tickets_v2 (المصدر المعتمد للأعداد)"""
+        sql = '''
+            SELECT 
+                COUNT(*) as total,
+                SUM(CASE WHEN status = 'open' THEN 1 ELSE 0 END) as open,
+                SUM(CASE WHEN status = 'closed' THEN 1 ELSE 0 END) as closed,
+                AVG(rating) as avg_rating
+            FROM tickets_v2
+            WHERE guild_id = ?
+        '''
+        params: Tuple = (guild_id,)
+        if staff_id:
+            sql += ' AND (claimed_by = ? OR closed_by = ?)'
+            params += (staff_id, staff_id)
+        row = await db.fetchone(sql, params)
+
+        return {
+            'total': row['total'] or 0,
+            'open': row['open'] or 0,
+            'closed': row['closed'] or 0,
+            'avg_rating': round(row['avg_rating'] or 0, 2)
+        }
+
+    async def get_sla_dashboard(self, guild_id: str, category_id: str = None, staff_id: str = None, days: int = 30) -> Dict:
+        """
+        لوحة SLA: أول رد، الاستلام، الإغلاق، توزيع التقييمات + التجميعات اليومية
+
+        Returns:
+            {'summary': get_statistics, 'metrics': {...}, 'ratings': {1..5: count},
+             'top_staff': [...], 'trend': [{'date', 'days', 'opened', 'first_response'}]}
+
+        الاتجاه يغطي آخر days يوم في SLA_TREND_POINTS فترة على الأكثر، وهو على مستوى
+        السيرفر دائماً (التجميعات اليومية بلا تقسيم حسب الطاقم).
+        """
+        if staff_id:
+            sla = await db.get_ticket_sla(guild_id, 'staff', staff_id)
+        elif category_id:
+            sla = await db.get_ticket_sla(guild_id, 'category', category_id)
+        else:
+            sla = await db.get_ticket_sla(guild_id)
+
+        metrics = {}
+        for metric in SLA_DURATION_METRICS:
+            data = sla.get(metric, {'count': 0, 'avg': 0.0, 'histogram': {}})
+            metrics[metric] = {
+                'count': data['count'],
+                'avg_seconds': data['avg'],
+                'histogram': [data['histogram'].get(i, 0) for i in range(len(SLA_BUCKETS) + 1)]
+            }
+
+        rating = sla.get('rating', {'histogram': {}, 'avg': 0.0, 'count': 0})
+
+        return {
+            'summary': await self.get_statistics(guild_id, staff_id),
+            'metrics': metrics,
+            'ratings': {i: rating['histogram'].get(i, 0) for i in range(1, 6)},
+            'avg_rating': round(rating['avg'], 2),
+            'top_staff': await db.get_ticket_sla_staff(guild_id, 'first_response'),
+            'trend': self._sla_trend(await db.get_ticket_sla_daily(guild_id, days), days)
+        }
+
+    @staticmethod
+    def _sla_trend(rows: List[Dict], days: int) -> List[Dict]:
+        """تجميع الصفوف اليومية في فترات متساوية (متوسط أول رد موزون بالعدد)"""
+        step = -(-days // SLA_TREND_POINTS)
+        start = datetime.now().date() - timedelta(days=days - 1)
+        buckets: Dict[int, Dict] = {}
+        for row in rows:
+            index = (datetime.strptime(row['date'], '%Y-%m-%d').date() - start).days // step
+            if index < 0:
+                continue
+            bucket = buckets.setdefault(index, {'opened': 0, 'count': 0, 'total': 0.0})
+            if row['metric'] == 'opened':
+                bucket['opened'] += row['count']
+            elif row['metric'] == 'first_response':
+                bucket['count'] += row['count']
+                bucket['total'] += row['total']
+
+        return [
+            {
+                'date': (start + timedelta(days=index * step)).strftime('%Y-%m-%d'),
+                'days': step,
+                'opened': bucket['opened'],
+                'first_response': bucket['total'] / bucket['count'] if bucket['count'] else None
+            }
+            for index, bucket in sorted(buckets.items())
+        ]
     
     # ==================== Auto Tasks ====================
     
@@ -1336,7 +1614,13 @@ class RatingView(discord.ui.View):
     
     def _create_callback(self, rating: int):
         async def callback(interaction: discord.Interaction):
-            await self.system.rate_ticket(self.ticket_id, rating, str(interaction.user.id))
+            success, message = await self.system.rate_ticket(self.ticket_id, rating, str(interaction.user.id))
+            if not success:
+                await interaction.response.send_message(
+                    embed=discord.Embed(description=message, color=discord.Color.red()),
+                    ephemeral=True
+                )
+                return
             
             embed = discord.Embed(
                 title='✅ شكراً لتقييمك!',
@@ -0,0 +1,248 @@
+"""
+system_voice_activity.py - نشاط القنوات الصوتية
+================================================
+سلاسل زمنية لكل قناة صوتية بدقة الدقيقة (Ring buffer على array)
+تُجمّع كل ساعة في SQLite: الذروة، دقائق الإشغال، الانضمامات/المغادرات،
+وتوزيع (histogram) عدد المتواجدين.
+
+كل قناة تكلف ~360 بايت في الذاكرة (3 × 60 × uint16).
+"""
+
+import asyncio
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import discord
+from database import db
+from logger import bot_logger
+
+
+# حدود فئات الـ histogram: 0 | 1 | 2 | 3-4 | 5-9 | 10-24 | 25+
+CONCURRENCY_BUCKETS = (1, 2, 3, 5, 10, 25)
+HISTOGRAM_SIZE = len(CONCURRENCY_BUCKETS) + 1
+
+
+def _minute_now() -> int:
+    """الدقيقة الحالية منذ epoch"""
+    return int(time.time() // 60)
+
+
+class ChannelSeries:
+    """سلسلة الساعة الحالية لقناة واحدة (دقيقة لكل خانة)"""
+
+    __slots__ = ('hour', 'start', 'last', 'occupancy', 'peaks', 'joins', 'leaves')
+
+    def __init__(self, minute: int, occupancy: int = 0):
+        self.occupancy = occupancy
+        self._reset(minute)
+
+    def _reset(self, minute: int):
+        self.hour = minute // 60
+        self.start = minute % 60  # أول دقيقة مُسجلة في هذه الساعة
+        self.last = self.start
+        self.peaks = array('H', [0]) * 60
+        self.joins = array('H', [0]) * 60
+        self.leaves = array('H', [0]) * 60
+        self.peaks[self.start] = min(self.occupancy, 0xFFFF)
+
+    def advance(self, minute: int) -> Optional[Dict]:
+        """
+        تقديم السلسلة حتى الدقيقة المعطاة
+
+        Returns:
+            ملخص الساعة المنتهية إن انتقلنا لساعة جديدة، وإلا None
+        """
+        if minute // 60 != self.hour:
+            finished = self.summary(end=60)
+            self._reset(minute)
+            return finished
+
+        index = minute % 60
+        # الدقائق بدون أحداث تحمل عدد المتواجدين الحالي
+        for i in range(self.last + 1, index + 1):
+            self.peaks[i] = min(self.occupancy, 0xFFFF)
+        self.last = max(self.last, index)
+        return None
+
+    def record_join(self, minute: int):
+        self.occupancy += 1
+        index = minute % 60
+        self.joins[index] += 1
+        self.peaks[index] = max(self.peaks[index], min(self.occupancy, 0xFFFF))
+
+    def record_leave(self, minute: int):
+        self.occupancy = max(0, self.occupancy - 1)
+        self.leaves[minute % 60] += 1
+
+    def summary(self, end: int) -> Dict:
+        """ملخص الدقائق [start, end) من الساعة الحالية"""
+        # الدقائق الباقية حتى end تحمل آخر عدد متواجدين
+        for i in range(self.last + 1, end):
+            self.peaks[i] = min(self.occupancy, 0xFFFF)
+
+        histogram = [0] * HISTOGRAM_SIZE
+        for i in range(self.start, end):
+            histogram[bisect_right(CONCURRENCY_BUCKETS, self.peaks[i])] += 1
+
+        window = self.peaks[self.start:end]
+        return {
+            'hour': self.hour,
+            'peak': max(window, default=0),
+            'occupant_minutes': sum(window),
+            'active_minutes': sum(1 for p in window if p),
+            'joins': sum(self.joins[self.start:end]),
+            'leaves': sum(self.leaves[self.start:end]),
+            'histogram': histogram
+        }
+
+    def is_idle(self) -> bool:
+        return self.occupancy == 0 and not any(self.joins) and not any(self.leaves)
+
+
+class VoiceActivityTracker:
+    """تتبع نشاط كل القنوات الصوتية وتجميعه كل ساعة"""
+
+    def __init__(self):
+        self.series: Dict[Tuple[str, str], ChannelSeries] = {}  # {(guild_id, channel_id): series}
+        self.rollup_task: Optional[asyncio.Task] = None
+
+    def _get(self, guild_id: str, channel_id: str, minute: int) -> ChannelSeries:
+        key = (guild_id, channel_id)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = ChannelSeries(minute)
+        return series
+
+    def handle_voice_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+        """تسجيل الانضمام/المغادرة/الانتقال"""
+        if member.bot or before.channel == after.channel:
+            return
+
+        guild_id = str(member.guild.id)
+        minute = _minute_now()
+        pending = []
+
+        if before.channel is not None:
+            series = self._get(guild_id, str(before.channel.id), minute)
+            finished = series.advance(minute)
+            if finished:
+                pending.append((guild_id, str(before.channel.id), finished))
+            series.record_leave(minute)
+
+        if after.channel is not None:
+            series = self._get(guild_id, str(after.channel.id), minute)
+            finished = series.advance(minute)
+            if finished:
+                pending.append((guild_id, str(after.channel.id), finished))
+            series.record_join(minute)
+
+        if pending:
+            asyncio.create_task(self._write(pending))
+
+    def rebuild(self, bot: discord.Client):
+        """ضبط عدد المتواجدين من القنوات الحالية (بعد التشغيل أو إعادة الاتصال)"""
+        minute = _minute_now()
+        for guild in bot.guilds:
+            guild_id = str(guild.id)
+            for channel in list(guild.voice_channels) + list(guild.stage_channels):
+                humans = sum(1 for m in channel.members if not m.bot)
+                key = (guild_id, str(channel.id))
+                if humans or key in self.series:
+                    series = self._get(guild_id, str(channel.id), minute)
+                    series.advance(minute)
+                    series.occupancy = humans
+                    series.peaks[minute % 60] = max(series.peaks[minute % 60], humans)
+
+    def start(self, bot: discord.Client):
+        """بدء التجميع الساعي"""
+        self.rebuild(bot)
+        if not self.rollup_task or self.rollup_task.done():
+            self.rollup_task = asyncio.create_task(self._rollup_loop())
+
+    async def _rollup_loop(self):
+        """كل ساعة: كتابة الساعة المنتهية لكل القنوات في SQLite"""
+        while True:
+            try:
+                # بعد بداية الساعة التالية بقليل
+                await asyncio.sleep(3600 - time.time() % 3600 + 5)
+                await self.rollup()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                bot_logger.error(f'خطأ في _rollup_loop: {e}')
+
+    async def rollup(self, partial: bool = False):
+        """
+        تجميع الساعات المنتهية (أو الساعة الحالية جزئياً عند الإيقاف)
+
+        القنوات الخاملة تُحذف من الذاكرة بعد كتابتها.
+        """
+        minute = _minute_now()
+        pending = []
+        for key, series in list(self.series.items()):
+            finished = series.advance(minute)
+            if finished and (finished['active_minutes'] or finished['joins'] or finished['leaves']):
+                pending.append((*key, finished))
+
+            if partial:
+                summary = series.summary(end=minute % 60 + 1)
+                if summary['active_minutes'] or summary['joins'] or summary['leaves']:
+                    pending.append((*key, summary))
+            elif series.is_idle():
+                del self.series[key]
+
+        await self._write(pending)
+
+    async def _write(self, pending: List[Tuple[str, str, Dict]]):
+        if not pending:
+            return
+        try:
+            rows = []
+            for guild_id, channel_id, s in pending:
+                hour = datetime.fromtimestamp(s['hour'] * 3600).strftime('%Y-%m-%d %H:00')
+                rows.append((
+                    guild_id, channel_id, hour, s['peak'], s['occupant_minutes'],
+                    s['active_minutes'], s['joins'], s['leaves'], *s['histogram']
+                ))
+            await db.add_voice_hourly(rows)
+        except Exception as e:
+            bot_logger.error(f'خطأ في حفظ نشاط الصوت: {e}')
+
+    # ==================== Queries ====================
+
+    async def get_peak_hours(self, guild_id: str, days: int = 7) -> List[Dict]:
+        """متوسط المتواجدين لكل ساعة من اليوم (0-23)"""
+        rows = await db.get_voice_hourly(guild_id, days)
+        totals = [0] * 24
+        for row in rows:
+            totals[int(row['hour'][11:13])] += row['occupant_minutes']
+        return [{'hour': h, 'avg_occupants': totals[h] / (60 * days)} for h in range(24)]
+
+    async def get_channel_utilisation(self, guild_id: str, days: int = 7) -> List[Dict]:
+        """نسبة إشغال كل قناة وذروتها خلال الفترة (الأعلى أولاً)"""
+        rows = await db.get_voice_hourly(guild_id, days)
+        channels: Dict[str, Dict] = {}
+        for row in rows:
+            data = channels.setdefault(row['channel_id'], {
+                'channel_id': row['channel_id'], 'active_minutes': 0, 'occupant_minutes': 0,
+                'peak': 0, 'joins': 0, 'histogram': [0] * HISTOGRAM_SIZE
+            })
+            data['active_minutes'] += row['active_minutes']
+            data['occupant_minutes'] += row['occupant_minutes']
+            data['peak'] = max(data['peak'], row['peak'])
+            data['joins'] += row['joins']
+            for i in range(HISTOGRAM_SIZE):
+                data['histogram'][i] += row[f'h{i}']
+
+        period_minutes = days * 24 * 60
+        for data in channels.values():
+            data['utilisation'] = data['active_minutes'] / period_minutes
+        return sorted(channels.values(), key=lambda d: d['active_minutes'], reverse=True)
+
+
+# ==================== النسخة العامة ====================
+
+voice_activity = VoiceActivityTracker()
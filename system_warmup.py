@@ -0,0 +1,147 @@
+"""
+system_warmup.py - تهيئة الكاش عند التشغيل
+============================================
+تحميل مجمّع للإعدادات والردود والكلمات المحظورة والمضاعفات والتكتات المفتوحة والاختصارات
+باستعلام واحد لكل جدول، مع تخزين الدعوات لكل السيرفرات بالتوازي (بحد أقصى)
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict
+
+import discord
+from database import db
+from config_manager import config
+from system_autoresponse import autoresponse_system
+from system_protection import protection_system
+from system_leveling import leveling_system
+from system_tickets import ticket_system
+from system_invites import invite_tracker
+from cmd_aliases import alias_processor
+from system_census import member_census
+from logger import bot_logger
+
+
+# أقصى عدد لطلبات guild.invites() المتزامنة (تجنب rate limit)
+INVITE_CONCURRENCY = 5
+
+
+async def _timed(name: str, coro, timings: Dict[str, float]):
+    """تشغيل مرحلة وقياس زمنها (الفشل لا يوقف باقي المراحل)"""
+    start = time.perf_counter()
+    try:
+        await coro
+    except Exception as e:
+        bot_logger.error(f'فشل مرحلة التهيئة {name}: {e}')
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+        bot_logger.performance(f'warmup:{name}', timings[name])
+
+
+async def _load_settings(guild_ids):
+    rows = await db.fetch_records('settings', 'SELECT * FROM settings')
+    for row in rows:
+        if row['guild_id'] in guild_ids:
+            config.cache[row['guild_id']] = row
+
+
+async def _load_autoresponses(guild_ids):
+    rows = await db.fetch_records_guilds('autoresponses', 'SELECT * FROM autoresponses ORDER BY id ASC')
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row['guild_id']].append(row)
+    # السيرفرات بدون ردود تُخزن كقائمة فارغة حتى لا تُستعلم لاحقاً
+    for guild_id in guild_ids:
+        autoresponse_system.responses_cache[guild_id] = grouped.get(guild_id, [])
+
+
+async def _load_blacklist(guild_ids):
+    rows = await db.fetchall('SELECT * FROM blacklist_words WHERE enabled = 1')
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row['guild_id']].append(row)
+    for guild_id in guild_ids:
+        protection_system.blacklist_cache[guild_id] = grouped.get(guild_id, [])
+
+
+async def _load_role_multipliers(guild_ids):
+    rows = await db.fetchall('SELECT guild_id, role_id, multiplier FROM leveling_role_multipliers')
+    grouped = defaultdict(dict)
+    for row in rows:
+        grouped[row['guild_id']][int(row['role_id'])] = row['multiplier']
+    for guild_id in guild_ids:
+        leveling_system.role_multipliers_cache[guild_id] = grouped.get(guild_id, {})
+
+
+async def _load_tickets(guild_ids):
+    categories = await db.fetchall('SELECT guild_id, category_id, data FROM ticket_categories')
+    ticket_system.restore_categories([r for r in categories if r['guild_id'] in guild_ids])
+
+    tickets = await db.fetch_records('tickets_v2', "SELECT * FROM tickets_v2 WHERE status = 'open'")
+    # إعادة الاتصال: التكتات المحملة تحتفظ بحالتها في الذاكرة
+    tickets = [r for r in tickets if r.guild_id in guild_ids and r.channel_id not in ticket_system.tickets]
+    activity = await db.get_ticket_activity([r.ticket_id for r in tickets])
+    notes = {r.ticket_id: await db.get_ticket_notes(r.ticket_id) for r in tickets}
+    ticket_system.restore_tickets(tickets, activity, notes)
+
+    # الترقيم يكمل من آخر تكت (مفتوح أو مغلق)
+    row = await db.fetchone('SELECT MAX(ticket_id) AS max_id FROM tickets_v2')
+    if row and row['max_id']:
+        ticket_system.next_ticket_id = max(ticket_system.next_ticket_id, row['max_id'] + 1)
+
+
+async def _load_aliases(guild_ids):
+    rows = await db.fetchall('SELECT guild_id, alias, command FROM custom_aliases')
+    grouped = defaultdict(dict)
+    for row in rows:
+        grouped[row['guild_id']][row['alias']] = row['command']
+    for guild_id in guild_ids:
+        alias_processor.set_custom_aliases(guild_id, grouped.get(guild_id, {}))
+
+
+async def _cache_all_invites(guilds):
+    semaphore = asyncio.Semaphore(INVITE_CONCURRENCY)
+
+    async def cache_one(guild: discord.Guild):
+        async with semaphore:
+            try:
+                await invite_tracker.cache_invites(guild)
+                bot_logger.debug(f'✅ تم تخزين دعوات {guild.name}')
+            except Exception as e:
+                bot_logger.warning(f'⚠️ فشل تخزين دعوات {guild.name}: {e}')
+
+    await asyncio.gather(*(cache_one(g) for g in guilds))
+
+
+async def _load_database(guild_ids, timings: Dict[str, float]):
+    """مراحل DB تتشارك اتصالاً واحداً، لذا تُنفذ بالتتابع"""
+    await _timed('settings', _load_settings(guild_ids), timings)
+    await _timed('autoresponses', _load_autoresponses(guild_ids), timings)
+    await _timed('blacklist', _load_blacklist(guild_ids), timings)
+    await _timed('role_multipliers', _load_role_multipliers(guild_ids), timings)
+    await _timed('tickets', _load_tickets(guild_ids), timings)
+    await _timed('aliases', _load_aliases(guild_ids), timings)
+
+
+async def warm_up(bot) -> Dict[str, float]:
+    """
+    تهيئة كل الكاشات عند التشغيل
+
+    مراحل DB (اتصال واحد) تعمل بالتوازي مع تخزين الدعوات (طلبات شبكة).
+
+    Returns:
+        Dict: {اسم المرحلة: الزمن بالملي ثانية}
+    """
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    guild_ids = {str(g.id) for g in bot.guilds}
+
+    await asyncio.gather(
+        _load_database(guild_ids, timings),
+        _timed('invites', _cache_all_invites(list(bot.guilds)), timings),
+        _timed('census', member_census.build_all(list(bot.guilds)), timings)
+    )
+
+    timings['total'] = (time.perf_counter() - start) * 1000
+    return timings